@@ -3,8 +3,19 @@
 LocalNetScan - ローカルネットワークスキャンFlaskアプリケーション
 """
 
-from flask import Flask, render_template, jsonify, request
-from scanner import NetworkScanner
+from flask import Flask, render_template, jsonify, request, Response
+from scanner import (NetworkScanner, AsyncPortScanner, CompiledTargets, NmapHelperError, SCAN_ENGINES, PORT_SCAN_ENGINES,
+                     DEFAULT_MAX_NMAP_PROCESSES, DEFAULT_PORT_SCAN_WORKERS, MAX_PORT_SCAN_WORKERS, PORT_SCAN_UNIT_SIZE,
+                     DEFAULT_PORT_SWEEP_WORKERS, PORT_SWEEP_UNIT_SIZE, SERVICE_ENGINES,
+                     PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_NORMAL,
+                     ServiceDetectionQueue, count_unit_ports, format_port_spec, order_ports, plan_port_units,
+                     select_priority_ports)
+from collections import deque
+from storage import ResultStore
+from events import EventBroker
+from jobs import JobManager, DEFAULT_MAX_RUNNING_JOBS
+import ipaddress
+import os
 import threading
 import time
 from datetime import datetime
@@ -13,29 +24,173 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'localnetscan-secret-key-change-in-production'
 
 # グローバル変数
-scanner = NetworkScanner()
-scan_status = {
-    'is_scanning': False,
-    'last_scan_time': None,
-    'scan_progress': 0,
-    'current_subnet': ''
-}
-scan_results = {}
-port_scan_results = {}
+# nmapプロセスの同時実行数の上限（環境変数 LOCALNETSCAN_MAX_NMAP_PROCESSES で変更可能）
+scanner = NetworkScanner(
+    max_nmap_processes=int(os.environ.get('LOCALNETSCAN_MAX_NMAP_PROCESSES', DEFAULT_MAX_NMAP_PROCESSES))
+)
+# スキャン結果の保存先（環境変数 LOCALNETSCAN_DB で変更可能）
+result_store = ResultStore(
+    os.environ.get('LOCALNETSCAN_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'localnetscan.db'))
+)
+# 前回のプロセスが全ポートスキャン中に終了していた場合、進行中のまま表示されないようにする
+result_store.mark_interrupted_scans('アプリケーションの再起動により中断されました')
+# スキャンスレッドからブラウザ（/api/events）へのイベント配信
+event_broker = EventBroker()
+# 最後に完了したネットワークスキャンの時刻
+last_scan_time = result_store.get_meta('last_scan_time')
+# ポートスイープの進捗（ジョブの status）を更新するときのロック
+port_sweep_lock = threading.Lock()
+
+
+def get_scan_status_snapshot():
+    """
+    ネットワークスキャンの状態にnmapの状態を加えたもの（/api/scan-status と scan_status イベント用）
+
+    実行中のネットワークスキャンのうち最後に投入したもの（なければ最後に終了したもの）の進捗を返す。
+    スキャンごとの進捗は GET /api/jobs で取得できる。
+    """
+    jobs = job_manager.list_jobs(kind='scan')
+    active = [job for job in jobs if job.is_active()]
+    latest = active[-1] if active else (jobs[-1] if jobs else None)
+    status = {'scan_progress': 0, 'current_subnet': ''}
+    if latest is not None:
+        status.update(latest.status)
+        status['job_id'] = latest.id
+    status['is_scanning'] = bool(active)
+    status['active_scans'] = len(active)
+    status['last_scan_time'] = last_scan_time
+    # ジョブの実行状況（同時実行数の上限・実行中・待機中）
+    status['jobs'] = job_manager.stats()
+    status['nmap_available'] = scanner.check_nmap_available()
+    status['nmap_version'] = scanner.nmap_runner.version
+    # nmapプロセスの実行状況（上限・実行中・待機中）
+    status['nmap_processes'] = scanner.nmap_budget.stats()
+    if not scanner.check_nmap_available():
+        status['nmap_error'] = scanner.nmap_error
+    return status
+
+
+def publish_scan_status():
+    """現在のスキャンステータスを scan_status イベントとして配信"""
+    event_broker.publish('scan_status', get_scan_status_snapshot())
+
+
+def publish_job(job):
+    """ジョブの状態の変化（待機・開始・終了）を job イベントとして配信し、スキャン・スイープの状態も配信し直す"""
+    event_broker.publish('job', job.snapshot())
+    if job.kind == 'scan':
+        publish_scan_status()
+    elif job.kind == 'port_sweep':
+        publish_port_sweep_status(job)
+
+
+# スキャン・ポートスキャン・ポートスイープのジョブ（同時実行数は環境変数 LOCALNETSCAN_MAX_JOBS で変更可能）
+job_manager = JobManager(
+    max_running=int(os.environ.get('LOCALNETSCAN_MAX_JOBS', DEFAULT_MAX_RUNNING_JOBS)),
+    on_change=publish_job
+)
+
+
+def record_host(ip, info):
+    """検出したホストを保存し、host_found イベントを配信"""
+    result_store.upsert_host(ip, info)
+    event_broker.publish('host_found', {'ip': ip, 'info': info})
+
+
+def save_port_scan(host, result):
+    """ポートスキャン結果（進捗を含む）を保存し、port_scan イベントを配信"""
+    result_store.save_port_scan(host, result)
+    event_broker.publish('port_scan', result)
+
+
+def count_up_hosts(hosts):
+    """応答があったホスト数（近隣テーブルにあるだけの 'stale' ホストは数えない）"""
+    return sum(1 for info in hosts.values() if info.get('state') == 'up')
+
+
+def get_history_ports(host):
+    """
+    スキャン履歴から先に調べるポートを取得
+
+    Returns:
+        Tuple: (このホストで過去に開いていたポート, スキャン履歴全体で開いていることの多い順のポート)
+    """
+    return result_store.get_port_history(host), result_store.rank_open_ports()
+
+
+def parse_probe_options(body):
+    """
+    asyncエンジンのプローブ設定（probe_ports, probe_timeout）をリクエストボディから取り出す
+
+    Args:
+        body: リクエストボディ（辞書）
+
+    Returns:
+        tuple: (プローブ先ポートのリスト または None, タイムアウト秒数 または None)
+
+    Raises:
+        ValueError: 指定が不正な場合
+    """
+    ports = body.get('probe_ports')
+    if ports is not None:
+        if isinstance(ports, str):
+            ports = [p for p in ports.replace(' ', '').split(',') if p]
+        if not isinstance(ports, list) or not ports:
+            raise ValueError('probe_ports はポート番号のリストまたはカンマ区切り文字列で指定してください')
+        try:
+            ports = [int(p) for p in ports]
+        except (TypeError, ValueError):
+            raise ValueError('probe_ports に数値でない値が含まれています')
+        if any(p < 1 or p > 65535 for p in ports):
+            raise ValueError('probe_ports は 1〜65535 の範囲で指定してください')
+
+    timeout = body.get('probe_timeout')
+    if timeout is not None:
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not 0 < timeout <= 30:
+            raise ValueError('probe_timeout は 0より大きく30以下の秒数で指定してください')
+        timeout = float(timeout)
+
+    return ports, timeout
+
+
+def format_scan_progress(engine, current, total):
+    """
+    エンジンごとの進捗単位で進捗表示を作る
+
+    nmap はチャンク数、async はプローブ済みホスト数、nmap-stream は千分率で進捗を報告する。
+    """
+    if engine == 'nmap-stream':
+        return f'{current / total * 100:.1f}%'
+    if engine == 'async':
+        return f'ホスト {current}/{total}'
+    return f'チャンク {current}/{total}'
 
 
-def background_scan(target_range=None):
-    """バックグラウンドでスキャンを実行
+def background_scan(job, target_range=None, engine='nmap', exclude=None, probe_ports=None, probe_timeout=None):
+    """ネットワークスキャンのジョブを実行
 
     Args:
+        job: ジョブ（進捗は job.status に書き込む。キャンセル時は検出済みのホストを残して終了する）
         target_range: スキャン対象（例: "192.168.0.0/24"、"192.168.0.1-50"、または "192.168.0.0/24,172.17.0.0/16"）
+        engine: ホスト検出エンジン（'nmap'、'nmap-stream'、'async'）
+        exclude: 除外する範囲（例: "192.168.0.10,192.168.0.200-210"）
+        probe_ports: asyncエンジンのプローブ先ポートのリスト
+        probe_timeout: asyncエンジンの1接続あたりのタイムアウト秒数
+
+    Returns:
+        Dict: 検出したホスト（キー: IPアドレス）
     """
-    global scan_status, scan_results
+    global last_scan_time
 
-    scan_status['is_scanning'] = True
+    scan_status = job.status
+    cancel_token = job.cancel_token
+    scan_status['cancelled'] = False
     scan_status['scan_progress'] = 0
     scan_status['current_subnet'] = 'スキャン準備中...'
     scan_status['found_hosts'] = 0
+    publish_scan_status()
+    # この時刻より前から検出されていないホストは、スキャン完了時に結果から外す
+    scan_started_at = time.time()
 
     try:
         print("\n" + "="*60)
@@ -46,64 +201,348 @@ def background_scan(target_range=None):
             print(f"\nスキャン対象: {target_range}")
             scan_status['scan_progress'] = 10  # スキャン開始
 
-            # チャンクレベルの進捗を反映するコールバック
-            def progress_callback(completed_chunks, total_chunks, found_hosts):
+            # エンジンの進捗を反映するコールバック
+            def progress_callback(current, total, found_hosts):
                 # 進捗を10%から90%の範囲で更新
-                chunk_progress = 10 + int((completed_chunks / total_chunks) * 80)
-                scan_status['scan_progress'] = chunk_progress
+                scan_status['scan_progress'] = 10 + int((current / total) * 80)
                 scan_status['found_hosts'] = found_hosts
-                scan_status['current_subnet'] = f'{target_range} をスキャン中... (チャンク {completed_chunks}/{total_chunks})'
-
-            results = scanner.scan_ip_range(target_range, progress_callback=progress_callback)
-            scan_status['found_hosts'] = len(results)
+                scan_status['current_subnet'] = f'{target_range} をスキャン中... ({format_scan_progress(engine, current, total)})'
+                publish_scan_status()
+
+            results = scanner.scan_ip_range(target_range, progress_callback=progress_callback, engine=engine, exclude=exclude,
+                                            host_callback=record_host, probe_ports=probe_ports,
+                                            probe_timeout=probe_timeout, cancel_token=cancel_token)
+            scan_status['found_hosts'] = count_up_hosts(results)
+            targets = CompiledTargets(target_range, exclude)
         else:
             # サブネットを検出（デフォルト動作）
             print("\n[ステップ 1/2] サブネットを検出中...")
             scan_status['scan_progress'] = 5
+            # 前回のスキャン後にネットワークが変わっている場合に備え、インターフェース情報を読み直す
+            scanner.invalidate_interface_cache()
             subnets = scanner.detect_subnets()
             total_subnets = len(subnets)
             print(f"✓ {total_subnets}個のサブネットを検出しました: {', '.join(subnets)}")
 
-            # 各サブネットをスキャン
-            print(f"\n[ステップ 2/2] 各サブネットをスキャン中...")
+            # 全サブネットを1つの作業キューにまとめて同時にスキャン
+            print(f"\n[ステップ 2/2] 全サブネットをスキャン中...")
             scan_status['scan_progress'] = 10
-            results = {}
-            for idx, subnet in enumerate(subnets):
-                scan_status['current_subnet'] = f'{subnet} をスキャン中... ({idx+1}/{total_subnets})'
-
-                # チャンクレベルの進捗を反映するコールバック
-                def progress_callback(completed_chunks, total_chunks, found_hosts):
-                    # サブネット間の進捗: 10% + (idx/total_subnets) * 80%
-                    # サブネット内の進捗: (completed_chunks/total_chunks) * (80/total_subnets)%
-                    subnet_base_progress = 10 + int((idx / total_subnets) * 80)
-                    subnet_progress_range = int(80 / total_subnets)
-                    chunk_progress = int((completed_chunks / total_chunks) * subnet_progress_range)
-                    scan_status['scan_progress'] = subnet_base_progress + chunk_progress
-                    scan_status['found_hosts'] = len(results) + found_hosts
-                    scan_status['current_subnet'] = f'{subnet} をスキャン中... ({idx+1}/{total_subnets}) - チャンク {completed_chunks}/{total_chunks}'
-
-                print(f"\n進捗: {idx+1}/{total_subnets} サブネット")
-                subnet_results = scanner.ping_scan(subnet, progress_callback=progress_callback)
-                results.update(subnet_results)
-                scan_status['found_hosts'] = len(results)
-
-        scan_results = results
-        scan_status['last_scan_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            scan_status['current_subnet'] = f'{", ".join(subnets)} をスキャン中...'
+            publish_scan_status()
+
+            # エンジンの進捗を反映するコールバック（全サブネットで1つの進捗）
+            def progress_callback(current, total, found_hosts):
+                # 進捗を10%から90%の範囲で更新
+                scan_status['scan_progress'] = 10 + int((current / total) * 80)
+                scan_status['found_hosts'] = found_hosts
+                scan_status['current_subnet'] = f'{total_subnets}個のサブネットをスキャン中... ({format_scan_progress(engine, current, total)})'
+                publish_scan_status()
+
+            results = scanner.ping_scan_many(subnets, progress_callback=progress_callback, engine=engine, exclude=exclude,
+                                             host_callback=record_host, probe_ports=probe_ports,
+                                             probe_timeout=probe_timeout, cancel_token=cancel_token)
+            scan_status['found_hosts'] = count_up_hosts(results)
+            targets = CompiledTargets(subnets, exclude)
+
+        if cancel_token.is_cancelled():
+            # 検出済みのホストは逐次保存済み。全範囲を調べていないため、見つからなかったホストは削除しない
+            scan_status['cancelled'] = True
+            scan_status['current_subnet'] = f'キャンセルしました ({scan_status["found_hosts"]}台のホストを検出)'
+            print(f"\nスキャンをキャンセルしました（検出済み: {scan_status['found_hosts']}台）\n")
+            return results
+
+        # 検出したホストはスキャン中に逐次保存済み。今回のスキャン範囲で見つからなかったホストを削除する
+        # （範囲外のホストは並行して実行中の他のスキャンの結果かもしれないため残す）
+        result_store.prune_hosts(scan_started_at, within=lambda ip: targets.label_for(ip) is not None)
+        last_scan_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        result_store.set_meta('last_scan_time', last_scan_time)
         scan_status['scan_progress'] = 100
-        scan_status['current_subnet'] = f'完了 ({len(results)}台のホストを検出)'
+        scan_status['current_subnet'] = f'完了 ({scan_status["found_hosts"]}台のホストを検出)'
 
         print("\n" + "="*60)
         print(f"全スキャン完了!")
-        print(f"検出されたホスト総数: {len(results)}台")
+        print(f"検出されたホスト総数: {scan_status['found_hosts']}台")
+        stale_count = len(results) - scan_status['found_hosts']
+        if stale_count:
+            print(f"応答なし（近隣テーブルのみ）: {stale_count}台")
         print("="*60 + "\n")
+        return results
 
     except Exception as e:
+        # ジョブは 'error' で終了し、終了時の scan_status イベントでブラウザに通知される
         print(f"\n✗ スキャンエラー: {e}\n")
         scan_status['error'] = str(e)
         scan_status['scan_progress'] = 0
+        raise
+
+
+def get_port_sweep_snapshot(job=None):
+    """
+    ポートスイープの状態のコピー（GET /api/port-sweep と port_sweep イベント用）
+
+    Args:
+        job: ポートスイープのジョブ（省略時は実行中のうち最後に投入したもの、なければ最後に終了したもの）
+    """
+    if job is None:
+        jobs = job_manager.list_jobs(kind='port_sweep')
+        active = [job for job in jobs if job.is_active()]
+        job = active[-1] if active else (jobs[-1] if jobs else None)
+    if job is None:
+        return {'is_running': False, 'hosts': {}}
+    with port_sweep_lock:
+        snapshot = dict(job.status)
+        snapshot['hosts'] = {host: dict(info) for host, info in job.status['hosts'].items()}
+    snapshot['is_running'] = job.is_active()
+    snapshot['job_id'] = job.id
+    return snapshot
+
+
+def publish_port_sweep_status(job=None):
+    """ポートスイープの状態を port_sweep イベントとして配信"""
+    event_broker.publish('port_sweep', get_port_sweep_snapshot(job))
+
+
+def plan_sweep_units(hosts):
+    """
+    ポートスイープのホストごとの作業単位を決定
+
+    過去に開いていたポート・履歴上よく開いているポートの作業単位を先頭にする。
+
+    Returns:
+        Dict: キー: IPアドレス、値: plan_port_units の作業単位のリスト
+    """
+    ranked_ports = result_store.rank_open_ports()
+    return {
+        host: plan_port_units(result_store.get_port_history(host) + ranked_ports, unit_size=PORT_SWEEP_UNIT_SIZE)
+        for host in hosts
+    }
+
 
+def background_port_sweep(job, hosts, port_engine='nmap', workers=DEFAULT_PORT_SWEEP_WORKERS, detect_services=True,
+                          service_engine='banner', units_per_host=None):
+    """
+    複数ホストの全ポートスキャンを1つのワーカープールで実行（ポートスイープ）
+
+    (ホスト × ポート範囲) の作業単位をホスト間でラウンドロビンに並べて共有キューに積み、
+    workers 個のワーカーが空いた順に取り出す。見つかったポートはホストを問わず
+    1つのサービス情報取得キューに流す。各ホストの結果は完了した時点で保存する。
+    キャンセルされた場合は残りの作業単位を取りやめ、完了していないホストは途中までの結果を
+    scan_stage 'cancelled' として保存する。
+
+    Args:
+        job: ジョブ（進捗は job.status に書き込む）
+        hosts: スキャン対象のIPアドレスのリスト
+        port_engine: ポート検出のエンジン（PORT_SCAN_ENGINES のいずれか）
+        workers: ワーカー数
+        detect_services: サービス情報取得も行う場合True
+        service_engine: サービス情報取得のエンジン（SERVICE_ENGINES のいずれか）
+        units_per_host: ホストごとの作業単位（plan_sweep_units の結果、省略時はここで決定）
+
+    Returns:
+        Dict: ホストごとの検出ポート数（キー: IPアドレス）
+    """
+    port_sweep_status = job.status
+    cancel_token = job.cancel_token
+    if units_per_host is None:
+        units_per_host = plan_sweep_units(hosts)
+    # ホストごとの進捗（port_scan と同じ形式で保存する）・検出ポート・残り作業数
+    host_states = {}
+    open_ports = {}
+    service_ports = {}
+    remaining = {}
+    for host in hosts:
+        host_states[host] = {
+            'host': host,
+            'ports': [],
+            'os': '',
+            'scan_time': '',
+            'scan_stage': 'full_scanning',
+            'progress': {
+                'total_ports': 65535,
+                'scanned_ports': 0,
+                'found_ports': 0,
+                'service_scanned': 0,
+                'overall_progress': 0,
+                'workers': workers
+            }
+        }
+        open_ports[host] = {}
+        service_ports[host] = {}
+        # ポート範囲の作業単位数 + サービス情報取得待ちのポート数
+        remaining[host] = len(units_per_host[host])
+        save_port_scan(host, host_states[host])
+
+    # 全ホストの第1作業単位、全ホストの第2作業単位…の順に並べる（ホスト間で公平に進む）
+    work_units = deque(
+        (host, units_per_host[host][index])
+        for index in range(max(len(units) for units in units_per_host.values()))
+        for host in hosts if index < len(units_per_host[host])
+    )
+    with port_sweep_lock:
+        port_sweep_status['units_total'] = len(work_units)
+    started_at = time.time()
+    # ホストごとの結果の保存を順番に行うためのロック（保存は port_sweep_lock を解放してから行う）
+    save_locks = {host: threading.Lock() for host in hosts}
+
+    def update_host_progress(host):
+        """ホストと全体の進捗を更新（port_sweep_lock を保持して呼ぶこと）"""
+        progress = host_states[host]['progress']
+        stage1 = progress['scanned_ports'] / progress['total_ports']
+        if detect_services and progress['found_ports']:
+            stage2 = progress['service_scanned'] / progress['found_ports']
+        else:
+            stage2 = 1.0
+        progress['overall_progress'] = round(stage1 * 50 + stage1 * stage2 * 50, 1)
+        port_sweep_status['hosts'][host].update(
+            scanned_ports=progress['scanned_ports'],
+            found_ports=progress['found_ports'],
+            service_scanned=progress['service_scanned'],
+            overall_progress=progress['overall_progress']
+        )
+        port_sweep_status['overall_progress'] = round(
+            sum(info['overall_progress'] for info in port_sweep_status['hosts'].values()) / len(hosts), 1
+        )
+
+    def finish_unit(host, count=1):
+        """作業が終わったホストの結果を保存（全作業が終わっていれば 'full' として確定）"""
+        with save_locks[host]:
+            # 集計は port_sweep_lock の中で行い、その時点の内容を他のワーカーを止めずに保存する
+            with port_sweep_lock:
+                remaining[host] -= count
+                update_host_progress(host)
+                finished = remaining[host] == 0
+                state = host_states[host]
+                if finished:
+                    ports = [service_ports[host].get(port, info) for port, info in open_ports[host].items()]
+                    ports.sort(key=lambda p: p['port'])
+                    result = {'host': host, 'ports': ports, 'os': state['os'], 'scan_time': '', 'scan_stage': 'full'}
+                    port_sweep_status['hosts'][host]['state'] = 'done'
+                    port_sweep_status['hosts_done'] += 1
+                else:
+                    result = dict(state, progress=dict(state['progress']))
+            save_port_scan(host, result)
+        if finished:
+            print(f"  [スイープ] {host} 完了: {len(result['ports'])}ポート")
+        publish_port_sweep_status(job)
+
+    def detect_service_batch(batch):
+        """まとめて取り出した (ホスト, ポート) のサービス情報をホストごとに取得"""
+        by_host = {}
+        for host, port in batch:
+            by_host.setdefault(host, []).append(port)
+        for host, port_list in by_host.items():
+            try:
+                result = scanner.detect_services(host, port_list, service_engine, cancel_token=cancel_token)
+                with port_sweep_lock:
+                    for port_info in result.get('ports', []):
+                        service_ports[host][port_info['port']] = port_info
+                    if result.get('os') and not host_states[host]['os']:
+                        host_states[host]['os'] = result['os']
+            except Exception as e:
+                print(f"  [スイープ] {host} サービス情報取得エラー: {e}")
+            finally:
+                with port_sweep_lock:
+                    host_states[host]['progress']['service_scanned'] += len(port_list)
+                finish_unit(host, len(port_list))
+
+    service_queue = ServiceDetectionQueue(detect_service_batch) if detect_services else None
+
+    def add_open_ports(host, ports):
+        """検出したポートを記録し、サービス情報取得キューに積む"""
+        with port_sweep_lock:
+            new_ports = [p for p in ports if p['port'] not in open_ports[host]]
+            for port_info in new_ports:
+                open_ports[host][port_info['port']] = port_info
+            host_states[host]['progress']['found_ports'] = len(open_ports[host])
+            port_sweep_status['found_ports'] += len(new_ports)
+            if service_queue:
+                # サービス情報取得が終わるまでホストを完了扱いにしない
+                remaining[host] += len(new_ports)
+        if new_ports:
+            event_broker.publish('port_found', {'host': host, 'ports': new_ports})
+        if service_queue:
+            for port_info in new_ports:
+                service_queue.put((host, port_info['port']))
+
+    def scan_unit(host, intervals):
+        """1作業単位（ホスト × ポート範囲）のポートを検出"""
+        port_spec = format_port_spec(intervals)
+        try:
+            if port_engine == 'async':
+                result = AsyncPortScanner().scan(
+                    host, ports=[port for low, high in intervals for port in range(low, high + 1)],
+                    cancel_token=cancel_token
+                )
+            else:
+                range_args = f"-p {port_spec} -sT -T4 --open --host-timeout 30s"
+                result = scanner.port_scan(host, range_args, priority_only=False, is_range_scan=True, verbose=False,
+                                           cancel_token=cancel_token)
+            if result.get('ports'):
+                add_open_ports(host, result['ports'])
+        except Exception as e:
+            print(f"  [スイープ] {host} {port_spec} エラー: {e}")
+        finally:
+            with port_sweep_lock:
+                host_states[host]['progress']['scanned_ports'] += count_unit_ports(intervals)
+                port_sweep_status['units_done'] += 1
+                if port_sweep_status['hosts'][host]['state'] == 'queued':
+                    port_sweep_status['hosts'][host]['state'] = 'scanning'
+            finish_unit(host)
+
+    def unit_worker():
+        """作業単位がなくなるまで（またはキャンセルされるまで）取り出してスキャン"""
+        while not cancel_token.is_cancelled():
+            try:
+                host, intervals = work_units.popleft()
+            except IndexError:
+                return
+            scan_unit(host, intervals)
+
+    try:
+        print(f"\n{'='*60}")
+        print(f"[ポートスイープ開始] {len(hosts)}台, {len(work_units)}作業単位 ({workers}ワーカー, {port_engine})")
+        print(f"{'='*60}")
+
+        threads = []
+        for _ in range(min(workers, len(work_units))):
+            thread = threading.Thread(target=unit_worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if service_queue:
+            service_queue.close()
+
+        if cancel_token.is_cancelled():
+            # 完了していないホストは途中までに見つかったポートと進捗を残す
+            with port_sweep_lock:
+                port_sweep_status['cancelled'] = True
+                unfinished = [host for host in hosts if remaining[host] > 0]
+                cancelled_results = []
+                for host in unfinished:
+                    ports = [service_ports[host].get(port, info) for port, info in open_ports[host].items()]
+                    ports.sort(key=lambda p: p['port'])
+                    port_sweep_status['hosts'][host]['state'] = 'cancelled'
+                    cancelled_results.append({
+                        'host': host, 'ports': ports, 'os': host_states[host]['os'], 'scan_time': '',
+                        'scan_stage': 'cancelled', 'progress': dict(host_states[host]['progress']),
+                        'error': 'スキャンがキャンセルされました'
+                    })
+            for result in cancelled_results:
+                save_port_scan(result['host'], result)
+            print(f"\n[ポートスイープ キャンセル] 未完了 {len(unfinished)}台の途中までの結果を保存しました")
+
+        print(f"\n[ポートスイープ完了] {len(hosts)}台, {port_sweep_status['found_ports']}ポート, "
+              f"{time.time() - started_at:.1f}秒\n")
+    except Exception as e:
+        print(f"\n✗ ポートスイープエラー: {e}\n")
+        with port_sweep_lock:
+            port_sweep_status['error'] = str(e)
     finally:
-        scan_status['is_scanning'] = False
+        with port_sweep_lock:
+            port_sweep_status['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return {host: len(open_ports[host]) for host in hosts}
 
 
 @app.route('/')
@@ -119,40 +558,105 @@ def start_scan():
 
     Request Body:
         target_range (optional): スキャン対象（例: "192.168.0.0/24" または "192.168.0.1-50"）
+        engine (optional): ホスト検出エンジン（"nmap"、"nmap-stream"、"async"、デフォルト: "nmap"）
+        exclude (optional): 除外する範囲（カンマ区切り文字列またはリスト、例: "192.168.0.10,192.168.0.200-210"）
+        probe_ports (optional): asyncエンジンのプローブ先ポート（リストまたはカンマ区切り文字列）
+        probe_timeout (optional): asyncエンジンの1接続あたりのタイムアウト秒数
+
+    スキャンはジョブとして登録され、実行中の他のスキャンと並行して（実行枠が空いていなければ待機してから）実行される。
 
     Returns:
-        JSON: スキャン開始ステータス
+        JSON: スキャン開始ステータス（job_id: ジョブID）
     """
-    global scan_status
+    engine = request.json.get('engine', 'nmap') if request.json else 'nmap'
+    if engine not in SCAN_ENGINES:
+        return jsonify({
+            'status': 'error',
+            'message': f'不明なスキャンエンジンです: {engine}'
+        }), 400
 
-    # nmapの利用可否をチェック
-    if not scanner.check_nmap_available():
+    # nmapの利用可否をチェック（asyncエンジンはnmap不要）
+    if engine != 'async' and not scanner.check_nmap_available():
         return jsonify({
             'status': 'error',
             'message': 'nmapがインストールされていません。インストール後に再度お試しください。',
             'nmap_error': scanner.nmap_error
         }), 503
 
-    if scan_status['is_scanning']:
-        return jsonify({
-            'status': 'error',
-            'message': 'スキャンは既に実行中です'
-        }), 400
-
     # リクエストボディからIP範囲を取得
     target_range = None
     if request.json and 'target_range' in request.json:
         target_range = request.json['target_range']
 
-    # バックグラウンドでスキャンを開始
-    scan_thread = threading.Thread(target=background_scan, args=(target_range,))
-    scan_thread.daemon = True
-    scan_thread.start()
+    # スキャン範囲の型を検証（文字列・文字列のリスト以外はスキャンスレッドで失敗するため）
+    try:
+        CompiledTargets(target_range, None)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'スキャン範囲の指定が不正です: {e}'
+        }), 400
+
+    # 除外範囲を検証（解釈できない除外指定でスキャンしてしまわないようにする）
+    exclude = request.json.get('exclude') if request.json else None
+    try:
+        CompiledTargets([], exclude)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'除外範囲の指定が不正です: {e}'
+        }), 400
+
+    # asyncエンジンのプローブ設定を検証
+    try:
+        probe_ports, probe_timeout = parse_probe_options(request.json or {})
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+
+    # ジョブとして登録（実行枠が空いていればすぐにバックグラウンドで開始）
+    job = job_manager.submit(
+        'scan',
+        lambda job: background_scan(job, target_range, engine, exclude, probe_ports, probe_timeout),
+        priority=PRIORITY_NORMAL,
+        params={'target_range': target_range, 'engine': engine, 'exclude': exclude},
+        status={'scan_progress': 0, 'current_subnet': '実行待ち...', 'found_hosts': 0}
+    )
+
+    return jsonify({
+        'status': 'success',
+        'message': 'スキャンを開始しました' if job.state == 'running' else 'スキャンを登録しました（実行待ち）',
+        'job_id': job.id,
+        'target_range': target_range,
+        'engine': engine,
+        'exclude': exclude
+    })
+
+
+@app.route('/api/scan', methods=['DELETE'])
+def cancel_scan():
+    """
+    実行中・実行待ちのネットワークスキャンを全てキャンセル
+
+    実行中のnmapプロセスを終了し、新しいチャンクの投入をやめる。検出済みのホストは結果に残る。
+    個別のスキャンは DELETE /api/jobs/<job_id> でキャンセルできる。
+
+    Returns:
+        JSON: キャンセル結果
+    """
+    cancelled = [job.id for job in job_manager.list_jobs(kind='scan', active_only=True) if job_manager.cancel(job.id)]
+    if not cancelled:
+        return jsonify({
+            'status': 'error',
+            'message': '実行中のスキャンはありません'
+        }), 404
 
     return jsonify({
         'status': 'success',
-        'message': 'スキャンを開始しました',
-        'target_range': target_range
+        'message': 'スキャンをキャンセルしました',
+        'job_ids': cancelled
     })
 
 
@@ -164,11 +668,73 @@ def get_scan_status():
     Returns:
         JSON: スキャンステータス
     """
-    status = scan_status.copy()
-    status['nmap_available'] = scanner.check_nmap_available()
-    if not scanner.check_nmap_available():
-        status['nmap_error'] = scanner.nmap_error
-    return jsonify(status)
+    return jsonify(get_scan_status_snapshot())
+
+
+@app.route('/api/nmap-stats', methods=['GET'])
+def get_nmap_stats():
+    """
+    nmapの情報と実行記録（起動・実行・パースの所要時間）を取得
+
+    Query Parameters:
+        recent (optional): 含める直近の実行記録の件数（デフォルト: 20）
+
+    Returns:
+        JSON: NmapRunner.stats() の内容
+    """
+    recent = request.args.get('recent', 20, type=int)
+    return jsonify(scanner.nmap_runner.stats(recent=max(0, recent)))
+
+
+@app.route('/api/nmap-processes', methods=['POST'])
+def set_nmap_process_limit():
+    """
+    nmapプロセスの同時実行数の上限を変更（実行中のスキャンにも即座に反映）
+
+    Request Body:
+        {
+            "limit": 8
+        }
+
+    Returns:
+        JSON: 変更後の実行状況（limit, running, queued）
+    """
+    limit = request.json.get('limit') if request.json else None
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        return jsonify({
+            'status': 'error',
+            'message': 'limit は1以上の整数で指定してください'
+        }), 400
+
+    scanner.nmap_budget.set_limit(limit)
+    publish_scan_status()
+    return jsonify({
+        'status': 'success',
+        'nmap_processes': scanner.nmap_budget.stats()
+    })
+
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    スキャンイベントをServer-Sent Eventsで配信
+
+    イベント:
+        scan_status: スキャンステータス（開始・チャンク完了・終了時）。接続直後にも現在の状態を送る
+        host_found: ホストを検出した（{"ip": ..., "info": {...}}）
+        port_found: 全ポートスキャンの第1段階でポートを検出した（{"host": ..., "ports": [...]}）
+        port_scan: ポートスキャン結果・進捗・ステージの更新（GET /api/port-scan/<host> の data と同じ形式）
+        port_sweep: ポートスイープの進捗（GET /api/port-sweep と同じ形式）
+        job: ジョブの状態の変化（待機・開始・終了、GET /api/jobs の各要素と同じ形式）
+
+    Returns:
+        text/event-stream
+    """
+    return Response(
+        event_broker.stream(initial={'scan_status': get_scan_status_snapshot()}),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @app.route('/api/results', methods=['GET'])
@@ -176,12 +742,39 @@ def get_results():
     """
     スキャン結果を取得
 
+    Query Parameters:
+        subnet (optional): 指定したサブネットのホストのみ取得
+
     Returns:
         JSON: スキャン結果
     """
+    hosts = result_store.get_hosts(subnet=request.args.get('subnet'))
     return jsonify({
-        'hosts': scan_results,
-        'total': len(scan_results)
+        'hosts': hosts,
+        'total': len(hosts),
+        'up': count_up_hosts(hosts)
+    })
+
+
+@app.route('/api/ports', methods=['GET'])
+def find_ports():
+    """
+    保存済みのポートスキャン結果を全ホストから検索
+
+    Query Parameters:
+        port (optional): ポート番号
+        service (optional): サービス名（例: "http"）
+        subnet (optional): ホストのサブネット
+
+    Returns:
+        JSON: 一致したポートのリスト
+    """
+    port = request.args.get('port', type=int)
+    ports = result_store.find_ports(port=port, service=request.args.get('service'),
+                                    subnet=request.args.get('subnet'))
+    return jsonify({
+        'ports': ports,
+        'total': len(ports)
     })
 
 
@@ -196,10 +789,8 @@ def start_port_scan(host):
     Returns:
         JSON: ポートスキャン結果
     """
-    global port_scan_results
-
     # ホストが存在するか確認
-    if host not in scan_results:
+    if not result_store.has_host(host):
         return jsonify({
             'status': 'error',
             'message': '指定されたホストが見つかりません'
@@ -209,39 +800,82 @@ def start_port_scan(host):
     scan_args = request.json.get('arguments', '-sT -sV') if request.json else '-sT -sV'
     # スキャンモードを取得（priority: 優先ポートのみ、full: 全ポートのみ）
     scan_mode = request.json.get('scan_mode', 'priority') if request.json else 'priority'
+    # 全ポートスキャン第1段階のエンジンを取得（nmap: nmap -sT、async: asyncio TCPコネクト）
+    port_engine = request.json.get('port_engine', 'nmap') if request.json else 'nmap'
+    if port_engine not in PORT_SCAN_ENGINES:
+        return jsonify({
+            'status': 'error',
+            'message': f'不明なポートスキャンエンジンです: {port_engine}'
+        }), 400
+    # 全ポートスキャン第1段階（nmapエンジン）のワーカー数を取得
+    port_workers = request.json.get('port_workers', DEFAULT_PORT_SCAN_WORKERS) if request.json else DEFAULT_PORT_SCAN_WORKERS
+    if isinstance(port_workers, bool) or not isinstance(port_workers, int) or not 1 <= port_workers <= MAX_PORT_SCAN_WORKERS:
+        return jsonify({
+            'status': 'error',
+            'message': f'port_workers は 1〜{MAX_PORT_SCAN_WORKERS} の整数で指定してください'
+        }), 400
+    # 全ポートスキャン第2段階のエンジンを取得（banner: バナー照合＋nmap -sV、nmap: nmap -sV のみ）
+    service_engine = request.json.get('service_engine', 'banner') if request.json else 'banner'
+    if service_engine not in SERVICE_ENGINES:
+        return jsonify({
+            'status': 'error',
+            'message': f'不明なサービス情報取得エンジンです: {service_engine}'
+        }), 400
+
+    def publish_failure(result):
+        """失敗・キャンセルした結果を通知（保存済みの結果があれば残し、待機中のブラウザにだけ通知する）"""
+        if result_store.get_port_scan(host) is None:
+            save_port_scan(host, result)
+        else:
+            event_broker.publish('port_scan', result)
 
-    def scan_priority_ports():
+    def scan_priority_ports(cancel_token):
         """優先ポートスキャンを実行（高速化）"""
         try:
             print(f"\n[優先ポートスキャン] {host} の優先ポートをスキャン中...")
             # -T5 を追加して高速化
             fast_scan_args = scan_args.replace('-sV', '-sV -T5') if '-sV' in scan_args else scan_args + ' -T5'
-            priority_result = scanner.port_scan(host, fast_scan_args, priority_only=True)
-            port_scan_results[host] = priority_result
+            # 過去に開いていたポート → 履歴上よく開いているポート → 既定の優先ポート
+            host_ports, ranked_ports = get_history_ports(host)
+            priority_ports = select_priority_ports(host_ports, ranked_ports)
+            priority_result = scanner.port_scan(host, fast_scan_args, priority_only=True, priority_ports=priority_ports,
+                                                cancel_token=cancel_token)
+            if priority_result.get('cancelled'):
+                priority_result = dict(priority_result, scan_stage='cancelled')
+                publish_failure(priority_result)
+                return priority_result
+            save_port_scan(host, priority_result)
             print(f"[優先ポートスキャン完了] {len(priority_result.get('ports', []))}個のポートを検出")
+            return priority_result
         except Exception as e:
             print(f"\n優先ポートスキャンエラー ({host}): {e}\n")
-            if host not in port_scan_results:
-                port_scan_results[host] = {
-                    'host': host,
-                    'ports': [],
-                    'os': '',
-                    'scan_time': '',
-                    'scan_stage': 'error',
-                    'error': str(e)
-                }
+            error_result = {
+                'host': host,
+                'ports': [],
+                'os': '',
+                'scan_time': '',
+                'scan_stage': 'error',
+                'error': str(e)
+            }
+            publish_failure(error_result)
+            return error_result
 
-    def scan_full_ports():
-        """全ポートスキャンを並列実行（2段階: ポート検出→サービス情報取得）"""
+    def scan_full_ports(cancel_token):
+        """全ポートスキャンを並列実行（2段階: ポート検出→サービス情報取得、検出したポートから順に第2段階へ流す）"""
+        # 進捗はこのスレッドで保持し、更新するたびにストアへ書き込む
+        state = None
         try:
             print(f"\n{'='*60}")
             print(f"[2段階スキャン開始] {host}")
-            print(f"第1段階: ポート検出（6スレッド並列）")
-            print(f"第2段階: サービス情報取得（発見したポートのみ）")
+            if port_engine == 'async':
+                print(f"第1段階: ポート検出（asyncio TCPコネクト）")
+            else:
+                print(f"第1段階: ポート検出（{port_workers}ワーカーで{PORT_SCAN_UNIT_SIZE}ポートずつ分担）")
+            print(f"第2段階: サービス情報取得（発見したポートから順に、第1段階と並行）")
             print(f"{'='*60}")
 
             # 進捗情報を初期化
-            port_scan_results[host] = {
+            state = {
                 'host': host,
                 'ports': [],
                 'os': '',
@@ -252,200 +886,166 @@ def start_port_scan(host):
                     'scanned_ports': 0,
                     'found_ports': 0,
                     'service_scanned': 0,
-                    'overall_progress': 0
+                    'overall_progress': 0,
+                    'workers': 1 if port_engine == 'async' else port_workers
                 }
             }
+            save_port_scan(host, state)
 
-            # 全ポートを6つの範囲に分割して並列スキャン
-            port_ranges = [
-                (1, 10922),
-                (10923, 21844),
-                (21845, 32766),
-                (32767, 43688),
-                (43689, 54610),
-                (54611, 65535)
-            ]
+            # 全ポートを小さな作業単位に分割し、空いたワーカーから順に取り出す
+            # （遅い範囲があっても、他のワーカーが残りの作業単位を引き受ける）
+            # 過去に開いていたポート・履歴上よく開いているポートを先頭の作業単位にし、結果を早く返す
+            host_ports, ranked_ports = get_history_ports(host)
+            history_ports = host_ports + ranked_ports
+            port_units = deque(plan_port_units(history_ports))
 
             # ===== 第1段階: ポート検出（全範囲を並列スキャン） =====
+            # 見つかったポートはすぐに第2段階のキューへ積み、第1段階と並行してサービス情報を取得する
             print(f"\n[第1段階] ポート検出開始...")
-            port_results = []
             threads = []
             progress_lock = threading.Lock()
-
-            def scan_ports_only(start, end):
+            # 第1段階で見つかったポート（キー: ポート番号）と、第2段階で取得したサービス情報
+            open_ports = {}
+            service_ports = {}
+            service_os = []
+
+            def update_overall_progress():
+                """全体の進捗を更新（progress_lock を保持して呼ぶこと）
+
+                第1段階の進捗を0-50%、第1段階の進捗 × 第2段階の進捗を50-100%に割り当てる。
+                """
+                progress = state['progress']
+                stage1 = progress['scanned_ports'] / progress['total_ports']
+                stage2 = progress['service_scanned'] / progress['found_ports'] if progress['found_ports'] else 1.0
+                progress['overall_progress'] = round(stage1 * 50 + stage1 * stage2 * 50, 1)
+                save_port_scan(host, state)
+
+            def scan_service_batch(port_list):
+                """まとめて取り出したポートのサービス情報を取得（キャンセル後は何もせず処理済みとして数える）"""
+                ports_str = ','.join(map(str, sorted(port_list)))
+                print(f"  [第2段階] サービス情報取得中... ({len(port_list)}ポート: {ports_str})")
+                try:
+                    # 前回から変わっていないサービスはキャッシュを使い、残りだけ nmap -sV を実行
+                    result = scanner.detect_services(host, port_list, service_engine, cancel_token=cancel_token)
+                finally:
+                    # 失敗したポートも処理済みとして数える（第1段階の情報で結果に残る）
+                    with progress_lock:
+                        state['progress']['service_scanned'] += len(port_list)
+                        update_overall_progress()
+
+                with progress_lock:
+                    for port_info in result.get('ports', []):
+                        service_ports[port_info['port']] = port_info
+                    if result.get('os'):
+                        service_os.append(result['os'])
+                print(f"  [第2段階] ✓ {len(result.get('ports', []))}ポートの情報取得完了 "
+                      f"(バナー照合 {result.get('matched', 0)}ポート, キャッシュ {result.get('cached', 0)}ポート, {ports_str})")
+
+            service_queue = ServiceDetectionQueue(scan_service_batch)
+
+            def add_open_ports(ports):
+                """第1段階で見つかったポートを記録し、第2段階のキューに積む"""
+                with progress_lock:
+                    new_ports = [p for p in ports if p['port'] not in open_ports]
+                    for port_info in new_ports:
+                        open_ports[port_info['port']] = port_info
+                    state['progress']['found_ports'] = len(open_ports)
+                if new_ports:
+                    event_broker.publish('port_found', {'host': host, 'ports': new_ports})
+                for port_info in new_ports:
+                    service_queue.put(port_info['port'])
+
+            def scan_ports_only(intervals):
                 """指定範囲のポートを検出（サービス情報なし）"""
+                port_spec = format_port_spec(intervals)
                 try:
-                    print(f"  [範囲 {start}-{end}] ポートスキャン中...")
                     # -sT: TCP接続スキャン
                     # -T4: 高速スキャン（T5より安定）
                     # --open: オープンポートのみ
                     # --host-timeout 30s: ホストごとのタイムアウト
-                    range_args = f"-p {start}-{end} -sT -T4 --open --host-timeout 30s"
-                    print(f"  [範囲 {start}-{end}] 実行コマンド: nmap {range_args} {host} (サービス情報なし)")
-                    result = scanner.port_scan(host, range_args, priority_only=False, is_range_scan=True, verbose=False)
+                    range_args = f"-p {port_spec} -sT -T4 --open --host-timeout 30s"
+                    result = scanner.port_scan(host, range_args, priority_only=False, is_range_scan=True, verbose=False,
+                                               cancel_token=cancel_token)
+                    if result.get('cancelled'):
+                        return
 
                     if result.get('ports') and len(result['ports']) > 0:
-                        print(f"  [範囲 {start}-{end}] ✓ {len(result['ports'])}個のポートを発見")
-                        port_results.append(result)
-                    else:
-                        print(f"  [範囲 {start}-{end}] ポートなし")
+                        print(f"  [範囲 {port_spec}] ✓ {len(result['ports'])}個のポートを発見")
+                        add_open_ports(result['ports'])
 
                     # 進捗を更新（このポート範囲をスキャン完了）
-                    scanned_count = end - start + 1
+                    scanned_count = count_unit_ports(intervals)
                     with progress_lock:
-                        port_scan_results[host]['progress']['scanned_ports'] += scanned_count
-                        # 第1段階の進捗: 0-50%
-                        stage1_progress = (port_scan_results[host]['progress']['scanned_ports'] / 65535) * 50
-                        port_scan_results[host]['progress']['overall_progress'] = round(stage1_progress, 1)
-                        print(f"  [進捗更新] {port_scan_results[host]['progress']['scanned_ports']}/{65535}ポート完了 ({port_scan_results[host]['progress']['overall_progress']}%)")
+                        state['progress']['scanned_ports'] += scanned_count
+                        update_overall_progress()
+                        print(f"  [進捗更新] {state['progress']['scanned_ports']}/{65535}ポート完了 ({state['progress']['overall_progress']}%)")
 
                 except Exception as e:
-                    print(f"  [範囲 {start}-{end}] エラー: {e}")
-
-            # ポート検出を並列実行
-            for start, end in port_ranges:
-                thread = threading.Thread(target=scan_ports_only, args=(start, end))
-                thread.daemon = True
-                thread.start()
-                threads.append(thread)
-
-            # 全スレッドの完了を待つ
-            for thread in threads:
-                thread.join()
-
-            print(f"\n[第1段階完了] ポート検出が完了しました")
-
-            # 発見したポートを収集
-            all_open_ports = []
-            for result in port_results:
-                if 'ports' in result:
-                    all_open_ports.extend(result['ports'])
-
-            # 発見ポート数を進捗に記録
-            found_ports_count = len(all_open_ports)
-            with progress_lock:
-                port_scan_results[host]['progress']['found_ports'] = found_ports_count
-
-            # ===== 第2段階: サービス情報取得（6スレッド並列） =====
-            if len(all_open_ports) > 0:
-                print(f"\n[第2段階] サービス情報取得開始（6スレッド並列）...")
-                print(f"  発見したポート数: {len(all_open_ports)}個")
-
-                # ポート番号のみ抽出してソート
-                port_numbers = sorted([p['port'] for p in all_open_ports])
-                print(f"  全ポート番号: {port_numbers}")
-
-                # ポートを6グループに分割（できるだけ均等に）
-                chunk_size = max(1, len(port_numbers) // 6)
-                print(f"  chunk_size: {chunk_size} (total: {len(port_numbers)}, threads: 6)")
-                port_chunks = []
-                for i in range(0, len(port_numbers), chunk_size):
-                    chunk = port_numbers[i:i + chunk_size]
-                    if chunk:
-                        port_chunks.append(chunk)
-                        print(f"  追加chunk (i={i}): {chunk}")
-
-                # 最後の小さなチャンクを前のチャンクに統合（6つを超えた場合）
-                if len(port_chunks) > 6:
-                    last_chunk = port_chunks.pop()
-                    port_chunks[-1].extend(last_chunk)
-                    print(f"  最後のchunkを統合: {port_chunks[-1]}")
-
-                print(f"  ポートを{len(port_chunks)}グループに分割")
-                for idx, chunk in enumerate(port_chunks, 1):
-                    if len(chunk) > 0:
-                        chunk_str = f"{chunk[0]}-{chunk[-1]}" if len(chunk) > 1 else str(chunk[0])
-                        print(f"    グループ{idx}: {len(chunk)}ポート ({chunk_str}) - ポート番号: {chunk}")
-
-                # サービス情報取得を並列実行
-                service_results = []
-                service_threads = []
-
-                def scan_service_info(port_list, group_num, total_found_ports):
-                    """指定ポートのサービス情報を取得"""
-                    try:
-                        ports_str = ','.join(map(str, port_list))
-                        print(f"  [グループ{group_num}] サービス情報取得中... ({len(port_list)}ポート)")
-                        print(f"  [グループ{group_num}] 対象ポート: {ports_str}")
-
-                        # -sV: サービスバージョン検出
-                        # -T4: 高速スキャン（T5より安定）
-                        # --version-intensity 2: 軽量なバージョン検出（デフォルト7→2で大幅高速化）
-                        # --host-timeout 20s: ホストごとのタイムアウト
-                        service_args = f"-p {ports_str} -sV -T4 --version-intensity 2 --host-timeout 20s"
-                        print(f"  [グループ{group_num}] 実行コマンド: nmap {service_args} {host}")
-                        result = scanner.port_scan(host, service_args, priority_only=False, is_range_scan=True, verbose=False)
-
-                        if result.get('ports'):
-                            print(f"  [グループ{group_num}] ✓ {len(result['ports'])}ポートの情報取得完了")
-                            service_results.append(result)
-
-                            # 進捗を更新（サービス情報取得完了）
-                            with progress_lock:
-                                # progressキーの存在を確認
-                                if 'progress' in port_scan_results.get(host, {}):
-                                    port_scan_results[host]['progress']['service_scanned'] += len(result['ports'])
-                                    # 第2段階の進捗: 50-100%
-                                    if total_found_ports > 0:
-                                        stage2_progress = (port_scan_results[host]['progress']['service_scanned'] / total_found_ports) * 50
-                                        port_scan_results[host]['progress']['overall_progress'] = round(50 + stage2_progress, 1)
-                                        print(f"  [進捗更新] サービス情報 {port_scan_results[host]['progress']['service_scanned']}/{total_found_ports}ポート完了 ({port_scan_results[host]['progress']['overall_progress']}%)")
-                        else:
-                            print(f"  [グループ{group_num}] 情報取得なし")
-                    except Exception as e:
-                        import traceback
-                        print(f"  [グループ{group_num}] エラー: {e}")
-                        print(f"  [グループ{group_num}] トレースバック: {traceback.format_exc()}")
-
-                # サービス情報取得を並列実行
-                for idx, chunk in enumerate(port_chunks, 1):
-                    thread = threading.Thread(target=scan_service_info, args=(chunk, idx, found_ports_count))
-                    thread.daemon = True
-                    thread.start()
-                    service_threads.append(thread)
-
-                # 全スレッドの完了を待つ
-                print(f"  [待機] {len(service_threads)}個のスレッドの完了を待機中...")
-                for idx, thread in enumerate(service_threads, 1):
-                    thread.join()
-                    print(f"  [待機] スレッド{idx}/{len(service_threads)}完了")
-
-                print(f"\n[第2段階完了] サービス情報取得が完了しました")
-                print(f"  取得結果数: {len(service_results)}個")
-
-                # 結果を統合
-                print(f"\n[結果統合] service_results数: {len(service_results)}")
-                final_ports = []
-                for idx, result in enumerate(service_results, 1):
-                    if 'ports' in result:
-                        print(f"  結果{idx}: {len(result['ports'])}ポート")
-                        final_ports.extend(result['ports'])
-                    else:
-                        print(f"  結果{idx}: ポート情報なし")
-
-                print(f"  統合後の総ポート数: {len(final_ports)}")
+                    print(f"  [範囲 {port_spec}] エラー: {e}")
 
-                # ポート番号順にソート
-                final_ports.sort(key=lambda x: x['port'])
+            def scan_ports_async():
+                """全ポートをasyncio TCPコネクトで検出（同時接続数は自動調整）"""
+                def progress_callback(scanned, total, found):
+                    with progress_lock:
+                        state['progress']['scanned_ports'] = scanned
+                        update_overall_progress()
+
+                def port_callback(port_info):
+                    print(f"  ✓ {port_info['port']}/tcp - {port_info['service'] or 'unknown'}")
+                    add_open_ports([port_info])
+
+                result = AsyncPortScanner().scan(host, ports=order_ports(history_ports),
+                                                 progress_callback=progress_callback, port_callback=port_callback,
+                                                 cancel_token=cancel_token)
+                stats = result['stats']
+                print(f"  [async] {stats['elapsed']}秒 (最終同時接続数 {stats['concurrency']}, "
+                      f"タイムアウト {stats['timeout']}秒)")
+
+            def port_unit_worker():
+                """作業単位がなくなるまで（またはキャンセルされるまで）取り出してスキャン"""
+                while not cancel_token.is_cancelled():
+                    try:
+                        intervals = port_units.popleft()
+                    except IndexError:
+                        return
+                    scan_ports_only(intervals)
 
-                # 最終結果
-                merged_result = {
-                    'host': host,
-                    'ports': final_ports if final_ports else all_open_ports,
-                    'os': service_results[0].get('os', '') if service_results else '',
-                    'scan_time': '',
-                    'scan_stage': 'full'
-                }
-                print(f"\n[最終結果設定] scan_stage='full', ポート数: {len(merged_result['ports'])}")
-            else:
-                print(f"\n[第2段階スキップ] ポートが発見されませんでした")
-                merged_result = {
-                    'host': host,
-                    'ports': [],
-                    'os': '',
-                    'scan_time': '',
-                    'scan_stage': 'full'
-                }
+            try:
+                if port_engine == 'async':
+                    scan_ports_async()
+                else:
+                    # ポート検出を並列実行
+                    for _ in range(port_workers):
+                        thread = threading.Thread(target=port_unit_worker)
+                        thread.daemon = True
+                        thread.start()
+                        threads.append(thread)
+
+                    # 全スレッドの完了を待つ
+                    for thread in threads:
+                        thread.join()
+
+                print(f"\n[第1段階完了] ポート検出が完了しました（{len(open_ports)}個）")
+            finally:
+                # ===== 第2段階: 積まれた残りのサービス情報取得を待つ =====
+                service_queue.close()
+            print(f"[第2段階完了] サービス情報取得が完了しました（{len(service_ports)}/{len(open_ports)}ポート）")
+
+            # サービス情報を取得できたポートはその情報、取得できなかったポートは第1段階の情報を使う
+            final_ports = [service_ports.get(port, port_info) for port, port_info in open_ports.items()]
+            merged_result = {
+                'host': host,
+                'ports': final_ports,
+                'os': service_os[0] if service_os else '',
+                'scan_time': '',
+                'scan_stage': 'full'
+            }
+            if cancel_token.is_cancelled():
+                # 途中までに見つかったポートと進捗を残す
+                merged_result.update(scan_stage='cancelled', progress=state['progress'],
+                                     error='スキャンがキャンセルされました')
+                print(f"\n[キャンセル] 途中までの結果を保存します（{len(final_ports)}ポート）")
+            print(f"\n[最終結果設定] scan_stage='full', ポート数: {len(merged_result['ports'])}")
 
             # ポートを番号順にソート
             print(f"\n[ソート] {len(merged_result['ports'])}個のポートをソート中...")
@@ -453,13 +1053,14 @@ def start_port_scan(host):
                 merged_result['ports'].sort(key=lambda x: x['port'])
                 print(f"  ソート完了")
 
-            print(f"\n[結果更新] port_scan_results[{host}]を更新中...")
-            port_scan_results[host] = merged_result
+            print(f"\n[結果更新] {host} のポートスキャン結果を保存中...")
+            save_port_scan(host, merged_result)
             print(f"  更新完了: scan_stage={merged_result['scan_stage']}")
 
             print(f"\n{'='*60}")
             print(f"[2段階スキャン完了] {len(merged_result['ports'])}個のポートを検出")
             print(f"{'='*60}\n")
+            return merged_result
 
         except Exception as e:
             import traceback
@@ -468,38 +1069,278 @@ def start_port_scan(host):
             print(f"トレースバック:")
             print(traceback.format_exc())
             print(f"{'='*60}\n")
-            if host in port_scan_results:
-                port_scan_results[host]['error'] = str(e)
-                port_scan_results[host]['scan_stage'] = 'error'
+            if state is not None:
+                state['error'] = str(e)
+                state['scan_stage'] = 'error'
+                save_port_scan(host, state)
+            return state
 
     # スキャンモードに応じて実行
-    def run_scan():
+    def run_scan(job):
         """スキャンモードに応じて優先ポートまたは全ポートを実行"""
         if scan_mode == 'priority':
             # 優先ポートのみ
             print(f"[スキャンモード] 優先ポートのみ実行")
-            scan_priority_ports()
+            return scan_priority_ports(job.cancel_token)
         elif scan_mode == 'full':
             # 全ポートのみ
             print(f"[スキャンモード] 全ポートのみ実行")
-            scan_full_ports()
-        else:
-            print(f"[エラー] 不明なスキャンモード: {scan_mode}")
-
-    # スキャンをバックグラウンドスレッドで実行
-    scan_thread = threading.Thread(target=run_scan)
-    scan_thread.daemon = True
-    scan_thread.start()
+            return scan_full_ports(job.cancel_token)
+        print(f"[エラー] 不明なスキャンモード: {scan_mode}")
+        return None
+
+    # ジョブとして登録（DELETE /api/port-scan/<host> でキャンセルできる）
+    # 優先ポートスキャンはユーザーが結果を待っているため、ポートスイープより先に実行枠・nmapの実行枠を得る
+    job = job_manager.submit(
+        'port_scan', run_scan,
+        priority=PRIORITY_INTERACTIVE if scan_mode == 'priority' else PRIORITY_NORMAL,
+        params={'host': host, 'scan_mode': scan_mode, 'port_engine': port_engine, 'service_engine': service_engine}
+    )
 
     # スキャンモードに応じたメッセージ
     messages = {
         'priority': '優先ポートスキャンを開始しました',
-        'full': '全ポートスキャンを開始しました（6スレッド並列）'
+        'full': '全ポートスキャンを開始しました（asyncio TCPコネクト）' if port_engine == 'async'
+                else f'全ポートスキャンを開始しました（{port_workers}ワーカー並列）'
     }
 
     return jsonify({
         'status': 'success',
-        'message': messages.get(scan_mode, 'ポートスキャンを開始しました')
+        'message': messages.get(scan_mode, 'ポートスキャンを開始しました'),
+        'job_id': job.id
+    })
+
+
+@app.route('/api/port-scan/<host>', methods=['DELETE'])
+def cancel_port_scan(host):
+    """
+    指定されたホストで実行中のポートスキャンをキャンセル
+
+    実行中のnmapプロセスを終了し、残りの作業単位・サービス情報取得を取りやめる。
+    全ポートスキャンは途中までに見つかったポートを scan_stage 'cancelled' として保存する。
+
+    Args:
+        host: スキャン対象のIPアドレス
+
+    Returns:
+        JSON: キャンセル結果
+    """
+    cancelled = [
+        job.id for job in job_manager.list_jobs(kind='port_scan', active_only=True)
+        if job.params.get('host') == host and job_manager.cancel(job.id)
+    ]
+    if not cancelled:
+        return jsonify({
+            'status': 'error',
+            'message': 'このホストで実行中のポートスキャンはありません'
+        }), 404
+
+    return jsonify({
+        'status': 'success',
+        'message': f'{len(cancelled)}件のポートスキャンをキャンセルしました',
+        'job_ids': cancelled
+    })
+
+
+@app.route('/api/port-sweep', methods=['POST'])
+def start_port_sweep():
+    """
+    検出済みの複数ホストに対して全ポートスキャンを1つのジョブとして実行
+
+    Request Body:
+        {
+            "subnet": "192.168.0.0/24",   # 省略時は応答のあった全ホスト
+            "hosts": ["192.168.0.10"],     # subnet の代わりにホストを直接指定
+            "port_engine": "nmap",         # nmap または async
+            "workers": 8,                  # 全ホストで共有するワーカー数
+            "service_detection": true,     # サービス情報取得を行うか
+            "service_engine": "banner"     # サービス情報取得のエンジン（banner または nmap）
+        }
+
+    ポートスイープは一括処理の優先度（PRIORITY_BULK）のジョブとして登録され、実行中の他のスキャンより後に
+    実行枠・nmapの実行枠を得る。
+
+    Returns:
+        JSON: 開始したスイープの対象ホストとジョブID
+    """
+    body = request.json or {}
+    port_engine = body.get('port_engine', 'nmap')
+    if port_engine not in PORT_SCAN_ENGINES:
+        return jsonify({
+            'status': 'error',
+            'message': f'不明なポートスキャンエンジンです: {port_engine}'
+        }), 400
+    if port_engine != 'async' and not scanner.check_nmap_available():
+        return jsonify({
+            'status': 'error',
+            'message': 'nmapがインストールされていません。port_engine に async を指定してください。',
+            'nmap_error': scanner.nmap_error
+        }), 503
+    workers = body.get('workers', DEFAULT_PORT_SWEEP_WORKERS)
+    if isinstance(workers, bool) or not isinstance(workers, int) or not 1 <= workers <= MAX_PORT_SCAN_WORKERS:
+        return jsonify({
+            'status': 'error',
+            'message': f'workers は 1〜{MAX_PORT_SCAN_WORKERS} の整数で指定してください'
+        }), 400
+    service_engine = body.get('service_engine', 'banner')
+    if service_engine not in SERVICE_ENGINES:
+        return jsonify({
+            'status': 'error',
+            'message': f'不明なサービス情報取得エンジンです: {service_engine}'
+        }), 400
+
+    # 対象ホストを決定（応答のなかった 'stale' ホストは含めない）
+    known_hosts = {ip: info for ip, info in result_store.get_hosts().items() if info.get('state') == 'up'}
+    if body.get('hosts') is not None:
+        hosts = body['hosts']
+        if not isinstance(hosts, list) or not all(isinstance(host, str) for host in hosts):
+            return jsonify({
+                'status': 'error',
+                'message': 'hosts はIPアドレスのリストで指定してください'
+            }), 400
+        unknown = [host for host in hosts if host not in known_hosts]
+        if unknown:
+            return jsonify({
+                'status': 'error',
+                'message': f'検出されていないホストが含まれています: {", ".join(unknown)}'
+            }), 404
+    elif body.get('subnet'):
+        try:
+            network = ipaddress.ip_network(body['subnet'], strict=False)
+        except (TypeError, ValueError):
+            # スキャン対象の文字列（例: "192.168.0.1-50"）はホストのサブネット欄と照合する
+            network = None
+        hosts = [
+            ip for ip, info in known_hosts.items()
+            if (ipaddress.ip_address(ip) in network if network is not None else info.get('subnet') == body['subnet'])
+        ]
+    else:
+        hosts = list(known_hosts)
+    hosts = sorted(set(hosts), key=lambda ip: ipaddress.ip_address(ip))
+    if not hosts:
+        return jsonify({
+            'status': 'error',
+            'message': '対象のホストがありません'
+        }), 404
+
+    units_per_host = plan_sweep_units(hosts)
+    sweep_status = {
+        'port_engine': port_engine,
+        'service_engine': service_engine,
+        'workers': workers,
+        'hosts_total': len(hosts),
+        'hosts_done': 0,
+        'units_total': sum(len(units) for units in units_per_host.values()),
+        'units_done': 0,
+        'found_ports': 0,
+        'overall_progress': 0,
+        'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'finished_at': None,
+        'hosts': {
+            host: {'state': 'queued', 'scanned_ports': 0, 'found_ports': 0, 'service_scanned': 0,
+                   'overall_progress': 0}
+            for host in hosts
+        }
+    }
+    detect_services = bool(body.get('service_detection', True))
+    job = job_manager.submit(
+        'port_sweep',
+        lambda job: background_port_sweep(job, hosts, port_engine, workers, detect_services, service_engine,
+                                          units_per_host),
+        priority=PRIORITY_BULK,
+        params={'hosts': hosts, 'port_engine': port_engine, 'service_engine': service_engine},
+        status=sweep_status
+    )
+
+    return jsonify({
+        'status': 'success',
+        'message': f'{len(hosts)}台のホストのポートスイープを開始しました' if job.state == 'running'
+                   else f'{len(hosts)}台のホストのポートスイープを登録しました（実行待ち）',
+        'hosts': hosts,
+        'job_id': job.id
+    })
+
+
+@app.route('/api/port-sweep', methods=['GET'])
+def get_port_sweep_status():
+    """
+    ポートスイープの状態（全体とホストごとの進捗）を取得
+
+    実行中のポートスイープのうち最後に投入したもの（なければ最後に終了したもの）を返す。
+
+    Returns:
+        JSON: ポートスイープの状態
+    """
+    return jsonify(get_port_sweep_snapshot())
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """
+    スキャンジョブの一覧を取得
+
+    Query Parameters:
+        kind (optional): ジョブの種類（"scan"、"port_scan"、"port_sweep"）
+        active (optional): "1" の場合は実行中・実行待ちのジョブのみ
+
+    Returns:
+        JSON: ジョブの一覧（投入順）と実行状況
+    """
+    jobs = job_manager.list_jobs(kind=request.args.get('kind'), active_only=request.args.get('active') == '1')
+    return jsonify({
+        'jobs': [job.snapshot() for job in jobs],
+        'stats': job_manager.stats()
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    スキャンジョブの状態と結果を取得
+
+    Args:
+        job_id: ジョブID
+
+    Returns:
+        JSON: ジョブの状態（result: 終了したジョブの結果）
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'ジョブが見つかりません'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'data': job.snapshot(include_result=True)
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """
+    スキャンジョブをキャンセル（実行待ちのジョブは実行せずに終了する）
+
+    Args:
+        job_id: ジョブID
+
+    Returns:
+        JSON: キャンセル結果
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'ジョブが見つかりません'
+        }), 404
+    if not job_manager.cancel(job_id):
+        return jsonify({
+            'status': 'error',
+            'message': 'このジョブは既に終了しています'
+        }), 409
+    return jsonify({
+        'status': 'success',
+        'message': 'ジョブをキャンセルしました'
     })
 
 
@@ -514,10 +1355,11 @@ def get_port_scan_result(host):
     Returns:
         JSON: ポートスキャン結果
     """
-    if host in port_scan_results:
+    result = result_store.get_port_scan(host)
+    if result is not None:
         return jsonify({
             'status': 'success',
-            'data': port_scan_results[host]
+            'data': result
         })
     else:
         # スキャン結果がない場合、404ではなくスキャン待機中として返す
@@ -538,13 +1380,7 @@ def remove_host(host):
     Returns:
         JSON: 削除結果
     """
-    global scan_results, port_scan_results
-
-    if host in scan_results:
-        del scan_results[host]
-        if host in port_scan_results:
-            del port_scan_results[host]
-
+    if result_store.delete_host(host):
         return jsonify({
             'status': 'success',
             'message': f'ホスト {host} を削除しました'
@@ -559,7 +1395,10 @@ def remove_host(host):
 @app.route('/api/sudo-password', methods=['POST'])
 def set_sudo_password():
     """
-    sudoパスワードを設定
+    sudoパスワードを設定し、root権限のnmapを実行する常駐ヘルパーを起動
+
+    パスワードが正しくない場合はヘルパーを起動できないため、その場でエラーを返す。
+    sudo でPythonの実行が許可されていない等でヘルパーだけを起動できない場合は、スキャンごとの sudo nmap に切り替える。
 
     Request Body:
         {
@@ -581,10 +1420,21 @@ def set_sudo_password():
         # パスワードをスキャナーに設定
         scanner.set_sudo_password(password)
 
+        if scanner.nmap_helper_error is not None:
+            return jsonify({
+                'status': 'success',
+                'message': 'sudoパスワードを設定しました（nmapヘルパーを起動できないため、スキャンごとに sudo nmap を実行します）',
+                'helper_error': scanner.nmap_helper_error
+            })
         return jsonify({
             'status': 'success',
             'message': 'sudoパスワードを設定しました'
         })
+    except NmapHelperError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -609,16 +1459,8 @@ def get_process_info(host):
 
     process_info = {}
 
-    # ローカルIPアドレスのリスト
-    local_ips = ['127.0.0.1', 'localhost', '::1']
-    try:
-        # 実際のローカルIPも追加
-        local_ips.append(scanner.get_local_ip())
-    except:
-        pass
-
     # リモートホストの場合は空の結果を返す（エラーではない）
-    if host not in local_ips and not host.startswith('127.') and not host.startswith('::'):
+    if not scanner.is_local_address(host):
         # リモートホストのプロセス情報は取得できないため、空の結果を返す
         return jsonify({
             'status': 'success',
@@ -868,24 +1710,21 @@ def get_http_info(host, port):
     """
     指定されたホストとポートのHTTP詳細情報を取得
 
+    ポートスキャンで見つかったHTTP系のポートは先読み済みのため、通常はキャッシュから返る。
+
     Args:
         host: ホストのIPアドレス
         port: ポート番号
 
+    Query Parameters:
+        refresh (optional): 1 の場合、キャッシュが有効期間内でも再検証する（ETag・Last-Modified による条件付きリクエスト）
+
     Returns:
         JSON: HTTP詳細情報
     """
     try:
-        # HTTPSを試すかどうか（443, 8443などはHTTPS）
-        use_https = port in [443, 8443]
-
-        # HTTP情報を取得
-        http_info = scanner.get_http_info(host, port, use_https)
-
-        # HTTPSで失敗した場合、HTTPを試す
-        if not http_info['accessible'] and use_https:
-            http_info = scanner.get_http_info(host, port, use_https=False)
-
+        refresh = request.args.get('refresh') == '1'
+        http_info = scanner.get_http_fingerprint(host, port, refresh=refresh)
         return jsonify(http_info)
 
     except Exception as e:
@@ -906,7 +1745,7 @@ def get_network_topology():
     """
     try:
         # 現在のスキャン結果からトポロジーを生成
-        topology = scanner.generate_network_topology(scan_results, port_scan_results)
+        topology = scanner.generate_network_topology(result_store.get_hosts(), result_store.get_port_scans())
 
         return jsonify(topology)
 
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+LocalNetScan ベンチマークスクリプト
+
+ループバックアドレス（127.0.0.0/8）を対象にスキャンエンジンの速度を計測する。
+ループバック宛のTCP接続は即座にRSTが返るため、ネットワーク環境に依存せず比較できる。
+
+使用例:
+    python3 benchmark.py discovery --target 127.0.0.0/20
+    python3 benchmark.py discovery --target 127.0.0.0/24 --engine nmap
+    python3 benchmark.py ports --listeners 20
+    python3 benchmark.py xml --hosts 65536 --ports 20
+"""
+
+import argparse
+import importlib.util
+import os
+import socket
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from scanner import NetworkScanner, AsyncPortScanner, SCAN_ENGINES, PORT_SCAN_ENGINES, iter_nmap_xml
+
+# XMLパーサーのベンチマークでファイルを読む単位（nmapのパイプから読む量と同程度）
+XML_READ_SIZE = 65536
+
+
+def bench_discovery(args):
+    """ホスト検出エンジンのベンチマーク"""
+    scanner = NetworkScanner()
+    engines = SCAN_ENGINES if args.engine == 'all' else (args.engine,)
+
+    print(f"対象: {args.target}")
+    for engine in engines:
+        if engine == 'nmap' and not scanner.check_nmap_available():
+            print(f"[{engine}] スキップ: nmapが利用できません")
+            continue
+
+        best = None
+        found = 0
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results = scanner.ping_scan(args.target, engine=engine)
+            elapsed = time.perf_counter() - start
+            found = len(results)
+            best = elapsed if best is None else min(best, elapsed)
+
+        print(f"[{engine}] 検出 {found}台 / 最速 {best:.3f}秒 (試行 {args.repeat}回)")
+
+
+def bench_ports(args):
+    """全ポートスキャン第1段階（ポート検出）のベンチマーク"""
+    # ループバックに待ち受けソケットを開き、全て検出できるかも確認する
+    listeners = []
+    for _ in range(args.listeners):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        listeners.append(listener)
+    expected = {listener.getsockname()[1] for listener in listeners}
+
+    scanner = NetworkScanner()
+    engines = PORT_SCAN_ENGINES if args.engine == 'all' else (args.engine,)
+    print(f"対象: 127.0.0.1 ポート1-65535 (待ち受け {len(expected)}ポート)")
+    try:
+        for engine in engines:
+            if engine == 'nmap' and not scanner.check_nmap_available():
+                print(f"[{engine}] スキップ: nmapが利用できません")
+                continue
+
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                if engine == 'async':
+                    result = AsyncPortScanner().scan('127.0.0.1')
+                else:
+                    result = scanner.port_scan('127.0.0.1', '-p 1-65535 -sT -T4 --open', is_range_scan=True,
+                                               verbose=False)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            found = {port['port'] for port in result['ports']}
+            missed = len(expected - found)
+            detail = f" / 同時接続数 {result['stats']['concurrency']}" if 'stats' in result else ''
+            print(f"[{engine}] 検出 {len(found)}ポート (見逃し {missed}) / 最速 {best:.3f}秒{detail} (試行 {args.repeat}回)")
+    finally:
+        for listener in listeners:
+            listener.close()
+
+
+def write_synthetic_nmap_xml(path: str, hosts: int, ports: int):
+    """hosts 台 × ports 個の開いたポートを持つ nmap -oX 形式のファイルを作成"""
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE nmaprun>\n')
+        f.write('<nmaprun scanner="nmap" args="nmap -sS -sV" start="0" version="7.94" xmloutputversion="1.05">\n')
+        f.write('<scaninfo type="syn" protocol="tcp" numservices="1000" services="1-1000"/>\n')
+        for i in range(hosts):
+            ip = f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+            f.write(f'<host starttime="0" endtime="1"><status state="up" reason="arp-response" reason_ttl="0"/>\n'
+                    f'<address addr="{ip}" addrtype="ipv4"/>\n'
+                    f'<address addr="02:00:00:{i >> 16 & 255:02X}:{i >> 8 & 255:02X}:{i & 255:02X}" addrtype="mac" vendor="Acme"/>\n'
+                    f'<hostnames><hostname name="host{i}.lan" type="PTR"/></hostnames>\n<ports>'
+                    f'<extraports state="closed" count="{1000 - ports}"><extrareasons reason="reset" count="{1000 - ports}"/></extraports>\n')
+            for port in range(ports):
+                f.write(f'<port protocol="tcp" portid="{8000 + port}"><state state="open" reason="syn-ack" reason_ttl="64"/>'
+                        f'<service name="http" product="nginx" version="1.25.{port}" method="probed" conf="10"/></port>\n')
+            f.write('</ports>\n<os><osmatch name="Linux 5.X" accuracy="98" line="1"/></os>\n</host>\n')
+        f.write(f'<runstats><finished time="1" timestr="" elapsed="1" summary="" exit="success"/>'
+                f'<hosts up="{hosts}" down="0" total="{hosts}"/></runstats>\n</nmaprun>\n')
+
+
+def _parse_streaming(path: str) -> int:
+    ports = 0
+    with open(path, 'rb') as f:
+        for kind, record in iter_nmap_xml(iter(lambda: f.read(XML_READ_SIZE), b'')):
+            if kind == 'host':
+                ports += len(record['ports'])
+    return ports
+
+
+def _parse_whole_tree(path: str) -> int:
+    # 以前の常駐ヘルパー経路と同じく、出力全体を読み込んでからツリーを作る
+    with open(path) as f:
+        root = ET.fromstring(f.read())
+    return sum(len(host.findall('.//port')) for host in root.findall('host'))
+
+
+def _parse_python_nmap(path: str) -> int:
+    # 以前のポートスキャン・チャンクごとのPingスキャン経路（python-nmap、比較用で必須の依存関係ではない）
+    # PortScanner() は nmap -V を実行するため、nmapがない環境でも計測できるよう初期化を省く
+    import nmap
+
+    with open(path) as f:
+        output = f.read()
+    result = nmap.PortScanner.__new__(nmap.PortScanner).analyse_nmap_xml_scan(
+        nmap_xml_output=output, nmap_err='', nmap_err_keep_trace=[], nmap_warn_keep_trace=[])
+    return sum(len(host.get('tcp', {})) for host in result['scan'].values())
+
+
+def bench_xml(args):
+    """nmap XML出力のパーサーのベンチマーク（合成したXMLファイル、所要時間とピークメモリ）"""
+    parsers = (
+        ('iter_nmap_xml', _parse_streaming),
+        ('ElementTree.fromstring', _parse_whole_tree),
+        ('python-nmap', _parse_python_nmap)
+    )
+    fd, path = tempfile.mkstemp(suffix='.xml')
+    os.close(fd)
+    try:
+        write_synthetic_nmap_xml(path, args.hosts, args.ports)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"対象: {args.hosts}ホスト × {args.ports}ポート ({size_mb:.1f}MB)")
+        for name, parse in parsers:
+            if args.parser != 'all' and args.parser != name:
+                continue
+            if name == 'python-nmap' and importlib.util.find_spec('nmap') is None:
+                print(f"[{name}] スキップ: python-nmap がインストールされていません（pip install python-nmap）")
+                continue
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                found = parse(path)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            # ピークメモリは計測のオーバーヘッドが大きいため、時間とは別に1回だけ計測する
+            tracemalloc.start()
+            try:
+                parse(path)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            print(f"[{name}] ポート {found}個 / 最速 {best:.3f}秒 / ピークメモリ {peak / 1024 / 1024:.1f}MB (試行 {args.repeat}回)")
+    finally:
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LocalNetScan ベンチマーク')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    discovery = subparsers.add_parser('discovery', help='ホスト検出エンジンの比較')
+    discovery.add_argument('--target', default='127.0.0.0/22', help='スキャン対象（デフォルト: 127.0.0.0/22）')
+    discovery.add_argument('--engine', default='all', choices=('all',) + SCAN_ENGINES, help='計測するエンジン')
+    discovery.add_argument('--repeat', type=int, default=1, help='試行回数')
+    discovery.set_defaults(func=bench_discovery)
+
+    ports = subparsers.add_parser('ports', help='ポート検出エンジンの比較（127.0.0.1 の全ポート）')
+    ports.add_argument('--engine', default='all', choices=('all',) + PORT_SCAN_ENGINES, help='計測するエンジン')
+    ports.add_argument('--listeners', type=int, default=10, help='ループバックで待ち受けるポート数')
+    ports.add_argument('--repeat', type=int, default=1, help='試行回数')
+    ports.set_defaults(func=bench_ports)
+
+    xml = subparsers.add_parser('xml', help='nmap XML出力のパーサーの比較（合成した大きなXMLファイル）')
+    xml.add_argument('--hosts', type=int, default=16384, help='XMLに含めるホスト数')
+    xml.add_argument('--ports', type=int, default=10, help='1ホストあたりの開いたポート数')
+    xml.add_argument('--parser', default='all',
+                     choices=('all', 'iter_nmap_xml', 'ElementTree.fromstring', 'python-nmap'), help='計測するパーサー')
+    xml.add_argument('--repeat', type=int, default=1, help='試行回数')
+    xml.set_defaults(func=bench_xml)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
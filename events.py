@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+スキャンスレッドからブラウザへイベントを配信するモジュール（Server-Sent Events用）
+"""
+
+import json
+import queue
+import threading
+from typing import Dict, Iterator, Optional
+
+
+# 購読者ごとのキューの上限（読み出しが追いつかない購読者は古いイベントから捨てる）
+SUBSCRIBER_QUEUE_SIZE = 1000
+# 接続維持のためのコメント送信間隔（秒）
+KEEPALIVE_INTERVAL = 15
+
+
+class EventBroker:
+    """
+    スキャンイベントを全購読者へ配信するブローカー
+
+    publish() はスキャンスレッドから呼ばれ、購読者ごとのキューに積むだけなので
+    スキャンを待たせることはない。購読者（/api/events の接続）は stream() で
+    SSE形式の文字列を受け取る。
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> queue.Queue:
+        """購読を開始し、イベントが積まれるキューを返す"""
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        """購読を終了"""
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event: str, data: Dict):
+        """
+        イベントを全購読者に配信
+
+        Args:
+            event: イベント名（例: "host_found"）
+            data: イベントデータ（JSONに変換できる辞書）
+        """
+        message = format_sse(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # 読み出しが止まっている購読者は最も古いイベントを捨てて追加する
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    pass
+
+    def stream(self, initial: Optional[Dict[str, Dict]] = None) -> Iterator[str]:
+        """
+        SSE形式のイベントを順に返すジェネレータ（接続が切れるまで続く）
+
+        Args:
+            initial: 接続直後に送るイベント（キー: イベント名、値: データ）。途中から接続した
+                     ブラウザが現在の状態に追いつくために使う
+        """
+        subscriber = self.subscribe()
+        try:
+            for event, data in (initial or {}).items():
+                yield format_sse(event, data)
+            while True:
+                try:
+                    yield subscriber.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """イベントをSSEのメッセージ形式に変換"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
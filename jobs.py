@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+スキャンジョブを管理するモジュール（ジョブID・優先度・同時実行数の制御）
+"""
+
+import heapq
+import itertools
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from scanner import CancelToken, PRIORITY_BULK, PRIORITY_NORMAL
+
+
+# 同時に実行するジョブ数の上限（デフォルト）
+DEFAULT_MAX_RUNNING_JOBS = 4
+# 終了したジョブを保持する件数（古いものから破棄する）
+JOB_HISTORY_LIMIT = 100
+# ジョブの状態
+JOB_STATES = ('queued', 'running', 'done', 'cancelled', 'error')
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ScanJob:
+    """
+    1つのスキャンジョブ（ネットワークスキャン・ポートスキャン・ポートスイープ）
+
+    status はジョブの処理が更新する進捗（/api/scan-status などと同じ形式）、
+    result は処理の戻り値。cancel_token はジョブの優先度を持ち、nmapの実行枠を待つ順序にも使われる。
+    """
+
+    def __init__(self, kind: str, run: Callable, priority: int = PRIORITY_NORMAL, params: Optional[Dict] = None,
+                 status: Optional[Dict] = None):
+        """
+        ジョブの作成
+
+        Args:
+            kind: ジョブの種類（'scan'、'port_scan'、'port_sweep'）
+            run: ジョブ本体（ジョブを引数に呼ばれ、戻り値が result になる）
+            priority: 優先度（scanner.PRIORITY_INTERACTIVE などの値が小さいほど先に実行）
+            params: ジョブの指定内容（対象ホストなど、一覧表示・検索用）
+            status: 進捗の初期値
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.priority = priority
+        self.params = params or {}
+        self.status = status if status is not None else {}
+        self.state = 'queued'
+        self.result = None
+        self.error = None
+        self.cancel_token = CancelToken(priority)
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self._run = run
+
+    def is_active(self) -> bool:
+        """待機中または実行中の場合True"""
+        return self.state in ('queued', 'running')
+
+    def snapshot(self, include_result: bool = False) -> Dict:
+        """
+        ジョブの状態のコピー（APIレスポンス・job イベント用）
+
+        Args:
+            include_result: result も含める場合True
+        """
+        snapshot = {
+            'id': self.id,
+            'kind': self.kind,
+            'priority': self.priority,
+            'state': self.state,
+            'params': dict(self.params),
+            'status': dict(self.status),
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if include_result:
+            snapshot['result'] = self.result
+        return snapshot
+
+
+class JobManager:
+    """
+    スキャンジョブのスケジューラ
+
+    ジョブは優先度の高い順（同じ優先度なら投入順）に開始し、同時に max_running 件まで実行する。
+    ポートスイープなどの一括処理（PRIORITY_BULK）は max_running - 1 件までに抑え、
+    一括処理が実行中でも優先ポートスキャンなどのジョブがすぐに開始できる枠を残す。
+    実行中のジョブ同士はnmapプロセスの実行枠（NmapProcessBudget）を共有し、枠も優先度順に割り当てられる。
+    """
+
+    def __init__(self, max_running: int = DEFAULT_MAX_RUNNING_JOBS, on_change: Optional[Callable] = None,
+                 history_limit: int = JOB_HISTORY_LIMIT):
+        """
+        スケジューラの初期化
+
+        Args:
+            max_running: 同時に実行するジョブ数の上限
+            on_change: ジョブの状態（queued → running → done など）が変わるたびにジョブを引数に呼ばれる
+            history_limit: 終了したジョブを保持する件数
+        """
+        self.max_running = max(1, max_running)
+        self.history_limit = history_limit
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        # (優先度, 投入順, ジョブ) のヒープ
+        self._pending = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._running_bulk = 0
+
+    def submit(self, kind: str, run: Callable, priority: int = PRIORITY_NORMAL, params: Optional[Dict] = None,
+               status: Optional[Dict] = None) -> ScanJob:
+        """
+        ジョブを投入（実行枠が空いていればすぐに開始）
+
+        Args:
+            kind, run, priority, params, status: ScanJob を参照
+
+        Returns:
+            ScanJob: 投入したジョブ
+        """
+        job = ScanJob(kind, run, priority, params, status)
+        with self._lock:
+            self._jobs[job.id] = job
+            heapq.heappush(self._pending, (job.priority, next(self._sequence), job))
+            self._discard_history()
+            startable = self._take_startable()
+        self._notify(job)
+        for next_job in startable:
+            self._start(next_job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ScanJob]:
+        """ジョブIDからジョブを取得（見つからない場合None）"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, kind: Optional[str] = None, active_only: bool = False) -> List[ScanJob]:
+        """
+        ジョブの一覧を投入順に取得
+
+        Args:
+            kind: 指定した種類のジョブのみ
+            active_only: 待機中・実行中のジョブのみ
+        """
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [
+            job for job in jobs
+            if (kind is None or job.kind == kind) and (not active_only or job.is_active())
+        ]
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        ジョブをキャンセル
+
+        実行中のジョブは cancel_token を通して実行中のnmapを終了する。待機中のジョブは実行枠を
+        待たずに開始し、各処理のキャンセル時の経路（途中結果の保存・通知）で終了させる。
+
+        Returns:
+            bool: 待機中・実行中のジョブをキャンセルした場合True
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.is_active() or job.cancel_token.is_cancelled():
+                return False
+            queued = job.state == 'queued'
+            if queued:
+                self._pending = [entry for entry in self._pending if entry[2] is not job]
+                heapq.heapify(self._pending)
+                job.state = 'running'
+        job.cancel_token.cancel()
+        if queued:
+            # 実行枠の数には含めない（キャンセル済みのため、すぐに終わる）
+            self._start(job, counted=False)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """
+        現在の実行状況を取得
+
+        Returns:
+            Dict: {'limit': 同時実行数の上限, 'running': 実行中, 'queued': 待機中}
+        """
+        with self._lock:
+            return {'limit': self.max_running, 'running': self._running, 'queued': len(self._pending)}
+
+    def _take_startable(self) -> List[ScanJob]:
+        """開始できるジョブを優先度順に取り出して実行中にする（_lock を保持して呼ぶこと）"""
+        startable = []
+        while self._pending and self._running < self.max_running:
+            job = self._pending[0][2]
+            bulk = job.priority >= PRIORITY_BULK
+            if bulk and self.max_running > 1 and self._running_bulk >= self.max_running - 1:
+                # ヒープの先頭が一括処理なら、待機中のジョブは全て一括処理
+                break
+            heapq.heappop(self._pending)
+            self._running += 1
+            if bulk:
+                self._running_bulk += 1
+            job.state = 'running'
+            startable.append(job)
+        return startable
+
+    def _start(self, job: ScanJob, counted: bool = True):
+        thread = threading.Thread(target=self._run_job, args=(job, counted))
+        thread.daemon = True
+        thread.start()
+
+    def _run_job(self, job: ScanJob, counted: bool):
+        """ジョブを実行し、終了後に待機中のジョブを開始"""
+        job.started_at = _now()
+        self._notify(job)
+        try:
+            job.result = job._run(job)
+            job.state = 'cancelled' if job.cancel_token.is_cancelled() else 'done'
+        except Exception as e:
+            # エラーの表示は各ジョブの処理が行う
+            job.error = str(e)
+            job.state = 'error'
+        finally:
+            job.finished_at = _now()
+            with self._lock:
+                if counted:
+                    self._running -= 1
+                    if job.priority >= PRIORITY_BULK:
+                        self._running_bulk -= 1
+                self._discard_history()
+                startable = self._take_startable()
+            self._notify(job)
+            for next_job in startable:
+                self._start(next_job)
+
+    def _discard_history(self):
+        """終了したジョブが history_limit 件を超えたら古いものから破棄（_lock を保持して呼ぶこと）"""
+        finished = [job_id for job_id, job in self._jobs.items() if not job.is_active()]
+        for job_id in finished[:max(0, len(finished) - self.history_limit)]:
+            del self._jobs[job_id]
+
+    def _notify(self, job: ScanJob):
+        if self._on_change is not None:
+            try:
+                self._on_change(job)
+            except Exception as e:
+                print(f"ジョブ通知エラー: {e}")
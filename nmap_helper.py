@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+root権限でnmapを実行する常駐ヘルパー（scanner.PrivilegedNmapHelper が sudo 経由で1回だけ起動する）
+
+標準入力から1行1件のJSONで要求を受け取り、応答を1行1件のJSONで標準出力に返す。
+
+    要求:   {"id": 1, "args": ["-sS", "-p", "22,80", "192.168.0.1"]}   nmap -oX - <args> を実行
+            {"id": 1, "cancel": true}                                  実行中のnmapを終了
+    応答:   {"ready": true}                                            起動完了（最初に1回）
+            {"id": 1, "xml": "..."}                                    nmapのXML出力（届いた順に分割して送る）
+            {"id": 1, "exit": 0, "stderr": "..."}                      nmapの終了
+
+標準入力が閉じられる（アプリケーションが終了する）と、実行中のnmapを全て終了して自身も終了する。
+root権限で実行するため、args は check_nmap_args の許可リストに含まれるオプションとターゲットに限る。
+"""
+
+import codecs
+import json
+import subprocess
+import sys
+import threading
+
+# XML出力を読み取る単位（バイト）
+READ_SIZE = 65536
+
+# root権限で実行してよい値を取らないオプション
+ALLOWED_FLAGS = frozenset([
+    '-sS', '-sT', '-sU', '-sA', '-sW', '-sM', '-sN', '-sF', '-sX', '-sY', '-sZ', '-sO', '-sn', '-sL', '-sV',
+    '-O', '-Pn', '-PE', '-PP', '-PM', '-PR', '-n', '-R', '-F', '-r', '-6', '-v', '-vv',
+    '--open', '--reason', '--traceroute', '--osscan-limit', '--osscan-guess', '--version-light', '--version-all',
+    '--packet-trace', '--send-eth', '--send-ip', '--system-dns', '--disable-arp-ping', '--allports',
+])
+# 値を取るオプション（"--max-rate 100" と "--max-rate=100" のどちらでも指定できる）
+ALLOWED_VALUE_OPTIONS = frozenset([
+    '-p', '-T', '-e', '-g', '--top-ports', '--port-ratio', '--exclude-ports', '--exclude', '--host-timeout',
+    '--min-rate', '--max-rate', '--max-retries', '--min-parallelism', '--max-parallelism', '--min-hostgroup',
+    '--max-hostgroup', '--min-rtt-timeout', '--max-rtt-timeout', '--initial-rtt-timeout', '--scan-delay',
+    '--max-scan-delay', '--version-intensity', '--stats-every', '--max-os-tries', '--source-port', '--ttl',
+    '--data-length', '--dns-servers',
+])
+# 値を続けて書けるオプション（例: -p22,80 / -T4 / -PS22,443）
+ATTACHED_VALUE_OPTIONS = ('-p', '-T', '-e', '-g', '-PS', '-PA', '-PU', '-PY', '-PO')
+# root権限で任意のファイルの読み書き・スクリプトの実行ができるオプション（エラーメッセージを分けるため明示する）
+DENIED_OPTIONS = ('-o', '--script', '-sC', '-A', '--datadir', '--servicedb', '--versiondb', '-iL', '-iR',
+                  '--excludefile', '--resume', '--stylesheet', '--append-output')
+
+_write_lock = threading.Lock()
+_processes = {}
+_processes_lock = threading.Lock()
+
+
+def send(message):
+    """応答を1行のJSONとして書き込む（複数のスキャンスレッドから呼ばれる）"""
+    line = json.dumps(message, ensure_ascii=False) + '\n'
+    with _write_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def check_nmap_args(args):
+    """
+    root権限で実行するnmapの引数を検査
+
+    Returns:
+        str: 許可されていない引数がある場合はエラーメッセージ（問題がなければNone）
+    """
+    if not isinstance(args, list) or not all(isinstance(arg, str) for arg in args):
+        return 'args は文字列のリストで指定してください'
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        index += 1
+        if not arg.startswith('-'):
+            # スキャン対象
+            continue
+        if arg.startswith(DENIED_OPTIONS):
+            return f"root権限では使用できないオプションです: {arg}"
+        name, separator, _ = arg.partition('=') if arg.startswith('--') else (arg, '', '')
+        if name in ALLOWED_FLAGS and not separator:
+            continue
+        if name in ALLOWED_VALUE_OPTIONS:
+            if not separator:
+                if index >= len(args):
+                    return f"オプションの値がありません: {arg}"
+                index += 1
+            continue
+        if any(arg.startswith(option) and len(arg) > len(option) for option in ATTACHED_VALUE_OPTIONS):
+            continue
+        return f"許可されていないオプションです: {arg}"
+    return None
+
+
+def run_scan(request_id, args):
+    """nmapを実行し、XML出力を逐次送る"""
+    try:
+        process = subprocess.Popen(['nmap', '-oX', '-'] + args, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        send({'id': request_id, 'exit': -1, 'stderr': str(e)})
+        return
+    with _processes_lock:
+        _processes[request_id] = process
+
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()))
+    stderr_thread.daemon = True
+    stderr_thread.start()
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        while True:
+            data = process.stdout.read1(READ_SIZE)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                send({'id': request_id, 'xml': text})
+        text = decoder.decode(b'', final=True)
+        if text:
+            send({'id': request_id, 'xml': text})
+        returncode = process.wait()
+        stderr_thread.join()
+        stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+        send({'id': request_id, 'exit': returncode, 'stderr': stderr})
+    finally:
+        with _processes_lock:
+            _processes.pop(request_id, None)
+
+
+def cancel_scan(request_id):
+    """実行中のnmapに終了要求（SIGTERM）を送る"""
+    with _processes_lock:
+        process = _processes.get(request_id)
+    if process is not None and process.poll() is None:
+        process.terminate()
+
+
+def main():
+    send({'ready': True})
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+        except ValueError:
+            # sudo の認証がキャッシュされていた場合、読まれなかったパスワードの行が届く（読み捨てる）
+            continue
+        if not isinstance(request, dict) or 'id' not in request:
+            continue
+        if request.get('cancel'):
+            cancel_scan(request['id'])
+            continue
+        args = request.get('args')
+        error = check_nmap_args(args)
+        if error is not None:
+            send({'id': request['id'], 'exit': -1, 'stderr': error})
+            continue
+        thread = threading.Thread(target=run_scan, args=(request['id'], args))
+        thread.daemon = True
+        thread.start()
+
+    # アプリケーションが終了した（標準入力が閉じられた）
+    with _processes_lock:
+        processes = list(_processes.values())
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,37 +3,2732 @@
 ネットワークスキャン機能を提供するモジュール
 """
 
-import nmap
+import os
+import shutil
 import socket
 import subprocess
+import shlex
 import re
 import platform
+import queue
+import asyncio
+import errno
+import hashlib
+import heapq
+import bisect
+import itertools
+import ipaddress
+import json
+import ssl
+import struct
+import sys
+import time
 import requests
 import networkx as nx
-from typing import List, Dict, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import xml.etree.ElementTree as ET
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 import threading
 
 # SSL警告を抑制（自己署名証明書のHTTPSアクセス時）
 import urllib3
+
+from nmap_helper import check_nmap_args
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# ホスト検出エンジン
+#   nmap:        チャンクごとに nmap -sn を並列実行
+#   nmap-stream: 1つのnmapプロセスでスキャンし、XML出力を逐次パースしてホストを即時通知
+#   async:       asyncio TCPコネクト（nmap不要）
+SCAN_ENGINES = ('nmap', 'nmap-stream', 'async')
+
+# 全ポートスキャン第1段階（ポート検出）のエンジン
+#   nmap:  ポート範囲ごとに nmap -sT --open を並列実行
+#   async: asyncio TCPコネクト（nmap不要、同時接続数を自動調整）
+PORT_SCAN_ENGINES = ('nmap', 'async')
+
+# 全ポートスキャン第1段階（nmapエンジン）の作業単位のポート数と、作業単位を取り出すワーカー数（デフォルト）
+# 小さな作業単位を共有キューから取り出すため、遅い範囲（パケットを落とすファイアウォール等）が
+# あっても他のワーカーが残りを引き受け、進捗も作業単位ごとに細かく進む
+PORT_SCAN_UNIT_SIZE = 1024
+DEFAULT_PORT_SCAN_WORKERS = 6
+MAX_PORT_SCAN_WORKERS = 32
+# ポートスイープ（複数ホストの全ポートスキャン）の作業単位のポート数とワーカー数（デフォルト）
+PORT_SWEEP_UNIT_SIZE = 4096
+DEFAULT_PORT_SWEEP_WORKERS = 8
+
+# 優先ポートスキャンの対象（スキャン履歴がない場合の既定値）
+DEFAULT_PRIORITY_PORTS = [80, 8080, 5000, 5001, 5050, 3000, 3001]
+# 優先ポートスキャンの最大ポート数（このホストで過去に開いていたポートは上限を超えても全て含める）
+PRIORITY_PORT_LIMIT = 20
+# 全ポートスキャンで先に調べる優先ポート（スキャン履歴から選んだもの）の作業単位のポート数
+# 小さな単位にして、履歴上よく開いているポートの結果がスキャン開始直後に届くようにする
+PRIORITY_UNIT_SIZE = 64
+
+# Pingスキャンのnmap引数
+# -sn: PINGスキャン（ポートスキャンなし）
+# -T4: 高速タイミング（aggressive）
+# --min-rate 300: 1秒あたり最低300パケット送信
+# --host-timeout 10s: ホストごとのタイムアウト10秒
+# --max-retries 1: 再試行回数を1回に制限
+PING_SCAN_ARGUMENTS = '-sn -T4 --min-rate 300 --host-timeout 10s --max-retries 1'
+
+# asyncioホスト検出で使用するプローブ先ポート（RSTが返れば生存とみなす）
+DISCOVERY_PORTS = [80, 443, 22, 445, 139, 3389, 8080, 5000]
+# asyncioホスト検出でローカル資源の枯渇（EMFILE等）により接続できなかった場合の再試行回数
+DISCOVERY_RESOURCE_RETRIES = 3
+
+# チャンク分割の設定（1チャンクあたりのアドレス数の下限・上限と、1スレッドあたりの目標チャンク数）
+CHUNK_MIN_ADDRESSES = 32     # /27
+CHUNK_MAX_ADDRESSES = 256    # /24
+CHUNKS_PER_WORKER = 4
+
+_IP_RANGE_PATTERN = re.compile(r'^(\d+\.\d+\.\d+\.\d+)\s*-\s*(\d+\.\d+\.\d+\.\d+)$')
+
+
+def _parse_octet(spec: str) -> List[int]:
+    """
+    nmap形式のオクテット指定を値のリストに変換（例: "1-50" → [1, ..., 50]、"*" → [0, ..., 255]）
+    """
+    if spec == '*':
+        return list(range(256))
+    if '-' in spec:
+        low, high = spec.split('-', 1)
+        low = int(low) if low else 0
+        high = int(high) if high else 255
+    else:
+        low = high = int(spec)
+    if not (0 <= low <= high <= 255):
+        raise ValueError(f"不正なオクテット指定です: {spec}")
+    return list(range(low, high + 1))
+
+
+def _parse_target_intervals(target: str, hosts_only: bool = False) -> List[tuple]:
+    """
+    スキャン対象文字列を整数表現のアドレス区間リストに変換
+
+    Args:
+        target: 以下のいずれか
+            - サブネット形式: "192.168.0.0/20"
+            - IP範囲形式: "192.168.0.1-192.168.3.50"
+            - nmapオクテット範囲形式: "192.168.0.1-50"、"10.0.0-3.*"
+            - 単一IP: "192.168.0.1"
+        hosts_only: True の場合、/30 以上に広いサブネットのネットワークアドレスと
+                    ブロードキャストアドレスを除く（ipaddress の hosts() と同じ）。
+                    除外範囲の解釈では False にして、サブネット全体を除外する
+
+    Returns:
+        List[tuple]: 昇順・隣接区間を結合済みの (開始, 終了) のリスト（両端を含む）
+
+    Raises:
+        ValueError: 解釈できない形式の場合
+    """
+    target = target.strip()
+
+    if '/' in target:
+        network = ipaddress.IPv4Network(target, strict=False)
+        start, end = int(network.network_address), int(network.broadcast_address)
+        if hosts_only and network.prefixlen <= 30:
+            start, end = start + 1, end - 1
+        return [(start, end)]
+
+    match = _IP_RANGE_PATTERN.match(target)
+    if match:
+        start = int(ipaddress.IPv4Address(match.group(1)))
+        end = int(ipaddress.IPv4Address(match.group(2)))
+        if start > end:
+            raise ValueError(f"範囲の開始が終了より大きいです: {target}")
+        return [(start, end)]
+
+    octets = target.split('.')
+    if len(octets) != 4:
+        raise ValueError(f"不正なスキャン対象です: {target}")
+    first, second, third, last = [_parse_octet(octet) for octet in octets]
+
+    # 最終オクテットは連続区間になるので、上位3オクテットの組み合わせごとに区間を作る
+    intervals = []
+    for a in first:
+        for b in second:
+            for c in third:
+                base = (a << 24) | (b << 16) | (c << 8)
+                start, end = base | last[0], base | last[-1]
+                if intervals and intervals[-1][1] + 1 == start:
+                    # 直前の区間と隣接している場合は結合（例: "10.0.0-3.*" → 1区間）
+                    intervals[-1] = (intervals[-1][0], end)
+                else:
+                    intervals.append((start, end))
+    return intervals
+
+
+def _interval_to_nmap_target(start: int, end: int) -> str:
+    """
+    アドレス区間をnmapのターゲット指定文字列に変換
+
+    整列済みのブロックはCIDR、同一/24内はオクテット範囲、それ以外はスペース区切りのCIDR列にする。
+    """
+    if start == end:
+        return str(ipaddress.IPv4Address(start))
+
+    networks = list(ipaddress.summarize_address_range(ipaddress.IPv4Address(start), ipaddress.IPv4Address(end)))
+    if len(networks) == 1:
+        return str(networks[0])
+
+    if start >> 8 == end >> 8:
+        base = str(ipaddress.IPv4Address(start)).rsplit('.', 1)[0]
+        return f"{base}.{start & 0xFF}-{end & 0xFF}"
+
+    return ' '.join(str(network) for network in networks)
+
+
+def _plan_chunk_size(total_addresses: int, workers: int) -> int:
+    """
+    スレッド数と総アドレス数から1チャンクあたりのアドレス数を決定
+
+    各スレッドに CHUNKS_PER_WORKER 個程度のチャンクが行き渡る2の累乗サイズを選び、
+    CHUNK_MIN_ADDRESSES〜CHUNK_MAX_ADDRESSES の範囲に収める。
+
+    Returns:
+        int: 1チャンクあたりのアドレス数（2の累乗）
+    """
+    target_chunks = max(1, workers * CHUNKS_PER_WORKER)
+    ideal = -(-total_addresses // target_chunks)  # 切り上げ除算
+    size = 1 << max(0, ideal - 1).bit_length()
+    return max(CHUNK_MIN_ADDRESSES, min(CHUNK_MAX_ADDRESSES, size))
+
+
+def _with_label(items, label: str) -> Iterator[tuple]:
+    """各要素を (要素, ラベル) の組にして返す（遅延評価）"""
+    for item in items:
+        yield item, label
+
+
+def _round_robin(iterables: List) -> Iterator:
+    """
+    複数のイテレータから1要素ずつ交互に取り出す（遅延評価）
+
+    複数範囲を1つの作業キューにまとめる際、小さな範囲が大きな範囲の後ろで待たされないようにする。
+    """
+    iterators = deque(iter(iterable) for iterable in iterables)
+    while iterators:
+        iterator = iterators.popleft()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            continue
+        yield item
+        iterators.append(iterator)
+
+
+def _merge_intervals(intervals: List[tuple]) -> List[tuple]:
+    """
+    アドレス区間を昇順に並べ、重なり・隣接する区間を結合
+
+    Args:
+        intervals: (開始, 終了) のリスト（両端を含む）
+
+    Returns:
+        List[tuple]: 互いに素で昇順の区間リスト
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _subtract_intervals(intervals: List[tuple], removals: List[tuple]) -> List[tuple]:
+    """
+    区間集合から別の区間集合を取り除く（どちらも _merge_intervals 済みであること）
+
+    Returns:
+        List[tuple]: intervals − removals
+    """
+    result = []
+    index = 0
+    for start, end in intervals:
+        current = start
+        # この区間より手前で終わる除外区間は読み飛ばす
+        while index < len(removals) and removals[index][1] < current:
+            index += 1
+        scan = index
+        while scan < len(removals) and removals[scan][0] <= end:
+            removal_start, removal_end = removals[scan]
+            if removal_start > current:
+                result.append((current, removal_start - 1))
+            current = max(current, removal_end + 1)
+            if current > end:
+                break
+            scan += 1
+        if current <= end:
+            result.append((current, end))
+    return result
+
+
+def _iter_interval_addresses(intervals: List[tuple]) -> Iterator[str]:
+    """アドレス区間に含まれるIPアドレスを順に返す（遅延評価）"""
+    for start, end in intervals:
+        for value in range(start, end + 1):
+            yield str(ipaddress.IPv4Address(value))
+
+
+def _split_intervals_into_chunks(intervals: List[tuple], chunk_size: int) -> Iterator[str]:
+    """
+    アドレス区間を chunk_size 境界で区切り、nmapのターゲット指定文字列として返す（遅延評価）
+    """
+    for start, end in intervals:
+        current = start
+        while current <= end:
+            # チャンク境界をchunk_sizeに揃えて、できるだけCIDR表記にする
+            chunk_end = min(end, (current // chunk_size + 1) * chunk_size - 1)
+            yield _interval_to_nmap_target(current, chunk_end)
+            current = chunk_end + 1
+
+
+def _count_interval_chunks(intervals: List[tuple], chunk_size: int) -> int:
+    """_split_intervals_into_chunks が生成するチャンク数を展開せずに計算"""
+    return sum(end // chunk_size - start // chunk_size + 1 for start, end in intervals)
+
+
+def split_port_range(start: int, end: int, unit_size: int = PORT_SCAN_UNIT_SIZE) -> List[tuple]:
+    """
+    ポート範囲を作業単位に分割
+
+    Args:
+        start: 開始ポート
+        end: 終了ポート（含む）
+        unit_size: 1作業単位のポート数
+
+    Returns:
+        List[tuple]: (開始ポート, 終了ポート) のリスト
+    """
+    return [(low, min(end, low + unit_size - 1)) for low in range(start, end + 1, unit_size)]
+
+
+def select_priority_ports(host_ports: List[int], ranked_ports: List[int],
+                          limit: int = PRIORITY_PORT_LIMIT) -> List[int]:
+    """
+    スキャン履歴から優先ポートスキャンの対象を選ぶ
+
+    1. このホストで過去に開いていたポート（全て）
+    2. スキャン履歴全体で開いていることの多いポート
+    3. 既定の優先ポート（DEFAULT_PRIORITY_PORTS）
+    の順に、重複を除いて limit 個まで並べる。
+
+    Args:
+        host_ports: このホストで過去に開いていたポート
+        ranked_ports: スキャン履歴全体で開いていることの多い順のポート
+        limit: 最大ポート数
+
+    Returns:
+        List[int]: 優先ポートのリスト（調べる順）
+    """
+    ports = list(dict.fromkeys(host_ports))
+    for port in list(ranked_ports) + DEFAULT_PRIORITY_PORTS:
+        if len(ports) >= limit:
+            break
+        if port not in ports:
+            ports.append(port)
+    return ports
+
+
+def order_ports(priority_ports: List[int], start: int = 1, end: int = 65535) -> List[int]:
+    """
+    ポート範囲を優先ポート → 残り（番号順）の順に並べる
+
+    Args:
+        priority_ports: 先に調べるポート（この順に並べる、範囲外は無視）
+        start: 開始ポート
+        end: 終了ポート（含む）
+
+    Returns:
+        List[int]: 並べ替えたポートのリスト
+    """
+    first = [port for port in dict.fromkeys(priority_ports) if start <= port <= end]
+    skip = set(first)
+    return first + [port for port in range(start, end + 1) if port not in skip]
+
+
+def plan_port_units(priority_ports: List[int], start: int = 1, end: int = 65535,
+                    unit_size: int = PORT_SCAN_UNIT_SIZE,
+                    priority_unit_size: int = PRIORITY_UNIT_SIZE) -> List[List[tuple]]:
+    """
+    ポート範囲を作業単位に分割（優先ポートの作業単位を先頭に置く）
+
+    優先ポートは priority_unit_size 個ずつの作業単位にして先頭に置き、残りの範囲は
+    split_port_range と同じく番号順に unit_size 個ずつ分割する（優先ポートは除く）。
+
+    Args:
+        priority_ports: 先に調べるポート（この順に並べる、範囲外は無視）
+        start: 開始ポート
+        end: 終了ポート（含む）
+        unit_size: 1作業単位のポート数
+        priority_unit_size: 優先ポートの1作業単位のポート数
+
+    Returns:
+        List[List[tuple]]: 作業単位のリスト。各作業単位は (開始ポート, 終了ポート) のリスト
+    """
+    first = [port for port in dict.fromkeys(priority_ports) if start <= port <= end]
+    units = [
+        [(port, port) for port in first[index:index + priority_unit_size]]
+        for index in range(0, len(first), priority_unit_size)
+    ]
+    skip = sorted(first)
+    for low, high in split_port_range(start, end, unit_size):
+        intervals = []
+        cursor = low
+        for port in skip[bisect.bisect_left(skip, low):bisect.bisect_right(skip, high)]:
+            if cursor < port:
+                intervals.append((cursor, port - 1))
+            cursor = port + 1
+        if cursor <= high:
+            intervals.append((cursor, high))
+        if intervals:
+            units.append(intervals)
+    return units
+
+
+def format_port_spec(intervals: List[tuple]) -> str:
+    """
+    作業単位を nmap の -p 形式に変換
+
+    Args:
+        intervals: (開始ポート, 終了ポート) のリスト
+
+    Returns:
+        str: "22,80,1000-2047" のような文字列
+    """
+    return ','.join(str(low) if low == high else f"{low}-{high}" for low, high in intervals)
+
+
+def count_unit_ports(intervals: List[tuple]) -> int:
+    """作業単位のポート数"""
+    return sum(high - low + 1 for low, high in intervals)
+
+
+def _split_target_spec(spec) -> List[str]:
+    """
+    カンマ区切り文字列（または文字列のリスト）をスキャン対象のリストに分割
+
+    Args:
+        spec: "192.168.0.0/24,172.17.0.0/16" のような文字列、またはそのリスト
+
+    Returns:
+        List[str]: 空要素を除いたスキャン対象のリスト
+
+    Raises:
+        ValueError: 文字列・文字列のリスト以外が指定された場合
+    """
+    if spec is None or spec == '' or spec == [] or spec == ():
+        return []
+    if isinstance(spec, str):
+        items = re.split(r'[,\n]', spec)
+    elif isinstance(spec, (list, tuple)):
+        items = spec
+        for item in items:
+            if not isinstance(item, str):
+                raise ValueError(f"範囲は文字列で指定してください: {item!r}")
+    else:
+        raise ValueError(f"範囲は文字列または文字列のリストで指定してください: {spec!r}")
+    return [item.strip() for item in items if item.strip()]
+
+
+class CompiledTargets:
+    """
+    スキャン対象のコンパイル結果
+
+    CIDR・IP範囲・nmapオクテット範囲・それらのリストを、重複を取り除いた
+    互いに素なアドレス区間の集合に変換し、除外範囲を差し引く。
+    同じアドレスが1つのジョブで2回プローブされることはない。
+    """
+
+    def __init__(self, targets: List[str], exclude=None):
+        """
+        スキャン対象をコンパイル
+
+        Args:
+            targets: スキャン対象のリストまたはカンマ区切り文字列（例: ["10.0.0.0/16", "10.0.5.0/24"]）
+            exclude: 除外する範囲のリストまたはカンマ区切り文字列（例: "10.0.0.10,10.0.1.0/24"）
+
+        Raises:
+            ValueError: 除外範囲が解釈できない場合、または文字列以外が指定された場合
+        """
+        # 除外範囲はアドレスとして解釈できなければエラー（除外漏れを防ぐ）
+        excluded = []
+        for item in _split_target_spec(exclude):
+            excluded.extend(_parse_target_intervals(item))
+        self.excluded = _merge_intervals(excluded)
+
+        # groups: (元のスキャン対象, その対象だけが担当する区間) のリスト
+        # 先に指定された対象が重複部分を担当し、後の対象からは取り除く
+        self.groups = []
+        # ホスト名など区間に変換できない対象はそのままnmapに渡す
+        self.unresolved = []
+        covered = []
+        for target in _split_target_spec(targets):
+            try:
+                intervals = _merge_intervals(_parse_target_intervals(target, hosts_only=True))
+            except ValueError:
+                if target not in self.unresolved:
+                    self.unresolved.append(target)
+                continue
+            remaining = _subtract_intervals(_subtract_intervals(intervals, covered), self.excluded)
+            covered = _merge_intervals(covered + intervals)
+            if remaining:
+                self.groups.append((target, remaining))
+
+        self._index = sorted(
+            (start, end, label) for label, intervals in self.groups for start, end in intervals
+        )
+        self._starts = [start for start, _, _ in self._index]
+
+    @property
+    def num_addresses(self) -> int:
+        """スキャン対象の総アドレス数（区間に変換できない対象は1件として数える）"""
+        return sum(end - start + 1 for _, intervals in self.groups for start, end in intervals) + len(self.unresolved)
+
+    @property
+    def num_excluded(self) -> int:
+        """除外範囲の総アドレス数"""
+        return sum(end - start + 1 for start, end in self.excluded)
+
+    def label_for(self, ip: str) -> Optional[str]:
+        """
+        IPアドレスを担当するスキャン対象を取得
+
+        Returns:
+            str: 元のスキャン対象文字列（対象外の場合None）
+        """
+        try:
+            value = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return None
+        position = bisect.bisect_right(self._starts, value) - 1
+        if position >= 0 and value <= self._index[position][1]:
+            return self._index[position][2]
+        return None
+
+    def iter_hosts(self) -> Iterator[tuple]:
+        """
+        全アドレスを (IPアドレス, スキャン対象) の組で返す（対象間はラウンドロビン）
+        """
+        return _round_robin([
+            _with_label(_iter_interval_addresses(intervals), label) for label, intervals in self.groups
+        ])
+
+    def iter_chunks(self, max_threads: int) -> Iterator[tuple]:
+        """
+        nmap用のチャンクを (チャンク, スキャン対象) の組で返す（対象間はラウンドロビン）
+
+        チャンクサイズは全対象の総アドレス数とスレッド数から決定する。
+        """
+        chunk_size = _plan_chunk_size(self.num_addresses, max_threads)
+        iterables = [
+            _with_label(_split_intervals_into_chunks(intervals, chunk_size), label)
+            for label, intervals in self.groups
+        ]
+        iterables.extend([(target, target)] for target in self.unresolved)
+        return _round_robin(iterables)
+
+    def count_chunks(self, max_threads: int) -> int:
+        """iter_chunks が生成するチャンク数を展開せずに計算"""
+        chunk_size = _plan_chunk_size(self.num_addresses, max_threads)
+        return sum(_count_interval_chunks(intervals, chunk_size) for _, intervals in self.groups) + len(self.unresolved)
+
+    def nmap_targets(self) -> List[str]:
+        """1つのnmapプロセスに渡すターゲット指定のリスト"""
+        targets = [
+            _interval_to_nmap_target(start, end) for _, intervals in self.groups for start, end in intervals
+        ]
+        return targets + self.unresolved
+
+
+def _parse_host_element(host_elem) -> Dict:
+    """
+    nmap XMLの <host> 要素からホスト情報（ポート・OS情報を含む）を取り出す
+
+    Args:
+        host_elem: <host> 要素
+
+    Returns:
+        Dict: iter_nmap_xml のホスト情報
+    """
+    status = host_elem.find('status')
+    record = {
+        'ip': None,
+        'state': status.get('state', 'unknown') if status is not None else 'unknown',
+        'hostname': 'Unknown',
+        'mac': '',
+        'vendor': '',
+        'ports': [],
+        'os': ''
+    }
+
+    for address in host_elem.findall('address'):
+        addrtype = address.get('addrtype')
+        if addrtype == 'ipv4' or (addrtype == 'ipv6' and record['ip'] is None):
+            record['ip'] = address.get('addr')
+        elif addrtype == 'mac':
+            record['mac'] = address.get('addr', '')
+            record['vendor'] = address.get('vendor', '')
+
+    hostname_elem = host_elem.find('hostnames/hostname')
+    if hostname_elem is not None and hostname_elem.get('name'):
+        record['hostname'] = hostname_elem.get('name')
+
+    for port_elem in host_elem.iterfind('ports/port'):
+        state_elem = port_elem.find('state')
+        if state_elem is None:
+            continue
+        service_elem = port_elem.find('service')
+        service = service_elem.attrib if service_elem is not None else {}
+        record['ports'].append({
+            'port': int(port_elem.get('portid')),
+            'protocol': port_elem.get('protocol'),
+            'state': state_elem.get('state'),
+            'service': service.get('name', ''),
+            'product': service.get('product', ''),
+            'version': service.get('version', '')
+        })
+
+    osmatch = host_elem.find('os/osmatch')
+    if osmatch is not None:
+        record['os'] = osmatch.get('name', '')
+    return record
+
+
+def iter_nmap_xml(chunks: Iterable) -> Iterator[tuple]:
+    """
+    nmapのXML出力（-oX -）を逐次パースし、<host> 要素・<taskprogress> 要素ごとにレコードを返す
+
+    ルート直下の要素は処理した時点でルートから外して破棄するため、ホスト数・ポート数が
+    増えてもメモリ使用量は1ホスト分で一定になる。全てのnmap実行経路（チャンクごとのPingスキャン・
+    ストリーミングPingスキャン・ポートスキャン・常駐ヘルパー）がこのパーサーを使う。
+
+    Args:
+        chunks: XML出力の断片（str または bytes、行単位・任意の長さで分割されていてよい）
+
+    Yields:
+        tuple: ('host', ホスト情報) または ('progress', 進捗率 0〜100)
+               ホスト情報は {'ip', 'state', 'hostname', 'mac', 'vendor', 'ports', 'os'}、
+               ports の要素は {'port', 'protocol', 'state', 'service', 'product', 'version'}
+
+    Raises:
+        xml.etree.ElementTree.ParseError: XMLが不正な場合、または途中で終わっている場合
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+    depth = 0
+    # 最後に None を渡してパーサーを閉じる（出力が途中で終わっていれば ParseError になる）
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            parser.close()
+        else:
+            parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            root.remove(elem)
+            if elem.tag == 'host':
+                yield 'host', _parse_host_element(elem)
+            elif elem.tag == 'taskprogress':
+                yield 'progress', float(elem.get('percent', 0))
+            elem.clear()
+
+
+def _collect_nmap_hosts(chunks: Iterable, on_record=None) -> tuple:
+    """
+    nmapのXML出力を逐次パースし、ホスト情報のリストを返す
+
+    XMLを読み取れなくなった場合も出力を最後まで読み進める（nmapがパイプへの書き込みで停止しないよう）。
+
+    Args:
+        chunks: XML出力の断片のイテラブル（iter_nmap_xml を参照）
+        on_record: レコードごとのコールバック関数 callback(kind, record)
+                   （指定した場合、ホスト情報はリストに溜めずにコールバックだけに渡す）
+
+    Returns:
+        tuple: (ホスト情報のリスト, ParseError または None)
+    """
+    chunks = iter(chunks)
+    hosts = []
+    try:
+        for kind, record in iter_nmap_xml(chunks):
+            if on_record is not None:
+                on_record(kind, record)
+            elif kind == 'host':
+                hosts.append(record)
+    except ET.ParseError as e:
+        for _ in chunks:
+            pass
+        return hosts, e
+    return hosts, None
+
+
+def _ping_host_info(record: Dict, subnet: str) -> Optional[tuple]:
+    """
+    iter_nmap_xml のホスト情報からPingスキャン結果を取り出す
+
+    Args:
+        record: ホスト情報
+        subnet: 結果に記録するサブネット
+
+    Returns:
+        tuple: (IPアドレス, ホスト情報)。ホストがupでない場合はNone
+    """
+    if record['state'] != 'up' or record['ip'] is None:
+        return None
+    return record['ip'], {
+        'hostname': record['hostname'],
+        'state': 'up',
+        'vendor': record['vendor'],
+        'subnet': subnet
+    }
+
+
+def _raise_fd_limit(wanted: int) -> int:
+    """
+    同時接続に必要なファイルディスクリプタ上限を可能な範囲で引き上げる
+
+    Args:
+        wanted: 希望する同時ソケット数
+
+    Returns:
+        int: 実際に使用できる同時ソケット数
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windowsではresourceモジュールがないため希望値をそのまま使う
+        return wanted
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    reserve = 64  # Flaskやnmap用に残しておく分
+    needed = wanted + reserve
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        new_soft = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
+            soft = new_soft
+        except (ValueError, OSError):
+            pass
+
+    if soft == resource.RLIM_INFINITY:
+        return wanted
+    return max(1, min(wanted, soft - reserve))
+
+
+# 近隣テーブル（ARP / NDP）の読み込み先
+PROC_NET_ARP = '/proc/net/arp'
+# 有効な近隣エントリとみなす `ip neigh` の状態（FAILED・INCOMPLETE は除く）
+NEIGHBOR_VALID_STATES = {'REACHABLE', 'STALE', 'DELAY', 'PROBE', 'PERMANENT', 'NOARP'}
+# nmapに同梱されているMACアドレスのベンダー（OUI）一覧
+NMAP_MAC_PREFIX_PATHS = [
+    '/usr/share/nmap/nmap-mac-prefixes',
+    '/usr/local/share/nmap/nmap-mac-prefixes',
+    '/opt/homebrew/share/nmap/nmap-mac-prefixes',
+]
+
+_MAC_PATTERN = re.compile(r'([0-9a-fA-F]{1,2}(?::[0-9a-fA-F]{1,2}){5})')
+_mac_vendors = None
+_mac_vendors_lock = threading.Lock()
+
+
+def _normalize_mac(mac: str) -> Optional[str]:
+    """MACアドレスを "AA:BB:CC:DD:EE:FF" 形式に正規化（無効なアドレスはNone）"""
+    parts = mac.split(':')
+    if len(parts) != 6:
+        return None
+    normalized = ':'.join(part.zfill(2).upper() for part in parts)
+    if normalized in ('00:00:00:00:00:00', 'FF:FF:FF:FF:FF:FF'):
+        return None
+    return normalized
+
+
+def _load_mac_vendors() -> Dict[str, str]:
+    """
+    nmap-mac-prefixes を読み込む（初回のみ。見つからない場合は空）
+
+    Returns:
+        Dict: キー: MACアドレス先頭の16進文字列（6〜9桁）、値: ベンダー名
+    """
+    global _mac_vendors
+    with _mac_vendors_lock:
+        if _mac_vendors is not None:
+            return _mac_vendors
+
+        vendors = {}
+        for path in NMAP_MAC_PREFIX_PATHS:
+            try:
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        if not line.strip() or line.startswith('#'):
+                            continue
+                        prefix, _, name = line.strip().partition(' ')
+                        vendors[prefix.upper()] = name.strip()
+                break
+            except OSError:
+                continue
+
+        _mac_vendors = vendors
+        return vendors
+
+
+def lookup_mac_vendor(mac: str) -> str:
+    """
+    MACアドレスからベンダー名を取得
+
+    Args:
+        mac: MACアドレス（例: "aa:bb:cc:dd:ee:ff"）
+
+    Returns:
+        str: ベンダー名（不明な場合は空文字）
+    """
+    vendors = _load_mac_vendors()
+    digits = mac.replace(':', '').upper()
+    # 長いプレフィックス（MA-S / MA-M）から順に照合
+    for length in (9, 7, 6):
+        name = vendors.get(digits[:length])
+        if name:
+            return name
+    return ''
+
+
+def read_neighbor_table() -> Dict[str, str]:
+    """
+    カーネルの近隣テーブルから、MACアドレスが解決済みのIPv4ホストを取得
+
+    Linuxでは /proc/net/arp と `ip neigh` を、その他のOSでは `arp -an` を読む。
+    パケットは送信しないため、数ミリ秒で完了する。
+
+    Returns:
+        Dict: キー: IPアドレス、値: MACアドレス
+    """
+    neighbors = {}
+
+    if platform.system() == 'Linux':
+        # /proc/net/arp（例: 192.168.0.1  0x1  0x2  aa:bb:cc:dd:ee:ff  *  eth0）
+        try:
+            with open(PROC_NET_ARP) as f:
+                next(f, None)  # ヘッダー行
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 4:
+                        continue
+                    ip, flags, mac = fields[0], fields[2], fields[3]
+                    # 0x2 (ATF_COM): MACアドレス解決済み
+                    if not int(flags, 16) & 0x2:
+                        continue
+                    mac = _normalize_mac(mac)
+                    if mac:
+                        neighbors[ip] = mac
+        except (OSError, ValueError):
+            pass
+
+        # ip neigh（例: 192.168.0.1 dev eth0 lladdr aa:bb:cc:dd:ee:ff REACHABLE）
+        try:
+            result = subprocess.run(['ip', '-4', 'neigh', 'show'], capture_output=True, text=True, timeout=2)
+            for line in result.stdout.splitlines():
+                fields = line.split()
+                if 'lladdr' not in fields or fields[-1] not in NEIGHBOR_VALID_STATES:
+                    continue
+                mac = _normalize_mac(fields[fields.index('lladdr') + 1])
+                if mac:
+                    neighbors.setdefault(fields[0], mac)
+        except (OSError, subprocess.SubprocessError, IndexError):
+            pass
+    else:
+        # arp -an（例: ? (192.168.0.1) at aa:bb:cc:dd:ee:ff on en0 ifscope [ethernet]）
+        try:
+            result = subprocess.run(['arp', '-an'], capture_output=True, text=True, timeout=2)
+            for line in result.stdout.splitlines():
+                ip_match = re.search(r'\((\d+\.\d+\.\d+\.\d+)\)', line)
+                mac_match = _MAC_PATTERN.search(line)
+                if ip_match and mac_match:
+                    mac = _normalize_mac(mac_match.group(1))
+                    if mac:
+                        neighbors[ip_match.group(1)] = mac
+        except (OSError, subprocess.SubprocessError):
+            pass
+
+    return neighbors
+
+
+# インターフェース情報の読み込み先（Linux）
+PROC_NET_ROUTE = '/proc/net/route'
+PROC_NET_FIB_TRIE = '/proc/net/fib_trie'
+# インターフェース情報のキャッシュ有効期間（秒）。インターフェースの増減を検知した場合は即座に無効化
+INTERFACE_CACHE_TTL = 30
+# RTF_UP / RTF_GATEWAY（/proc/net/route の Flags）
+_RTF_UP = 0x1
+_RTF_GATEWAY = 0x2
+
+
+def _proc_hex_to_ip(value: str) -> str:
+    """/proc/net/route のリトルエンディアン16進表記をIPアドレスに変換"""
+    return socket.inet_ntoa(struct.pack('<L', int(value, 16)))
+
+
+def _read_proc_routes() -> tuple:
+    """
+    /proc/net/route からオンリンクのネットワークとゲートウェイを取得
+
+    Returns:
+        tuple: (ネットワークのリスト [(インターフェース名, IPv4Network)],
+                ゲートウェイのリスト, デフォルトルートのインターフェース名)
+    """
+    networks = []
+    gateways = []
+    default_iface = None
+    with open(PROC_NET_ROUTE) as f:
+        next(f, None)  # ヘッダー行
+        for line in f:
+            fields = line.split()
+            if len(fields) < 8:
+                continue
+            iface, destination, gateway, flags, mask = fields[0], fields[1], fields[2], int(fields[3], 16), fields[7]
+            if not flags & _RTF_UP:
+                continue
+            if flags & _RTF_GATEWAY:
+                gateways.append(_proc_hex_to_ip(gateway))
+                if int(mask, 16) == 0 and default_iface is None:
+                    default_iface = iface
+            elif int(mask, 16) != 0:
+                network = ipaddress.IPv4Network(f"{_proc_hex_to_ip(destination)}/{_proc_hex_to_ip(mask)}", strict=False)
+                networks.append((iface, network))
+    return networks, gateways, default_iface
+
+
+def _read_proc_local_addresses() -> List[str]:
+    """/proc/net/fib_trie から、このマシンに割り当てられたIPv4アドレス（/32 host LOCAL）を取得"""
+    addresses = []
+    last_address = None
+    with open(PROC_NET_FIB_TRIE) as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith('|--'):
+                last_address = stripped[3:].strip()
+            elif stripped.startswith('/32 host LOCAL') and last_address:
+                if last_address not in addresses:
+                    addresses.append(last_address)
+    return addresses
+
+
+def _read_ifconfig_interfaces() -> List[tuple]:
+    """
+    ifconfig の出力からIPv4アドレスとプレフィックスを取得（/proc がないmacOS等）
+
+    Returns:
+        List[tuple]: [(インターフェース名, IPv4Interface)]
+    """
+    interfaces = []
+    iface = None
+    result = subprocess.run(['ifconfig'], capture_output=True, text=True, timeout=5)
+    for line in result.stdout.splitlines():
+        if line and not line[0].isspace():
+            iface = line.split(':', 1)[0]
+            continue
+        # 例: inet 192.168.0.5 netmask 0xffffff00 broadcast 192.168.0.255
+        match = re.search(r'inet (\d+\.\d+\.\d+\.\d+)\s+netmask (0x[0-9a-fA-F]+|\d+\.\d+\.\d+\.\d+)', line)
+        if match:
+            address, netmask = match.groups()
+            if netmask.startswith('0x'):
+                netmask = socket.inet_ntoa(struct.pack('>L', int(netmask, 16)))
+            interfaces.append((iface, ipaddress.IPv4Interface(f"{address}/{netmask}")))
+    return interfaces
+
+
+def read_interface_networks() -> Dict:
+    """
+    このマシンのIPv4アドレスと、それぞれが属するネットワーク（実際のプレフィックス長）を取得
+
+    Linuxでは /proc/net/fib_trie と /proc/net/route を読み、その他のOSでは ifconfig を使う。
+
+    Returns:
+        Dict: {
+            'interfaces': [(インターフェース名, IPv4Interface)],
+            'gateways': [ゲートウェイのIPアドレス],
+            'default_address': デフォルトルートのインターフェースのアドレス（不明な場合None）
+        }
+    """
+    interfaces = []
+    gateways = []
+    default_address = None
+
+    if os.path.exists(PROC_NET_ROUTE) and os.path.exists(PROC_NET_FIB_TRIE):
+        networks, gateways, default_iface = _read_proc_routes()
+        for address in _read_proc_local_addresses():
+            ip = ipaddress.IPv4Address(address)
+            if ip.is_loopback:
+                interfaces.append(('lo', ipaddress.IPv4Interface(f"{address}/8")))
+                continue
+            # アドレスを含む最も長いプレフィックスのオンリンクネットワークを採用
+            matched = [(iface, network) for iface, network in networks if ip in network]
+            if not matched:
+                interfaces.append(('', ipaddress.IPv4Interface(f"{address}/32")))
+                continue
+            iface, network = max(matched, key=lambda item: item[1].prefixlen)
+            interfaces.append((iface, ipaddress.IPv4Interface(f"{address}/{network.prefixlen}")))
+            if iface == default_iface and default_address is None:
+                default_address = address
+    else:
+        interfaces = _read_ifconfig_interfaces()
+
+    if default_address is None:
+        for _, interface in interfaces:
+            if not interface.ip.is_loopback:
+                default_address = str(interface.ip)
+                break
+
+    return {
+        'interfaces': interfaces,
+        'gateways': gateways,
+        'default_address': default_address
+    }
+
+
+class AsyncHostDiscovery:
+    """
+    asyncioによるTCPコネクト方式のホスト検出エンジン
+
+    root権限不要。指定ポートへの接続が成功、またはRST（接続拒否）が返れば
+    ホストは生存しているとみなす。1スレッドで数千のプローブを同時に実行する。
+    """
+
+    def __init__(self, ports: Optional[List[int]] = None, timeout: float = 1.0,
+                 concurrency: int = 4096, resolve_hostnames: bool = True):
+        """
+        エンジンの初期化
+
+        Args:
+            ports: プローブ先ポートのリスト（デフォルト: DISCOVERY_PORTS）
+            timeout: 1接続あたりのタイムアウト秒数
+            concurrency: 同時に実行する接続プローブ数の上限
+            resolve_hostnames: 生存ホストの逆引きを行う場合True
+        """
+        self.ports = list(ports) if ports else list(DISCOVERY_PORTS)
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.resolve_hostnames = resolve_hostnames
+
+    async def _probe_port(self, ip: str, port: int, semaphore: asyncio.Semaphore) -> bool:
+        """
+        1ポートへTCP接続を試行
+
+        Returns:
+            bool: 接続成功またはRSTの場合True（ホスト生存）
+        """
+        async with semaphore:
+            # StreamReader/Writerを作らず生ソケットで接続だけ行う（オーバーヘッド削減）
+            loop = asyncio.get_running_loop()
+            for attempt in range(DISCOVERY_RESOURCE_RETRIES + 1):
+                sock = None
+                try:
+                    # ソケットの作成も try の中で行う（EMFILE・ENFILE でスキャン全体を止めない）
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), self.timeout)
+                    return True
+                except ConnectionRefusedError:
+                    # RSTが返った = ホストは生存している
+                    return True
+                except asyncio.TimeoutError:
+                    # Python 3.11以降は TimeoutError が OSError のサブクラスのため、OSErrorより先に捕捉する
+                    return False
+                except OSError as e:
+                    # ファイルディスクリプタ等のローカル資源の枯渇は、少し待って再試行する
+                    if e.errno not in _LOCAL_RESOURCE_ERRNOS or attempt == DISCOVERY_RESOURCE_RETRIES:
+                        # EHOSTUNREACH等は応答なし扱い（ECONNREFUSEDはOSErrorとして来る場合もある）
+                        return e.errno == errno.ECONNREFUSED
+                finally:
+                    if sock is not None:
+                        sock.close()
+                await asyncio.sleep(0.05 * (attempt + 1))
+            return False
+
+    async def _probe_host(self, ip: str, semaphore: asyncio.Semaphore) -> bool:
+        """
+        全プローブ先ポートへ同時に接続し、1つでも応答があれば生存と判定
+        """
+        tasks = [asyncio.ensure_future(self._probe_port(ip, port, semaphore)) for port in self.ports]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                if await next_done:
+                    return True
+            return False
+        finally:
+            # 生存が確定したら残りのプローブは取り消す
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _resolve_hostname(self, ip: str) -> str:
+        """生存ホストの逆引き（失敗時は 'Unknown'）"""
+        if not self.resolve_hostnames:
+            return 'Unknown'
+        loop = asyncio.get_running_loop()
+        try:
+            hostname, _ = await asyncio.wait_for(
+                loop.getnameinfo((ip, 0), socket.NI_NAMEREQD), self.timeout
+            )
+            return hostname or 'Unknown'
+        except Exception:
+            return 'Unknown'
+
+    async def _run(self, hosts: Iterator[tuple], total_hosts: int,
+                   progress_callback=None, host_callback=None, cancel_token=None) -> Dict[str, Dict]:
+        """ワーカーコルーチン群で (IPアドレス, サブネット) を順に取り出してプローブ（キャンセル時は取り出しをやめる）"""
+        results = {}
+        concurrency = _raise_fd_limit(self.concurrency)
+        semaphore = asyncio.Semaphore(concurrency)
+        host_iter = iter(hosts)
+        probed = 0
+        # 進捗通知は最大100回程度に間引く
+        report_every = max(1, total_hosts // 100)
+
+        async def worker():
+            nonlocal probed
+            # 同一イベントループ内なのでイテレータの共有は安全
+            for ip, subnet in host_iter:
+                if _cancelled(cancel_token):
+                    return
+                if await self._probe_host(ip, semaphore):
+                    hostname = await self._resolve_hostname(ip)
+                    results[ip] = {
+                        'hostname': hostname,
+                        'state': 'up',
+                        'vendor': '',
+                        'subnet': subnet
+                    }
+                    print(f"  ✓ {ip:15s} - {hostname}")
+                    if host_callback:
+                        host_callback(ip, results[ip])
+
+                probed += 1
+                if progress_callback and (probed % report_every == 0 or probed == total_hosts):
+                    progress_callback(probed, total_hosts, len(results))
+
+        # 1ホストにつき len(self.ports) 本の接続を使うため、ワーカー数はその分だけ割る
+        worker_count = max(1, min(total_hosts, concurrency // len(self.ports)))
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+        return results
+
+    def scan(self, target: str, progress_callback=None) -> Dict[str, Dict]:
+        """
+        スキャン対象のホスト検出を実行（同期呼び出し用）
+
+        Args:
+            target: スキャン対象（例: "192.168.0.0/24"、"192.168.0.1-50"）
+            progress_callback: 進捗コールバック関数 callback(probed_hosts, total_hosts, found_hosts)
+
+        Returns:
+            Dict: スキャン結果（キー: IPアドレス、値: ホスト情報）
+        """
+        return self.scan_many([target], progress_callback=progress_callback)
+
+    def scan_many(self, targets: List[str], progress_callback=None,
+                  exclude: Optional[List[str]] = None, host_callback=None,
+                  cancel_token: Optional['CancelToken'] = None) -> Dict[str, Dict]:
+        """
+        複数のスキャン対象を1つのイベントループで同時に検出
+
+        対象は CompiledTargets で重複排除・除外適用してから、各対象のホストを
+        ラウンドロビンで取り出すため、小さな範囲が大きな範囲の完了を待つことはない。
+
+        Args:
+            targets: スキャン対象のリスト（例: ["192.168.0.0/24", "172.17.0.0/16"]）
+            progress_callback: 進捗コールバック関数 callback(probed_hosts, total_hosts, found_hosts)
+            exclude: 除外する範囲のリスト
+            host_callback: ホスト検出時のコールバック関数 callback(ip, host_info)
+            cancel_token: キャンセル通知（キャンセル時はそれまでの結果を返す）
+
+        Returns:
+            Dict: スキャン結果（キー: IPアドレス、値: ホスト情報）
+        """
+        compiled = CompiledTargets(targets, exclude)
+        resolved = self._resolve_unresolved(compiled)
+        total_hosts = compiled.num_addresses - len(compiled.unresolved) + len(resolved)
+        if total_hosts == 0:
+            return {}
+        hosts = _round_robin([compiled.iter_hosts(), resolved])
+        return asyncio.run(self._run(hosts, total_hosts, progress_callback, host_callback, cancel_token))
+
+    @staticmethod
+    def _resolve_unresolved(compiled: 'CompiledTargets') -> List[tuple]:
+        """
+        区間に変換できなかった対象（ホスト名）をIPv4アドレスに解決
+
+        解決できない対象・除外範囲や他の対象に含まれるアドレスは、理由を表示してスキップする。
+
+        Returns:
+            List[tuple]: (IPアドレス, 元のスキャン対象) のリスト
+        """
+        resolved = []
+        seen = set()
+        for target in compiled.unresolved:
+            try:
+                ip = socket.gethostbyname(target)
+            except (OSError, UnicodeError):
+                print(f"  ⚠ ホスト名を解決できないためスキップ: {target}")
+                continue
+            value = int(ipaddress.IPv4Address(ip))
+            if any(start <= value <= end for start, end in compiled.excluded):
+                print(f"  ⚠ 除外範囲に含まれるためスキップ: {target} ({ip})")
+                continue
+            if ip in seen or compiled.label_for(ip) is not None:
+                # 他の対象と同じアドレス（そちらでプローブする）
+                continue
+            seen.add(ip)
+            resolved.append((ip, target))
+        return resolved
+
+
+# 同時接続数を減らす原因となるローカル資源の枯渇（ポートの開閉とは無関係なので再試行する）
+_LOCAL_RESOURCE_ERRNOS = {
+    errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM, errno.EAGAIN, errno.EADDRNOTAVAIL
+}
+
+
+class _ConnectCongestionControl:
+    """
+    AsyncPortScanner の同時接続数とタイムアウトを観測結果から調整する
+
+    - タイムアウト: 応答（接続成功・RST）のRTTから RFC 6298 と同じ方法で算出
+    - 同時接続数: 1ラウンド（同時接続数分の完了）ごとに判定し、資源不足・
+      応答のあるホストでのタイムアウト増加（パケット落ち）・RTTの増加（キューイング）で減らし、
+      問題がなければ増やす
+    """
+
+    # タイムアウト率がこれを超えたら同時接続数を減らす（ホストが応答している場合のみ）
+    DROP_THRESHOLD = 0.3
+    # タイムアウト率がこれ未満なら同時接続数を増やす
+    GROW_THRESHOLD = 0.05
+    # 平滑化RTTが最小RTTからこの秒数以上増えたら、それ以上増やさない（相手・自分のイベントループが飽和）
+    QUEUE_DELAY_LIMIT = 0.002
+
+    def __init__(self, timeout: float, min_timeout: float, concurrency: int,
+                 min_concurrency: int, max_concurrency: int):
+        self.max_timeout = timeout
+        self.min_timeout = min(min_timeout, timeout)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(min_concurrency, max_concurrency)
+        self.concurrency = max(min_concurrency, min(concurrency, self.max_concurrency))
+        self.srtt = None
+        self.rttvar = None
+        self.min_rtt = None
+        self.responses = 0
+        # 現在のラウンドの集計
+        self._completed = 0
+        self._timeouts = 0
+        self._resource_errors = 0
+
+    @property
+    def timeout(self) -> float:
+        """現在の接続タイムアウト秒数"""
+        if self.srtt is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.srtt + 4 * self.rttvar))
+
+    def record(self, outcome: str, rtt: Optional[float] = None):
+        """
+        1接続の結果を記録
+
+        Args:
+            outcome: 'open'、'closed'（RST）、'timeout'、'resource'（ローカル資源不足）、'error'
+            rtt: 応答までの秒数（'open'・'closed' の場合）
+        """
+        if rtt is not None:
+            self.responses += 1
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+            if self.srtt is None:
+                self.srtt, self.rttvar = rtt, rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        if outcome == 'timeout':
+            self._timeouts += 1
+        elif outcome == 'resource':
+            self._resource_errors += 1
+
+        self._completed += 1
+        if self._completed >= self.concurrency:
+            self._adjust()
+
+    def _adjust(self):
+        """1ラウンドの結果から同時接続数を変更"""
+        timeout_ratio = self._timeouts / self._completed
+        queue_delay = self.srtt - self.min_rtt if self.srtt is not None else 0.0
+        if self._resource_errors:
+            self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        elif self.responses and timeout_ratio > self.DROP_THRESHOLD:
+            self.concurrency = max(self.min_concurrency, self.concurrency * 3 // 4)
+        elif queue_delay > self.QUEUE_DELAY_LIMIT * 4:
+            self.concurrency = max(self.min_concurrency, self.concurrency * 3 // 4)
+        elif timeout_ratio < self.GROW_THRESHOLD and queue_delay <= self.QUEUE_DELAY_LIMIT:
+            self.concurrency = min(self.max_concurrency, self.concurrency + max(self.min_concurrency, self.concurrency // 4))
+        self._completed = self._timeouts = self._resource_errors = 0
+
+
+class AsyncPortScanner:
+    """
+    asyncioによるTCPコネクト方式のポートスキャンエンジン（全ポートスキャンの第1段階用）
+
+    nmap -sT --open と同じく接続の成否でオープンポートを判定し、同じ形式のポート情報を返す。
+    同時接続数とタイムアウトは観測したRTT・RST・タイムアウトの割合に応じて自動調整する。
+    root権限・nmap不要。
+    """
+
+    def __init__(self, timeout: float = 1.0, min_timeout: float = 0.25, concurrency: int = 256,
+                 min_concurrency: int = 16, max_concurrency: int = 4096, retries: int = 1):
+        """
+        エンジンの初期化
+
+        Args:
+            timeout: 1接続あたりのタイムアウト秒数（RTTを観測するまでの値・上限）
+            min_timeout: RTTから算出するタイムアウトの下限
+            concurrency: 同時接続数の初期値
+            min_concurrency: 同時接続数の下限
+            max_concurrency: 同時接続数の上限
+            retries: タイムアウトしたポートの再試行回数（ホストが応答している場合のみ）
+        """
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+
+    async def _connect(self, host: str, port: int, timeout: float) -> tuple:
+        """
+        1ポートへTCP接続を試行
+
+        loop.sock_connect + wait_for はポートごとにタスクとタイマーを2重に作るため、
+        ノンブロッキング connect の結果をそのまま使い、接続中の場合だけ書き込み可能
+        通知とタイマーで待つ（ループバック・LANでは大半の接続が即座に結果を返す）。
+
+        Returns:
+            tuple: (ポート番号, 結果, RTT) 結果は _ConnectCongestionControl.record の outcome
+        """
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        except OSError as e:
+            return port, 'resource' if e.errno in _LOCAL_RESOURCE_ERRNOS else 'error', None
+        try:
+            sock.setblocking(False)
+            err = sock.connect_ex((host, port))
+            if err == errno.EINPROGRESS:
+                fd = sock.fileno()
+                waiter = loop.create_future()
+
+                def on_writable():
+                    if not waiter.done():
+                        waiter.set_result(sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR))
+
+                def on_timeout():
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+                loop.add_writer(fd, on_writable)
+                timer = loop.call_later(timeout, on_timeout)
+                try:
+                    err = await waiter
+                finally:
+                    timer.cancel()
+                    loop.remove_writer(fd)
+                if err is None:
+                    return port, 'timeout', None
+        finally:
+            sock.close()
+
+        if err == 0:
+            return port, 'open', time.perf_counter() - start
+        if err == errno.ECONNREFUSED:
+            return port, 'closed', time.perf_counter() - start
+        if err in _LOCAL_RESOURCE_ERRNOS:
+            return port, 'resource', None
+        # EHOSTUNREACH等はフィルタされたポートと同じ扱い
+        return port, 'error', None
+
+    async def _run(self, host: str, ports: List[int], progress_callback=None, port_callback=None,
+                   cancel_token=None) -> tuple:
+        """同時接続数を調整しながら全ポートへ接続し、(オープンポートのリスト, 統計) を返す"""
+        control = _ConnectCongestionControl(
+            self.timeout, self.min_timeout, self.concurrency,
+            self.min_concurrency, _raise_fd_limit(self.max_concurrency)
+        )
+        total = len(ports)
+        port_iter = iter(ports)
+        # 再試行するポート（キー: ポート番号、値: 残り再試行回数）
+        retry_budget = {}
+        retry_queue = deque()
+        workers = set()
+        open_ports = []
+        scanned = 0
+        # 進捗通知は最大200回程度に間引く
+        report_every = max(1, total // 200)
+
+        def next_port() -> Optional[int]:
+            if _cancelled(cancel_token):
+                return None
+            if retry_queue:
+                return retry_queue.popleft()
+            return next(port_iter, None)
+
+        def handle(port: int, outcome: str, rtt: Optional[float]):
+            nonlocal scanned
+            control.record(outcome, rtt)
+            if outcome == 'resource':
+                # ローカル資源不足はポートの状態ではないので、同時接続数を減らしてやり直す
+                retry_queue.append(port)
+                return
+            if outcome == 'timeout' and control.responses:
+                remaining = retry_budget.get(port, self.retries)
+                if remaining > 0:
+                    retry_budget[port] = remaining - 1
+                    retry_queue.append(port)
+                    return
+
+            scanned += 1
+            if outcome == 'open':
+                port_info = {
+                    'port': port,
+                    'protocol': 'tcp',
+                    'state': 'open',
+                    'service': _guess_service_name(port),
+                    'version': '',
+                    'product': ''
+                }
+                open_ports.append(port_info)
+                if port_callback:
+                    port_callback(port_info)
+            if progress_callback and (scanned % report_every == 0 or scanned == total):
+                progress_callback(scanned, total, len(open_ports))
+
+        async def worker():
+            # 同時接続数が下がったら余分なワーカーは終了する（同一イベントループ内なので共有は安全）
+            while len(workers) <= control.concurrency:
+                port = next_port()
+                if port is None:
+                    return
+                handle(*await self._connect(host, port, control.timeout))
+                spawn()
+
+        def spawn():
+            # 同時接続数が上がった分・再試行が積まれた分だけワーカーを起動
+            if _cancelled(cancel_token):
+                return
+            while len(workers) < control.concurrency and (retry_queue or scanned + len(workers) < total):
+                task = asyncio.ensure_future(worker())
+                workers.add(task)
+                task.add_done_callback(workers.discard)
+
+        spawn()
+        while workers:
+            await asyncio.gather(*list(workers))
+            spawn()
+
+        open_ports.sort(key=lambda p: p['port'])
+        stats = {
+            'concurrency': control.concurrency,
+            'timeout': round(control.timeout, 3),
+            'srtt': round(control.srtt, 6) if control.srtt is not None else None
+        }
+        return open_ports, stats
+
+    def scan(self, host: str, ports: Optional[List[int]] = None, progress_callback=None,
+             port_callback=None, cancel_token: Optional['CancelToken'] = None) -> Dict:
+        """
+        指定ホストのポートスキャンを実行（同期呼び出し用）
+
+        Args:
+            host: スキャン対象のIPアドレス
+            ports: スキャンするポートのリスト（デフォルト: 1-65535）
+            progress_callback: 進捗コールバック関数 callback(scanned_ports, total_ports, found_ports)
+            port_callback: オープンポート検出時のコールバック関数 callback(port_info)
+            cancel_token: キャンセル通知（キャンセル時は接続中のポートだけ待ってそれまでの結果を返す）
+
+        Returns:
+            Dict: ポートスキャン結果（port_scan と同じ形式、stats に最終的な同時接続数・タイムアウト）
+        """
+        start_time = time.time()
+        ports = list(ports) if ports is not None else list(range(1, 65536))
+        open_ports, stats = asyncio.run(self._run(host, ports, progress_callback, port_callback, cancel_token))
+        stats['elapsed'] = round(time.time() - start_time, 3)
+        return {
+            'host': host,
+            'ports': open_ports,
+            'os': '',
+            'scan_time': '',
+            'scan_stage': 'full',
+            'stats': stats
+        }
+
+
+def _guess_service_name(port: int) -> str:
+    """ポート番号から一般的なサービス名を取得（nmap の --open 出力の service 相当）"""
+    try:
+        return socket.getservbyport(port, 'tcp')
+    except OSError:
+        return ''
+
+
+# スキャンの優先度（値が小さいほど優先）。nmapプロセスの実行枠はこの順に割り当てる
+#   INTERACTIVE: 優先ポートスキャンなど、ユーザーが結果を待っている操作
+#   NORMAL:      ネットワークスキャン・1ホストの全ポートスキャン
+#   BULK:        ポートスイープなどの一括処理
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BULK = 20
+
+
+class ScanCancelled(Exception):
+    """スキャンがキャンセルされた（CancelToken.cancel を参照）"""
+
+
+class CancelToken:
+    """
+    スキャンのキャンセル通知
+
+    cancel() を呼ぶと is_cancelled() が True になり、register() で登録された実行中の
+    nmapプロセスを終了する。各スキャン処理は新しい作業（チャンク・作業単位・ポート）を
+    始める前に is_cancelled() を確認し、それまでに得た結果を返す。
+    priority はそのスキャンの優先度で、nmapプロセスの実行枠を待つ順序に使う。
+    """
+
+    # 終了要求（SIGTERM）から強制終了（SIGKILL）までの猶予秒数
+    KILL_GRACE = 0.5
+
+    def __init__(self, priority: int = PRIORITY_NORMAL):
+        self.priority = priority
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        # 実行中のプロセス（キー: Popen、値: sudo経由の場合True）
+        self._processes = {}
+
+    def is_cancelled(self) -> bool:
+        """キャンセルされた場合True"""
+        return self._event.is_set()
+
+    def check(self):
+        """キャンセルされていれば ScanCancelled を送出"""
+        if self._event.is_set():
+            raise ScanCancelled('スキャンがキャンセルされました')
+
+    def cancel(self):
+        """キャンセルを通知し、実行中のプロセスを終了する（最大 KILL_GRACE 秒待つ）"""
+        self._event.set()
+        with self._lock:
+            processes = dict(self._processes)
+        for process in processes:
+            _terminate(process)
+        deadline = time.time() + self.KILL_GRACE
+        for process, via_sudo in processes.items():
+            try:
+                process.wait(timeout=max(0.0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                # sudo を強制終了すると root の nmap が残るため、sudo経由のものは SIGTERM の中継に任せる
+                if not via_sudo:
+                    process.kill()
+
+    @contextmanager
+    def register(self, process: subprocess.Popen, via_sudo: bool = False):
+        """
+        実行中のプロセスを登録（with ブロックを抜けるまで、キャンセル時に終了する対象になる）
+
+        Args:
+            process: nmapプロセス
+            via_sudo: sudo経由で起動した場合True（sudo は受け取った SIGTERM を nmap に中継する）
+        """
+        with self._lock:
+            self._processes[process] = via_sudo
+        if self._event.is_set():
+            _terminate(process)
+        try:
+            yield process
+        finally:
+            with self._lock:
+                self._processes.pop(process, None)
+
+
+def _terminate(process: subprocess.Popen):
+    """プロセスに終了要求（SIGTERM）を送る（終了済みなら何もしない）"""
+    if process.poll() is None:
+        try:
+            process.terminate()
+        except OSError:
+            pass
+
+
+def _cancelled(cancel_token: Optional[CancelToken]) -> bool:
+    """cancel_token が指定されていてキャンセル済みの場合True"""
+    return cancel_token is not None and cancel_token.is_cancelled()
+
+
+def _priority(cancel_token: Optional[CancelToken]) -> int:
+    """cancel_token の優先度（指定されていない場合は PRIORITY_NORMAL）"""
+    return cancel_token.priority if cancel_token is not None else PRIORITY_NORMAL
+
+
+# nmapプロセスの同時実行数の上限（デフォルト）
+DEFAULT_MAX_NMAP_PROCESSES = 16
+# 実行枠を待つ間にキャンセルを確認する間隔（秒）
+NMAP_BUDGET_WAIT_INTERVAL = 0.2
+
+
+class NmapProcessBudget:
+    """
+    nmapプロセスの同時実行数を制限するスケジューラ
+
+    Pingスキャン・ポートスキャンを問わず、全てのnmap起動はこのスケジューラの
+    slot() を通して行う。上限に達している場合は優先度の高い順（同じ優先度なら先着順）に
+    待機するため、ポートスイープが枠を埋めていても優先ポートスキャンのnmapが先に起動する。
+    """
+
+    def __init__(self, limit: int = DEFAULT_MAX_NMAP_PROCESSES):
+        """
+        スケジューラの初期化
+
+        Args:
+            limit: 同時に実行できるnmapプロセス数の上限
+        """
+        self._lock = threading.Lock()
+        self._limit = max(1, limit)
+        self._running = 0
+        # (優先度, 到着順, Event) のヒープ
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    def set_limit(self, limit: int):
+        """
+        同時実行数の上限を変更（待機中のプロセスがあれば空き枠分だけ起動）
+
+        Args:
+            limit: 新しい上限
+        """
+        with self._lock:
+            self._limit = max(1, limit)
+            while self._waiters and self._running < self._limit:
+                self._running += 1
+                heapq.heappop(self._waiters)[2].set()
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, cancel_token: Optional[CancelToken] = None):
+        """
+        実行枠を1つ確保（空きがなければ待機）
+
+        Args:
+            priority: 優先度（PRIORITY_INTERACTIVE などの値が小さいほど先に枠を得る）
+            cancel_token: キャンセル通知（待機中にキャンセルされた場合は待機列から外れる）
+
+        Raises:
+            ScanCancelled: 枠を得る前にキャンセルされた場合
+        """
+        with self._lock:
+            if _cancelled(cancel_token):
+                raise ScanCancelled('スキャンがキャンセルされました')
+            if self._running < self._limit and not self._waiters:
+                self._running += 1
+                return
+            entry = (priority, next(self._sequence), threading.Event())
+            heapq.heappush(self._waiters, entry)
+        # 枠はrelease側で確保済みの状態で引き渡される
+        event = entry[2]
+        while not event.wait(NMAP_BUDGET_WAIT_INTERVAL):
+            if not _cancelled(cancel_token):
+                continue
+            with self._lock:
+                if not event.is_set():
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    raise ScanCancelled('スキャンがキャンセルされました')
+            # キャンセルと同時に枠を引き渡された場合は、その枠を次の待機者に回す
+            self.release()
+            raise ScanCancelled('スキャンがキャンセルされました')
+
+    def release(self):
+        """実行枠を1つ解放（待機中があれば最も優先度の高いものに引き渡す）"""
+        with self._lock:
+            if self._waiters and self._running <= self._limit:
+                heapq.heappop(self._waiters)[2].set()
+            else:
+                self._running -= 1
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_NORMAL, cancel_token: Optional[CancelToken] = None):
+        """nmapプロセス1つ分の実行枠を確保するコンテキストマネージャ（引数は acquire を参照）"""
+        self.acquire(priority, cancel_token)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        現在の実行状況を取得
+
+        Returns:
+            Dict: {'limit': 上限, 'running': 実行中, 'queued': 待機中}
+        """
+        with self._lock:
+            return {
+                'limit': self._limit,
+                'running': self._running,
+                'queued': len(self._waiters)
+            }
+
+
+# root権限のnmapを実行する常駐ヘルパー（nmap_helper.py）
+NMAP_HELPER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nmap_helper.py')
+# ヘルパーの起動（sudo の認証を含む）を待つ秒数
+NMAP_HELPER_START_TIMEOUT = 10.0
+# ヘルパーで実行する1回のnmapのタイムアウト秒数
+NMAP_HELPER_SCAN_TIMEOUT = 300
+# パスワードを標準入力から読む sudo コマンド（ヘルパーの起動と、ヘルパーを使えない場合のスキャンごとの sudo nmap）
+SUDO_COMMAND = ('sudo', '-S', '-p', '')
+
+
+class NmapHelperError(Exception):
+    """常駐ヘルパーを起動できなかった、または実行中にヘルパーが終了した"""
+
+
+class SudoAuthenticationError(NmapHelperError):
+    """sudoパスワードが正しくない"""
+
+
+SUDO_AUTH_ERROR_MESSAGE = 'sudoパスワードが正しくありません'
+
+
+def _is_sudo_auth_failure(stderr: str) -> bool:
+    """sudo のエラー出力がパスワードの誤りを示している場合True（実行が許可されていない場合は含まない）"""
+    stderr = stderr.lower()
+    return 'incorrect password' in stderr or 'sorry, try again' in stderr
+
+
+class _HelperScan:
+    """
+    ヘルパー内で実行中の1回のnmap
+
+    CancelToken.register に渡せるよう、Popen と同じ poll() / terminate() / kill() / wait() を持つ。
+    """
+
+    def __init__(self, helper: 'PrivilegedNmapHelper', request_id: int):
+        self.request_id = request_id
+        self.returncode = None
+        self.stderr = ''
+        # PrivilegedNmapHelper.scan が iter_output() を読み終えた後に設定する
+        self.xml = ''
+        self._helper = helper
+        # 届いたXML出力の断片（終了時に None を積む）
+        self._chunks = queue.Queue()
+        self._done = threading.Event()
+
+    def feed(self, text: str):
+        self._chunks.put(text)
+
+    def finish(self, returncode: int, stderr: str):
+        self.returncode = returncode
+        self.stderr = stderr
+        self._done.set()
+        self._chunks.put(None)
+
+    def iter_output(self, timeout: float = NMAP_HELPER_SCAN_TIMEOUT) -> Iterator[str]:
+        """
+        XML出力の断片を届いた順に返す（nmapが終了するまで）
+
+        Args:
+            timeout: 全体のタイムアウト秒数
+
+        Raises:
+            subprocess.TimeoutExpired: タイムアウトした場合（nmapは終了させる）
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                chunk = self._chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.terminate()
+                raise subprocess.TimeoutExpired('nmap', timeout)
+            if chunk is None:
+                return
+            yield chunk
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def terminate(self):
+        """ヘルパーに終了要求を送る（ヘルパーが nmap に SIGTERM を送る）"""
+        self._helper.send({'id': self.request_id, 'cancel': True})
+
+    def kill(self):
+        self.terminate()
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        if not self._done.wait(timeout):
+            raise subprocess.TimeoutExpired('nmap', timeout)
+        return self.returncode
+
+
+class PrivilegedNmapHelper:
+    """
+    root権限のnmapを実行する常駐ヘルパー（nmap_helper.py）のクライアント
+
+    sudo の認証はヘルパーの起動時に1回だけ行い、以降のスキャンは標準入力へ要求を書き込み、
+    標準出力から届くXML出力を受け取る。スキャンごとの sudo・PAM認証・一時ファイルが不要になる。
+    複数のスレッドから同時に scan() を呼べる（ヘルパー内でnmapが並行して実行される）。
+    """
+
+    def __init__(self, password: str, sudo_command: Optional[Tuple[str, ...]] = None):
+        """
+        クライアントの初期化（start() で起動する）
+
+        Args:
+            password: sudoパスワード
+            sudo_command: ヘルパーの起動に使うコマンド（パスワードを標準入力から読むもの、デフォルト: SUDO_COMMAND）
+        """
+        self._password = password
+        self._sudo_command = list(SUDO_COMMAND if sudo_command is None else sudo_command)
+        self._process = None
+        self._write_lock = threading.Lock()
+        self._scans = {}
+        self._scans_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._started = threading.Event()
+        self._start_error = None
+        self._stderr = deque(maxlen=20)
+        self._stderr_closed = threading.Event()
+
+    def start(self):
+        """
+        ヘルパーを起動して応答を待つ
+
+        Raises:
+            SudoAuthenticationError: パスワードが正しくない場合
+            NmapHelperError: 起動できなかった場合（sudo でPythonの実行が許可されていない場合など）
+        """
+        try:
+            self._process = subprocess.Popen(
+                self._sudo_command + [sys.executable, NMAP_HELPER_SCRIPT],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                bufsize=1
+            )
+        except OSError as e:
+            raise NmapHelperError(f"ヘルパーを起動できませんでした: {e}")
+        for target in (self._read_stdout, self._read_stderr):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        # sudo が標準入力からパスワードを読む（認証がキャッシュ済みの場合はヘルパーが読み捨てる）
+        self.send_line(self._password)
+
+        if not self._started.wait(NMAP_HELPER_START_TIMEOUT):
+            self._start_error = 'ヘルパーの起動がタイムアウトしました'
+        if self._start_error is not None:
+            self.stop()
+            if self._start_error == SUDO_AUTH_ERROR_MESSAGE:
+                raise SudoAuthenticationError(self._start_error)
+            raise NmapHelperError(self._start_error)
+
+    def is_alive(self) -> bool:
+        """ヘルパーが実行中の場合True"""
+        return self._process is not None and self._process.poll() is None
+
+    def stop(self):
+        """ヘルパーを終了（標準入力を閉じると、ヘルパーは実行中のnmapを終了してから終了する）"""
+        if self._process is None:
+            return
+        try:
+            with self._write_lock:
+                self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            # sudo は受け取った SIGTERM をヘルパーに中継する
+            _terminate(self._process)
+
+    def send(self, message: Dict):
+        """要求を1行のJSONとして書き込む"""
+        self.send_line(json.dumps(message))
+
+    def send_line(self, line: str):
+        try:
+            with self._write_lock:
+                self._process.stdin.write(line + '\n')
+                self._process.stdin.flush()
+        except (OSError, ValueError):
+            # ヘルパーが終了している（実行中のスキャンは _read_stdout が終了させる）
+            pass
+
+    def scan(self, arguments: List[str], cancel_token: Optional[CancelToken] = None,
+             timeout: float = NMAP_HELPER_SCAN_TIMEOUT) -> _HelperScan:
+        """
+        nmap -oX - <arguments> をroot権限で実行し、終了まで待つ
+
+        Args:
+            arguments: nmapの引数（ターゲットを含む）
+            cancel_token: キャンセル通知（キャンセル時はヘルパーが nmap を終了する）
+            timeout: タイムアウト秒数
+
+        Returns:
+            _HelperScan: 終了したスキャン（xml・returncode・stderr）
+
+        Raises:
+            NmapHelperError: ヘルパーが終了している場合
+            subprocess.TimeoutExpired: タイムアウトした場合（nmapは終了させる）
+        """
+        scan = self.start_scan(arguments)
+        with cancel_token.register(scan, via_sudo=True) if cancel_token is not None else nullcontext():
+            scan.xml = ''.join(scan.iter_output(timeout))
+        return scan
+
+    def start_scan(self, arguments: List[str]) -> _HelperScan:
+        """
+        nmap -oX - <arguments> をroot権限で開始し、終了を待たずに返す
+
+        出力は返した _HelperScan の iter_output() で届いた順に読み取る（キャンセルする場合は
+        CancelToken.register(scan, via_sudo=True) に渡す）。
+
+        Args:
+            arguments: nmapの引数（ターゲットを含む）
+
+        Raises:
+            NmapHelperError: ヘルパーが終了している場合
+        """
+        if not self.is_alive():
+            raise NmapHelperError('ヘルパーが実行されていません')
+        scan = _HelperScan(self, next(self._request_ids))
+        with self._scans_lock:
+            self._scans[scan.request_id] = scan
+        self.send({'id': scan.request_id, 'args': arguments})
+        return scan
+
+    def _read_stdout(self):
+        """ヘルパーの応答を読み、要求ごとのスキャンに振り分ける"""
+        for line in self._process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get('ready'):
+                self._started.set()
+                continue
+            with self._scans_lock:
+                scan = self._scans.get(message.get('id'))
+                if scan is not None and 'exit' in message:
+                    del self._scans[scan.request_id]
+            if scan is None:
+                continue
+            if 'xml' in message:
+                scan.feed(message['xml'])
+            elif 'exit' in message:
+                scan.finish(message['exit'], message.get('stderr', ''))
+
+        # ヘルパーが終了した（終了理由を判定できるようエラー出力を読み終えるまで待つ）
+        self._stderr_closed.wait(1.0)
+        if not self._started.is_set():
+            stderr = '\n'.join(self._stderr)
+            if _is_sudo_auth_failure(stderr):
+                self._start_error = SUDO_AUTH_ERROR_MESSAGE
+            else:
+                self._start_error = f"ヘルパーを起動できませんでした: {stderr or '不明なエラー'}"
+            self._started.set()
+        with self._scans_lock:
+            scans = list(self._scans.values())
+            self._scans.clear()
+        for scan in scans:
+            scan.finish(-1, 'ヘルパーが終了しました')
+
+    def _read_stderr(self):
+        """sudo・ヘルパーのエラー出力を保持（パスワードの誤りは起動待ちを打ち切る）"""
+        for line in self._process.stderr:
+            line = line.rstrip()
+            if not line:
+                continue
+            self._stderr.append(line)
+            if not self._started.is_set() and _is_sudo_auth_failure(line):
+                self._start_error = SUDO_AUTH_ERROR_MESSAGE
+                self._started.set()
+        self._stderr_closed.set()
+
+
+# NmapRunner が保持する直近の実行記録の件数
+NMAP_TIMING_HISTORY = 200
+
+
+class NmapRunner:
+    """
+    nmapの実行層（全てのnmap実行経路が使う）
+
+    nmapのパスとバージョンは作成時に1回だけ解決する（python-nmap の PortScanner のように
+    呼び出しごとに nmap -V を実行しない）。run() は共有する状態を持たないため、複数のスレッドから
+    同時に呼べる。呼び出しごとに起動・実行・パースの所要時間を記録する。
+    """
+
+    def __init__(self, binary: str = 'nmap'):
+        """
+        nmapのパスとバージョンを解決
+
+        Args:
+            binary: nmapのコマンド名またはパス
+        """
+        self.path = shutil.which(binary)
+        self.version = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._timings = deque(maxlen=NMAP_TIMING_HISTORY)
+        self._totals = {'calls': 0, 'spawn': 0.0, 'run': 0.0, 'parse': 0.0}
+
+        if self.path is None:
+            self.error = f"{binary} が見つかりません（PATHを確認してください）"
+            return
+        try:
+            output = subprocess.run([self.path, '-V'], stdin=subprocess.DEVNULL, capture_output=True,
+                                    text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            self.error = f"nmapを実行できません: {e}"
+            return
+        match = re.search(r'Nmap version ([0-9][^\s]*)', output)
+        if match is None:
+            self.error = f"nmapのバージョンを取得できません: {output.strip()}"
+            return
+        self.version = match.group(1)
+
+    @property
+    def available(self) -> bool:
+        """nmapが利用可能な場合True"""
+        return self.error is None
+
+    def run(self, arguments: List[str], cancel_token: Optional[CancelToken] = None, input: Optional[str] = None,
+            on_record=None, helper: Optional[PrivilegedNmapHelper] = None,
+            sudo_password: Optional[str] = None) -> Dict:
+        """
+        nmap -oX - <arguments> を実行し、XML出力を iter_nmap_xml で逐次パース
+
+        Args:
+            arguments: nmapの引数（ターゲットを含む）
+            cancel_token: キャンセル通知（実行中のnmapを登録する。キャンセル時の例外は呼び出し側で判定する）
+            input: 標準入力に書き込む文字列（-iL - でターゲットを渡す場合）
+            on_record: レコードごとのコールバック関数 callback(kind, record)（_collect_nmap_hosts を参照）
+            helper: 指定した場合、常駐ヘルパーでroot権限のnmapを実行する（ヘルパーは自身のPATHの nmap を使う）
+            sudo_password: 指定した場合、SUDO_COMMAND 経由でroot権限のnmapを実行する（ヘルパーを使えない場合）
+
+        Returns:
+            Dict: {'hosts': ホスト情報のリスト, 'returncode', 'stderr',
+                   'parse_error': XMLを読み取れなかった場合の ParseError（読み取れた場合None）,
+                   'timings': {'spawn', 'run', 'parse'}（秒）}
+
+        Raises:
+            ScanCancelled: 実行前にキャンセルされた場合
+            Exception: nmapが利用できない場合
+        """
+        if helper is None and not self.available:
+            raise Exception(self.error)
+        if cancel_token is not None:
+            cancel_token.check()
+
+        started = time.perf_counter()
+        via_sudo = helper is not None or sudo_password is not None
+        if helper is None:
+            command = [self.path, '-oX', '-'] + arguments
+            if sudo_password is not None:
+                # sudo は最初の1行をパスワードとして読み、残りの入力を nmap に渡す
+                command = list(SUDO_COMMAND) + command
+                input = f"{sudo_password}\n{input or ''}"
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            output = process.stdout
+        else:
+            process = helper.start_scan(arguments)
+            output = process.iter_output()
+        spawned = time.perf_counter()
+
+        # 出力を待った時間とコールバックの時間を除いたものをパースの所要時間とする
+        waited = [0.0]
+
+        def timed_output():
+            chunks = iter(output)
+            while True:
+                wait_started = time.perf_counter()
+                chunk = next(chunks, None)
+                waited[0] += time.perf_counter() - wait_started
+                if chunk is None:
+                    return
+                yield chunk
+
+        timed_record = None
+        if on_record is not None:
+            def timed_record(kind, record):
+                callback_started = time.perf_counter()
+                on_record(kind, record)
+                waited[0] += time.perf_counter() - callback_started
+
+        with cancel_token.register(process, via_sudo=via_sudo) if cancel_token is not None else nullcontext():
+            stderr_lines = []
+            stderr_thread = None
+            if helper is None:
+                # 標準エラーがパイプを埋めてnmapが停止しないよう別スレッドで読む
+                stderr_thread = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+                stderr_thread.start()
+                if input is not None:
+                    try:
+                        process.stdin.write(input)
+                        process.stdin.close()
+                    except OSError:
+                        # nmapが入力を読む前に終了した（キャンセルなど）
+                        pass
+            parse_started = time.perf_counter()
+            hosts, parse_error = _collect_nmap_hosts(timed_output(), timed_record)
+            parse_time = time.perf_counter() - parse_started - waited[0]
+            returncode = process.wait()
+            finished = time.perf_counter()
+            if stderr_thread is not None:
+                stderr_thread.join(timeout=1)
+        stderr = ''.join(stderr_lines) if helper is None else process.stderr
+
+        timings = {'spawn': spawned - started, 'run': finished - spawned, 'parse': parse_time}
+        via = 'helper' if helper is not None else 'sudo' if sudo_password is not None else 'process'
+        self._record(arguments, via, timings, returncode)
+        return {
+            'hosts': hosts,
+            'returncode': returncode,
+            'stderr': stderr,
+            'parse_error': parse_error,
+            'timings': timings
+        }
+
+    def _record(self, arguments: List[str], via: str, timings: Dict, returncode: int):
+        with self._lock:
+            self._totals['calls'] += 1
+            for name in ('spawn', 'run', 'parse'):
+                self._totals[name] += timings[name]
+            self._timings.append({
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'arguments': ' '.join(arguments),
+                'via': via,
+                'returncode': returncode,
+                **{name: round(value, 4) for name, value in timings.items()}
+            })
+
+    def stats(self, recent: int = 20) -> Dict:
+        """
+        nmapの情報と実行記録を取得
+
+        Args:
+            recent: 含める直近の実行記録の件数
+
+        Returns:
+            Dict: {'path', 'version', 'error', 'calls', 'total': 所要時間の合計（秒）,
+                   'average': 1回あたりの平均（秒）, 'recent': 直近の実行記録（新しい順）}
+        """
+        with self._lock:
+            calls = self._totals['calls']
+            timings = list(self._timings)[-recent:] if recent > 0 else []
+            total = {name: round(self._totals[name], 4) for name in ('spawn', 'run', 'parse')}
+        return {
+            'path': self.path,
+            'version': self.version,
+            'error': self.error,
+            'calls': calls,
+            'total': total,
+            'average': {name: round(value / calls, 4) if calls else 0.0 for name, value in total.items()},
+            'recent': timings[::-1]
+        }
+
+
+# 全ポートスキャン第2段階（サービス情報取得）の設定
+# 第1段階で見つかったポートはキューに積まれ、SERVICE_BATCH_SIZE 個たまるか
+# 最初のポートから SERVICE_BATCH_WINDOW 秒経過した時点でまとめて nmap -sV に渡す
+SERVICE_BATCH_SIZE = 8
+SERVICE_BATCH_WINDOW = 1.0
+DEFAULT_SERVICE_WORKERS = 6
+
+
+class ServiceDetectionQueue:
+    """
+    検出したポートを逐次受け取り、まとめてサービス情報取得を行うキュー
+
+    第1段階（ポート検出）の完了を待たずに第2段階を始めるためのもの。put() で積まれた
+    ポートはワーカースレッドが件数または時間でまとめて取り出し、detect(batch) を呼ぶ。
+    close() は積まれたポートを全て処理し終えるまで待つ。
+    """
+
+    _STOP = object()
+
+    def __init__(self, detect, batch_size: int = SERVICE_BATCH_SIZE,
+                 batch_window: float = SERVICE_BATCH_WINDOW, workers: int = DEFAULT_SERVICE_WORKERS):
+        """
+        キューの初期化（ワーカースレッドを起動）
+
+        Args:
+            detect: まとめたポートを処理する関数 detect(batch)（batch は put() した値のリスト）
+            batch_size: 1回にまとめる最大件数
+            batch_window: 最初の1件を取り出してから追加を待つ最大秒数
+            workers: ワーカースレッド数
+        """
+        self.detect = detect
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self._queue = queue.Queue()
+        self._threads = []
+        for _ in range(max(1, workers)):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item):
+        """処理対象を1件追加"""
+        self._queue.put(item)
+
+    def close(self):
+        """追加を締め切り、積まれた全件の処理が終わるまで待つ"""
+        for _ in self._threads:
+            self._queue.put(self._STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self):
+        """件数または時間でまとめて detect を呼ぶ"""
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    # 締め切り後はまとめた分を処理してから終了する
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self.detect(batch)
+            except Exception as e:
+                print(f"  サービス情報取得エラー: {e}")
+            if stop:
+                return
+
+
+# サービス情報取得（第2段階）のエンジン
+# banner: プロセス内でバナーを取得してシグネチャと照合し、判別できないポートだけ nmap -sV を実行
+# nmap: 全ポートを nmap -sV で取得
+SERVICE_ENGINES = ('banner', 'nmap')
+
+# サービス情報取得（第2段階）の nmap 引数
+# -sV: サービスバージョン検出
+# -T4: 高速スキャン（T5より安定）
+# --version-intensity 2: 軽量なバージョン検出（デフォルト7→2で大幅高速化）
+# --host-timeout 20s: ホストごとのタイムアウト
+SERVICE_SCAN_ARGUMENTS = '-sV -T4 --version-intensity 2 --host-timeout 20s'
+
+# サービス情報キャッシュの有効期間（秒）と最大件数
+SERVICE_CACHE_TTL = 24 * 60 * 60
+SERVICE_CACHE_MAX_ENTRIES = 4096
+# バナー・フィンガープリント取得の1接続あたりのタイムアウト秒数
+FINGERPRINT_TIMEOUT = 1.0
+
+# バナーに含まれる時刻（SMTP・FTPのあいさつ文など）はフィンガープリントから除く
+_BANNER_TIME_PATTERN = re.compile(rb'\d{1,2}:\d{2}(:\d{2})?')
+
+# 接続してもサーバーから何も送られてこないサービスへのプローブ（ポート番号で選ぶ）
+_SMB_DIALECTS = b'\x02NT LM 0.12\x00\x02SMB 2.002\x00\x02SMB 2.???\x00'
+_SMB_NEGOTIATE = (
+    b'\xffSMB\x72' + b'\x00' * 4 + b'\x18\x01\x28' + b'\x00' * 14 + b'\x2f\x4b\x00\x00\xc5\x5e'
+    + b'\x00' + struct.pack('<H', len(_SMB_DIALECTS)) + _SMB_DIALECTS
+)
+SERVICE_PROBES = {
+    # Redis: PING
+    6379: b'PING\r\n',
+    # PostgreSQL: SSLRequest（'S' または 'N' の1バイトが返る）
+    5432: struct.pack('!II', 8, 80877103),
+    # RDP: X.224 Connection Request
+    3389: b'\x03\x00\x00\x13\x0e\xe0\x00\x00\x00\x00\x00\x01\x00\x08\x00\x03\x00\x00\x00',
+    # SMB: SMB1 Negotiate（SMB2 のみのサーバーは SMB2 で応答する）
+    445: b'\x00' + len(_SMB_NEGOTIATE).to_bytes(3, 'big') + _SMB_NEGOTIATE,
+}
+# 上記以外でバナーが送られてこないポートには HEAD リクエストを送る
+_HTTP_PROBE = b'HEAD / HTTP/1.0\r\n\r\n'
+
+# 応答のシグネチャ (サービス名, 製品名, パターン)
+# 上から順に照合し、最初に一致したものを使う。パターン中の (?P<product>...)・(?P<version>...) が
+# あれば製品名・バージョンに使う。
+_HTTP_HEADERS = rb'\AHTTP/1\.[01] \d{3}(?:[^\r\n]*\r\n)*?[Ss]erver: '
+SERVICE_SIGNATURES = [
+    # SSH
+    ('ssh', 'OpenSSH', rb'\ASSH-[\d.]+-OpenSSH_(?P<version>[^\s]+)'),
+    ('ssh', 'Dropbear sshd', rb'\ASSH-[\d.]+-dropbear_(?P<version>[^\s]+)'),
+    ('ssh', '', rb'\ASSH-[\d.]+-(?P<product>[^\s_]+)(?:_(?P<version>[^\s]+))?'),
+    # FTP
+    ('ftp', 'vsftpd', rb'\A220[- ][^\r\n]*vsFTPd (?P<version>[\d.]+)'),
+    ('ftp', 'ProFTPD', rb'\A220[- ][^\r\n]*ProFTPD(?: (?P<version>[\d.]+[a-z]?))?'),
+    ('ftp', 'FileZilla ftpd', rb'\A220[- ][^\r\n]*FileZilla Server(?: version)?(?: (?P<version>[\d.]+))?'),
+    ('ftp', 'Pure-FTPd', rb'\A220[- ][^\r\n]*Pure-FTPd'),
+    # SMTP
+    ('smtp', 'Postfix smtpd', rb'\A220[- ][^\r\n]*ESMTP Postfix'),
+    ('smtp', 'Exim smtpd', rb'\A220[- ][^\r\n]*ESMTP Exim (?P<version>[\d.]+)'),
+    ('smtp', 'Microsoft ESMTP', rb'\A220[- ][^\r\n]*Microsoft ESMTP MAIL Service'),
+    ('smtp', '', rb'\A220[- ][^\r\n]*E?SMTP'),
+    ('ftp', '', rb'\A220[- ][^\r\n]*FTP'),
+    # HTTP
+    ('http', 'nginx', _HTTP_HEADERS + rb'nginx(?:/(?P<version>[\d.]+))?'),
+    ('http', 'Apache httpd', _HTTP_HEADERS + rb'Apache(?:/(?P<version>[\d.]+))?'),
+    ('http', 'Microsoft IIS httpd', _HTTP_HEADERS + rb'Microsoft-IIS/(?P<version>[\d.]+)'),
+    ('http', '', _HTTP_HEADERS + rb'(?P<product>[^\r\n/]+)(?:/(?P<version>[^\s\r\n]+))?'),
+    ('http', '', rb'\AHTTP/1\.[01] \d{3}'),
+    # Redis（PING への応答、または HEAD リクエストへのエラー応答）
+    ('redis', 'Redis key-value store', rb'\A(?:\+PONG|-NOAUTH|-DENIED Redis|-ERR unknown command .HEAD.)'),
+    # MySQL / MariaDB（ハンドシェイクパケット、または接続拒否のエラーパケット）
+    ('mysql', 'MariaDB', rb'\A...\x00\x0a(?:5\.5\.5-)?(?P<version>[\d.]+)-MariaDB'),
+    ('mysql', 'MySQL', rb'\A...\x00\x0a(?P<version>\d[^\x00]*)\x00'),
+    ('mysql', 'MySQL', rb'\A...\x00\xff..Host .{1,100} is not allowed to connect to this MySQL server'),
+    # PostgreSQL（SSLRequest への応答、または HEAD リクエストへのエラー応答）
+    ('postgresql', 'PostgreSQL DB', rb'\A[SN]\Z'),
+    ('postgresql', 'PostgreSQL DB', rb'\AE....S(?:FATAL|ERROR)\x00'),
+    # RDP（X.224 Connection Confirm）
+    ('ms-wbt-server', 'Microsoft Terminal Services', rb'\A\x03\x00...\xd0'),
+    # SMB
+    ('microsoft-ds', 'SMB2', rb'\A\x00...\xfeSMB'),
+    ('microsoft-ds', 'SMB1', rb'\A\x00...\xffSMB'),
+]
+
+
+def _compile_signatures(signatures) -> re.Pattern:
+    """
+    シグネチャを1つの正規表現にまとめる
+
+    i番目のシグネチャを (?P<s{i}>...) で囲み、その中の product・version グループを
+    p{i}・v{i} に改名する。照合は1回で済み、一致したシグネチャは lastgroup で分かる。
+    """
+    alternatives = []
+    for index, (_, _, pattern) in enumerate(signatures):
+        pattern = pattern.replace(b'(?P<product>', b'(?P<p%d>' % index).replace(b'(?P<version>', b'(?P<v%d>' % index)
+        alternatives.append(b'(?P<s%d>%s)' % (index, pattern))
+    return re.compile(b'|'.join(alternatives), re.DOTALL)
+
+
+_SIGNATURE_PATTERN = _compile_signatures(SERVICE_SIGNATURES)
+
+
+def match_service_banner(data: bytes) -> Optional[Dict[str, str]]:
+    """
+    サービスの応答をシグネチャと照合
+
+    Args:
+        data: 接続直後のバナー、またはプローブへの応答
+
+    Returns:
+        Dict: {'service', 'product', 'version'}（一致しなかった場合None）
+    """
+    if not data:
+        return None
+    match = _SIGNATURE_PATTERN.match(data)
+    if match is None:
+        return None
+    index = int(match.lastgroup[1:])
+    service, product, _ = SERVICE_SIGNATURES[index]
+    groups = match.groupdict()
+
+    def text(name):
+        value = groups.get(f'{name}{index}')
+        return value.decode('utf-8', 'replace').strip() if value else ''
+
+    return {'service': service, 'product': product or text('p'), 'version': text('v')}
+
+
+def _response_digest(kind: str, data: bytes) -> str:
+    """サービスの応答からフィンガープリントを作る（時刻や Date ヘッダー等の変わる部分は除く）"""
+    if kind == 'http':
+        # ステータス行と Server ヘッダー
+        lines = data.split(b'\r\n')
+        parts = [lines[0].strip()]
+        parts.extend(line.strip() for line in lines[1:] if line.lower().startswith(b'server:'))
+        data = b'\n'.join(parts)
+    elif kind != 'tls':
+        # バナーの1行目（時刻を除く）
+        data = _BANNER_TIME_PATTERN.sub(b'', data.split(b'\n', 1)[0].strip())
+    return f"{kind}:{hashlib.sha256(data).hexdigest()}"
+
+
+async def _exchange(host: str, port: int, timeout: float, probe: Optional[bytes] = None) -> Optional[bytes]:
+    """
+    接続して最初の応答を読む（probe があれば先に送信する）
+
+    Returns:
+        bytes: 応答（何も送られてこなければ空）。接続できなかった場合None
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        if probe:
+            writer.write(probe)
+            await writer.drain()
+        # バナーはすぐ送られてくるため、待ち時間を短くする
+        return await asyncio.wait_for(reader.read(1024), timeout if probe else timeout / 2)
+    except (OSError, asyncio.TimeoutError):
+        return b''
+    finally:
+        writer.close()
+
+
+async def _grab_response(host: str, port: int, timeout: float) -> Optional[Tuple[str, bytes]]:
+    """
+    サービスの応答を取得（nmap -sV よりはるかに軽い確認用）
+
+    1. 接続直後に送られてくるバナー（SSH・SMTP・FTP・MySQL等）、
+       またはポート番号に応じたプローブへの応答（Redis・PostgreSQL・RDP・SMB）
+    2. TLS証明書（HTTPS等）
+    3. HEAD リクエストへの応答（HTTP）
+    の順に試し、最初に得られたものを返す。
+
+    Returns:
+        Tuple: (種類, 応答)。種類は 'banner'・'response'・'tls'・'http'。何も得られなければNone
+    """
+    # 1. バナー、またはポート番号に応じたプローブ
+    probe = SERVICE_PROBES.get(port)
+    data = await _exchange(host, port, timeout, probe)
+    if data is None:
+        return None
+    if data:
+        return ('response' if probe else 'banner', data)
+
+    # 2. TLS証明書
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context, server_hostname=host), timeout
+        )
+        try:
+            certificate = writer.get_extra_info('ssl_object').getpeercert(binary_form=True)
+        finally:
+            writer.close()
+        if certificate:
+            return ('tls', certificate)
+    except (OSError, ssl.SSLError, asyncio.TimeoutError):
+        pass
+
+    # 3. HTTP
+    data = await _exchange(host, port, timeout, _HTTP_PROBE)
+    if data:
+        return ('http' if data.startswith(b'HTTP/') else 'response', data)
+    return None
+
+
+def grab_service_responses(host: str, ports: List[int],
+                           timeout: float = FINGERPRINT_TIMEOUT) -> Dict[int, Optional[Tuple[str, bytes]]]:
+    """
+    複数ポートの応答を同時に取得
+
+    Returns:
+        Dict: キー: ポート番号、値: (種類, 応答)（取得できなかった場合None）
+    """
+    async def run():
+        responses = await asyncio.gather(*(_grab_response(host, port, timeout) for port in ports))
+        return dict(zip(ports, responses))
+    return asyncio.run(run())
+
+
+def fingerprint_services(host: str, ports: List[int], timeout: float = FINGERPRINT_TIMEOUT) -> Dict[int, Optional[str]]:
+    """
+    複数ポートのフィンガープリントを同時に取得
+
+    Returns:
+        Dict: キー: ポート番号、値: フィンガープリント（取得できなかった場合None）
+    """
+    return {
+        port: _response_digest(*response) if response else None
+        for port, response in grab_service_responses(host, ports, timeout).items()
+    }
+
+
+class ServiceFingerprintCache:
+    """
+    サービス情報取得（nmap -sV）の結果キャッシュ
+
+    キーは (ホスト, ポート, プロトコル)。取得時のフィンガープリント（バナー・TLS証明書の
+    ハッシュ）と一致し、有効期間内の場合だけ再利用する。件数の上限を超えた場合は
+    最も長く使われていないものから削除する（LRU）。
+    """
+
+    def __init__(self, ttl: float = SERVICE_CACHE_TTL, max_entries: int = SERVICE_CACHE_MAX_ENTRIES):
+        """
+        キャッシュの初期化
+
+        Args:
+            ttl: 有効期間（秒）
+            max_entries: 最大件数
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, host: str, port: int, protocol: str, fingerprint: Optional[str]) -> Optional[Dict]:
+        """
+        キャッシュ済みのポート情報を取得
+
+        Returns:
+            Dict: ポート情報のコピー（未登録・期限切れ・フィンガープリント不一致の場合None）
+        """
+        key = (host, port, protocol)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or fingerprint is None:
+                self.misses += 1
+                return None
+            stored_fingerprint, port_info, expires = entry
+            if stored_fingerprint != fingerprint or expires < time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(port_info)
+
+    def put(self, host: str, port: int, protocol: str, fingerprint: Optional[str], port_info: Dict):
+        """ポート情報を登録（フィンガープリントがない場合は登録しない）"""
+        if fingerprint is None:
+            return
+        key = (host, port, protocol)
+        with self._lock:
+            self._entries[key] = (fingerprint, dict(port_info), time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, host: Optional[str] = None):
+        """キャッシュを削除（host を指定した場合はそのホストの分のみ）"""
+        with self._lock:
+            if host is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == host]:
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        キャッシュの状況を取得
+
+        Returns:
+            Dict: {'entries': 件数, 'hits': ヒット数, 'misses': ミス数}
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# HTTP詳細情報の取得対象のポート（サービス名に http を含むポートも対象）と、先にHTTPSを試すポート
+HTTP_PORTS = (80, 443, 8080, 8443, 3000, 3001, 5000, 5001, 5050, 8000, 8888)
+HTTPS_PORTS = (443, 8443)
+# HTTP詳細情報の取得のタイムアウト秒数と同時実行数（接続プールの大きさも同じ）
+HTTP_INFO_TIMEOUT = 3
+HTTP_INFO_WORKERS = 8
+# HTTP詳細情報キャッシュの有効期間（秒）と最大件数
+HTTP_INFO_CACHE_TTL = 10 * 60
+HTTP_INFO_CACHE_MAX_ENTRIES = 1024
+
+
+def is_http_port(port_info: Dict) -> bool:
+    """開いているHTTP系のポート（HTTP_PORTS、またはサービス名に http を含む）の場合True"""
+    if port_info.get('state', 'open') != 'open':
+        return False
+    return port_info.get('port') in HTTP_PORTS or 'http' in (port_info.get('service') or '')
+
+
+def _new_http_session(pool_size: int = HTTP_INFO_WORKERS) -> requests.Session:
+    """
+    HTTP詳細情報の取得に使うセッション（接続を再利用し、TCP・TLSのハンドシェイクを省く）
+
+    接続プールは urllib3 がスレッドセーフに管理するため、複数のスレッドで共有する。
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # 自己署名証明書も許可
+    session.verify = False
+    return session
+
+
+class HttpInfoCache:
+    """
+    HTTP詳細情報（get_http_info の結果）のキャッシュ
+
+    キーは (ホスト, ポート, スキーム)。有効期間内はそのまま再利用し、期限切れの後も
+    応答の ETag・Last-Modified とともに保持して、条件付きリクエスト（If-None-Match・
+    If-Modified-Since）での再検証に使う。件数の上限を超えた場合は最も長く使われていない
+    ものから削除する（LRU）。取得できなかった結果（タイムアウト・接続拒否など）は登録しない。
+    """
+
+    def __init__(self, ttl: float = HTTP_INFO_CACHE_TTL, max_entries: int = HTTP_INFO_CACHE_MAX_ENTRIES):
+        """
+        キャッシュの初期化
+
+        Args:
+            ttl: 有効期間（秒）
+            max_entries: 最大件数
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def lookup(self, host: str, port: int, scheme: str) -> Optional[Dict]:
+        """
+        キャッシュ済みのエントリを取得（期限切れでも返す）
+
+        Returns:
+            Dict: {'info': HTTP詳細情報のコピー, 'etag', 'last_modified', 'fresh': 有効期間内の場合True}
+                  （未登録の場合None）
+        """
+        key = (host, port, scheme)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            info, etag, last_modified, expires = entry
+            self._entries.move_to_end(key)
+            return {'info': dict(info), 'etag': etag, 'last_modified': last_modified, 'fresh': expires >= time.time()}
+
+    def is_fresh(self, host: str, port: int, scheme: str) -> bool:
+        """有効期間内のエントリがある場合True"""
+        with self._lock:
+            entry = self._entries.get((host, port, scheme))
+            return entry is not None and entry[3] >= time.time()
+
+    def put(self, host: str, port: int, scheme: str, info: Dict,
+            etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """HTTP詳細情報を登録（etag・last_modified は再検証に使う応答ヘッダーの値）"""
+        key = (host, port, scheme)
+        with self._lock:
+            self._entries[key] = (dict(info), etag, last_modified, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, host: str, port: int, scheme: str):
+        """エントリを削除（取得できなくなったポートの古い情報を返さないようにする）"""
+        with self._lock:
+            self._entries.pop((host, port, scheme), None)
+
+    def touch(self, host: str, port: int, scheme: str):
+        """再検証で変更がなかったエントリの有効期間を延ばす"""
+        key = (host, port, scheme)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = entry[:3] + (time.time() + self.ttl,)
+                self._entries.move_to_end(key)
+
+    def record(self, outcome: str):
+        """取得結果（'hit'・'revalidated'・'miss'）を数える"""
+        with self._lock:
+            if outcome == 'hit':
+                self.hits += 1
+            elif outcome == 'revalidated':
+                self.revalidated += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self, host: Optional[str] = None):
+        """キャッシュを削除（host を指定した場合はそのホストの分のみ）"""
+        with self._lock:
+            if host is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == host]:
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        キャッシュの状況を取得
+
+        Returns:
+            Dict: {'entries': 件数, 'hits': ヒット数, 'revalidated': 再検証で変更がなかった数, 'misses': ミス数}
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'revalidated': self.revalidated,
+                    'misses': self.misses}
+
 
 class NetworkScanner:
     """ネットワークスキャンを実行するクラス"""
 
-    def __init__(self):
-        """スキャナーの初期化"""
+    def __init__(self, max_nmap_processes: int = DEFAULT_MAX_NMAP_PROCESSES):
+        """
+        スキャナーの初期化
+
+        Args:
+            max_nmap_processes: nmapプロセスの同時実行数の上限
+        """
         self.scan_results = {}
         self.nmap_available = False
         self.nmap_error = None
         self.sudo_password = None
-
-        try:
-            self.nm = nmap.PortScanner()
-            self.nmap_available = True
-        except Exception as e:
-            self.nmap_error = str(e)
+        # root権限のnmapを実行する常駐ヘルパー（set_sudo_password で起動）
+        self.nmap_helper = None
+        # ヘルパーを起動できなかった理由（設定されている間はスキャンごとに sudo nmap を実行する）
+        self.nmap_helper_error = None
+        self._nmap_helper_lock = threading.Lock()
+        self.nmap_budget = NmapProcessBudget(max_nmap_processes)
+        # サービス情報取得（nmap -sV）の結果キャッシュ
+        self.service_cache = ServiceFingerprintCache()
+        # HTTP詳細情報の取得（接続を再利用するセッション、同時実行数を制限するスレッドプール、結果キャッシュ）
+        # auto_http_prefetch が True の場合、ポートスキャンで見つかったHTTP系のポートの情報を先に取得しておく
+        self.http_session = _new_http_session()
+        self.http_info_cache = HttpInfoCache()
+        self.auto_http_prefetch = True
+        self._http_executor = ThreadPoolExecutor(max_workers=HTTP_INFO_WORKERS, thread_name_prefix='http-info')
+        # 取得中のHTTP詳細情報（キー: (ホスト, ポート)、値: Future）。同じポートへの重複リクエストを防ぐ
+        self._http_pending = {}
+        self._http_pending_lock = threading.Lock()
+        # インターフェース情報のキャッシュ（_get_interface_info を参照）
+        self._interface_info = None
+        self._interface_info_time = 0.0
+        self._interface_fingerprint = None
+        self._interface_lock = threading.Lock()
+
+        # nmapのパス・バージョンは1回だけ解決し、全てのnmap実行で共有する
+        self.nmap_runner = NmapRunner()
+        self.nmap_available = self.nmap_runner.available
+        self.nmap_error = self.nmap_runner.error
+        if not self.nmap_available:
             print("=" * 80)
             print("エラー: nmapがシステムにインストールされていません")
             print("=" * 80)
@@ -45,17 +2740,67 @@ class NetworkScanner:
             print("\nWindowsの場合:")
             print("  https://nmap.org/download.html からダウンロードしてインストール")
             print("=" * 80)
-            self.nm = None
 
     def set_sudo_password(self, password: str):
         """
-        sudoパスワードを設定
+        sudoパスワードを設定し、root権限のnmapを実行する常駐ヘルパーを起動
+
+        sudo でPythonの実行が許可されていない等でヘルパーを起動できない場合は、
+        スキャンごとに sudo nmap を実行する方式に切り替える。
 
         Args:
             password: sudoパスワード
+
+        Raises:
+            SudoAuthenticationError: パスワードが正しくない場合
+        """
+        helper = PrivilegedNmapHelper(password)
+        helper_error = None
+        try:
+            helper.start()
+        except SudoAuthenticationError:
+            raise
+        except NmapHelperError as e:
+            helper = None
+            helper_error = str(e)
+        with self._nmap_helper_lock:
+            previous, self.nmap_helper = self.nmap_helper, helper
+            self.nmap_helper_error = helper_error
+            self.sudo_password = password
+        if previous is not None:
+            previous.stop()
+        if helper is None:
+            print(f"⚠ root権限のnmapヘルパーを起動できません: {helper_error}")
+            print("  スキャンごとに sudo nmap を実行します")
+        else:
+            print("sudoパスワードが設定されました（root権限のnmapヘルパーを起動しました）")
+
+    def _get_nmap_helper(self) -> Optional[PrivilegedNmapHelper]:
+        """
+        実行中の常駐ヘルパーを取得（終了していた場合は設定済みのパスワードで起動し直す）
+
+        Returns:
+            PrivilegedNmapHelper: ヘルパー（起動できない場合None。スキャンごとに sudo nmap を実行する）
+
+        Raises:
+            SudoAuthenticationError: パスワードが正しくない場合
         """
-        self.sudo_password = password
-        print("sudoパスワードが設定されました")
+        with self._nmap_helper_lock:
+            if self.nmap_helper_error is not None:
+                return None
+            if self.nmap_helper is None or not self.nmap_helper.is_alive():
+                print("root権限のnmapヘルパーを起動し直します")
+                helper = PrivilegedNmapHelper(self.sudo_password)
+                try:
+                    helper.start()
+                except SudoAuthenticationError:
+                    raise
+                except NmapHelperError as e:
+                    print(f"⚠ root権限のnmapヘルパーを起動できません: {e}（スキャンごとに sudo nmap を実行します）")
+                    self.nmap_helper_error = str(e)
+                    return None
+                self.nmap_helper = helper
+            return self.nmap_helper
 
     def check_nmap_available(self) -> bool:
         """
@@ -66,222 +2811,309 @@ class NetworkScanner:
         """
         return self.nmap_available
 
+    def _get_interface_info(self) -> Dict:
+        """
+        インターフェース情報を取得（キャッシュ付き）
+
+        INTERFACE_CACHE_TTL 秒ごと、またはインターフェースの増減を検知したときに読み直す。
+
+        Returns:
+            Dict: read_interface_networks() の結果に、ローカルアドレスの集合 'local_addresses' を加えたもの
+        """
+        try:
+            fingerprint = tuple(socket.if_nameindex())
+        except OSError:
+            fingerprint = None
+
+        with self._interface_lock:
+            if (self._interface_info is not None
+                    and fingerprint == self._interface_fingerprint
+                    and time.time() - self._interface_info_time < INTERFACE_CACHE_TTL):
+                return self._interface_info
+
+            try:
+                info = read_interface_networks()
+            except Exception as e:
+                print(f"インターフェース情報取得エラー: {e}")
+                info = {'interfaces': [], 'gateways': [], 'default_address': None}
+
+            info['local_addresses'] = frozenset(
+                ['127.0.0.1', 'localhost', '::1'] + [str(interface.ip) for _, interface in info['interfaces']]
+            )
+            self._interface_info = info
+            self._interface_info_time = time.time()
+            self._interface_fingerprint = fingerprint
+            return info
+
+    def invalidate_interface_cache(self):
+        """インターフェース情報のキャッシュを破棄（次回アクセス時に読み直す）"""
+        with self._interface_lock:
+            self._interface_info = None
+
     def get_local_ip(self) -> str:
         """
-        ローカルIPアドレスを取得
+        ローカルIPアドレスを取得（デフォルトルートのインターフェースのアドレス）
 
         Returns:
             str: ローカルIPアドレス
         """
-        try:
-            # ダミーのUDP接続を作成してローカルIPを取得
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            return local_ip
-        except Exception as e:
-            print(f"ローカルIP取得エラー: {e}")
-            return "127.0.0.1"
+        return self._get_interface_info()['default_address'] or "127.0.0.1"
+
+    def local_addresses(self) -> frozenset:
+        """
+        このマシンのアドレスの集合（ループバック・"localhost" を含む）
+
+        Returns:
+            frozenset: IPアドレス文字列の集合
+        """
+        return self._get_interface_info()['local_addresses']
+
+    def is_local_address(self, host: str) -> bool:
+        """
+        ホストがこのマシン自身かどうか
+
+        Args:
+            host: IPアドレスまたは "localhost"
+
+        Returns:
+            bool: このマシンのアドレスの場合True
+        """
+        return host in self.local_addresses() or host.startswith('127.') or host.startswith('::')
 
     def detect_subnets(self, include_docker: bool = True) -> List[str]:
         """
         ローカルネットワークのサブネットを検出
 
+        インターフェースに割り当てられた実際のプレフィックス長を使う。ただし /16 より広い
+        ネットワークはスキャン量が膨大になるため、自分のアドレスを含む /16 に絞る。
+
         Args:
-            include_docker: Dockerネットワーク（172.x.x.x）も検出する場合True
+            include_docker: Dockerネットワーク（172.16.0.0/12）・10.0.0.0/8 も検出する場合True
 
         Returns:
             List[str]: 検出されたサブネットのリスト（例: ["192.168.0.0/24", "172.17.0.0/16"]）
         """
+        private_networks = [ipaddress.IPv4Network('192.168.0.0/16')]
+        if include_docker:
+            private_networks += [ipaddress.IPv4Network('172.16.0.0/12'), ipaddress.IPv4Network('10.0.0.0/8')]
+
+        info = self._get_interface_info()
         subnets = []
-        local_ip = self.get_local_ip()
+        for _, interface in info['interfaces']:
+            if not any(interface.ip in network for network in private_networks):
+                continue
+            network = interface.network
+            if network.prefixlen < 16:
+                network = ipaddress.IPv4Interface(f"{interface.ip}/16").network
+            subnet = str(network)
+            if subnet not in subnets:
+                # デフォルトルートのインターフェースのサブネットを先頭にする
+                if str(interface.ip) == info['default_address']:
+                    subnets.insert(0, subnet)
+                else:
+                    subnets.append(subnet)
 
-        # ローカルIPから所属サブネットを判定
-        ip_parts = local_ip.split('.')
-        if ip_parts[0] == '192' and ip_parts[1] == '168':
-            # 現在のサブネットを追加
-            subnet = f"192.168.{ip_parts[2]}.0/24"
-            subnets.append(subnet)
+        return subnets if subnets else ["192.168.0.0/24"]
 
-        # 複数のネットワークインターフェースから全てのサブネットを検出
-        try:
-            if platform.system() == 'Linux':
-                result = subprocess.run(['ip', 'addr'], capture_output=True, text=True, timeout=5)
-                output = result.stdout
-
-                # 192.168.x.x のアドレスを抽出
-                pattern = r'inet (192\.168\.\d+\.\d+)/(\d+)'
-                matches = re.findall(pattern, output)
-                for match in matches:
-                    ip, netmask = match
-                    ip_parts = ip.split('.')
-                    subnet = f"192.168.{ip_parts[2]}.0/{netmask}"
-                    if subnet not in subnets:
-                        subnets.append(subnet)
-
-                # Dockerネットワーク（172.x.x.x、10.x.x.x）を検出
-                if include_docker:
-                    # 172.x.x.x（Dockerデフォルト: 172.17.0.0/16など）
-                    pattern_docker = r'inet (172\.\d+\.\d+\.\d+)/(\d+)'
-                    matches_docker = re.findall(pattern_docker, output)
-                    for match in matches_docker:
-                        ip, netmask = match
-                        ip_parts = ip.split('.')
-                        # /16 または /24 の範囲に正規化
-                        if int(netmask) >= 24:
-                            subnet = f"172.{ip_parts[1]}.{ip_parts[2]}.0/24"
-                        else:
-                            subnet = f"172.{ip_parts[1]}.0.0/16"
-                        if subnet not in subnets:
-                            subnets.append(subnet)
-
-                    # 10.x.x.x（プライベートネットワーク）
-                    pattern_10 = r'inet (10\.\d+\.\d+\.\d+)/(\d+)'
-                    matches_10 = re.findall(pattern_10, output)
-                    for match in matches_10:
-                        ip, netmask = match
-                        ip_parts = ip.split('.')
-                        if int(netmask) >= 24:
-                            subnet = f"10.{ip_parts[1]}.{ip_parts[2]}.0/24"
-                        else:
-                            subnet = f"10.{ip_parts[1]}.0.0/16"
-                        if subnet not in subnets:
-                            subnets.append(subnet)
-
-            elif platform.system() == 'Darwin':  # macOS
-                result = subprocess.run(['ifconfig'], capture_output=True, text=True, timeout=5)
-                output = result.stdout
-
-                # 192.168.x.x のアドレスを抽出
-                pattern = r'inet (192\.168\.\d+\.\d+)'
-                matches = re.findall(pattern, output)
-                for match in matches:
-                    ip_parts = match.split('.')
-                    subnet = f"192.168.{ip_parts[2]}.0/24"
-                    if subnet not in subnets:
-                        subnets.append(subnet)
-
-                # Dockerネットワーク（172.x.x.x、10.x.x.x）を検出
-                if include_docker:
-                    # 172.x.x.x（Dockerデフォルト: 172.17.0.0/16など）
-                    pattern_docker = r'inet (172\.\d+\.\d+\.\d+)'
-                    matches_docker = re.findall(pattern_docker, output)
-                    for match in matches_docker:
-                        ip_parts = match.split('.')
-                        # 一般的にDockerは/16
-                        subnet = f"172.{ip_parts[1]}.0.0/16"
-                        if subnet not in subnets:
-                            subnets.append(subnet)
-
-                    # 10.x.x.x（プライベートネットワーク）
-                    pattern_10 = r'inet (10\.\d+\.\d+\.\d+)'
-                    matches_10 = re.findall(pattern_10, output)
-                    for match in matches_10:
-                        ip_parts = match.split('.')
-                        subnet = f"10.{ip_parts[1]}.0.0/16"
-                        if subnet not in subnets:
-                            subnets.append(subnet)
+    def _run_nmap_scan(self, hosts: str, arguments: str, cancel_token: Optional[CancelToken] = None) -> List[Dict]:
+        """
+        nmapを実行し、XML出力を逐次パースしてホスト情報を返す（NmapRunner.run を参照）
 
-        except Exception as e:
-            print(f"サブネット検出エラー: {e}")
+        Args:
+            hosts: スキャン対象
+            arguments: nmapの引数
+            cancel_token: キャンセル通知
 
-        return subnets if subnets else ["192.168.0.0/24"]
+        Returns:
+            List[Dict]: iter_nmap_xml のホスト情報のリスト
 
-    def _split_subnet_into_chunks(self, subnet: str, chunk_size: int = 24) -> List[str]:
+        Raises:
+            ScanCancelled: 実行前・実行中にキャンセルされた場合
+            Exception: XMLを読み取れなかった場合（root権限が必要な引数など）
         """
-        サブネットを小さなチャンクに分割（並列スキャン用）
+        run = self.nmap_runner.run(shlex.split(hosts) + shlex.split(arguments), cancel_token)
+        if cancel_token is not None:
+            cancel_token.check()
+
+        if run['parse_error'] is not None:
+            # python-nmap（nm.scan）と同じく、警告以外の標準エラー出力をエラーとして扱う
+            error_trace = [line for line in run['stderr'].splitlines()
+                           if line.strip() and not line.lower().startswith('warning: ')]
+            raise Exception('\n'.join(error_trace).strip() or f"nmapの出力を読み取れませんでした: {run['parse_error']}")
+        return run['hosts']
+
+    def _scan_single_chunk(self, chunk: str, original_subnet: str,
+                           cancel_token: Optional[CancelToken] = None) -> Dict[str, Dict]:
+        """
+        単一チャンクをスキャン（スレッドセーフ、並列実行用）
 
         Args:
-            subnet: 分割対象のサブネット（例: "172.17.0.0/16"）
-            chunk_size: チャンクのプレフィックスサイズ（デフォルト: 24）
+            chunk: スキャン対象のチャンク（例: "192.168.0.0/24"）
+            original_subnet: 元のサブネット（結果に記録用）
+            cancel_token: キャンセル通知（キャンセル時は空の結果を返す）
 
         Returns:
-            List[str]: 分割されたサブネットのリスト
+            Dict: スキャン結果
         """
-        chunks = []
+        results = {}
+        if _cancelled(cancel_token):
+            return results
 
-        # IP範囲形式の場合はそのまま返す
-        if '-' in subnet and '/' not in subnet:
-            return [subnet]
+        try:
+            # nmapの同時実行数は nmap_budget で制限
+            with self.nmap_budget.slot(_priority(cancel_token), cancel_token):
+                hosts_found = self._run_nmap_scan(chunk, PING_SCAN_ARGUMENTS, cancel_token)
+
+            for record in hosts_found:
+                host_info = _ping_host_info(record, original_subnet)
+                if host_info is None:
+                    continue
+                ip, info = host_info
+                results[ip] = info
+
+                # 見つかったホストをリアルタイムで表示
+                print(f"  ✓ {ip:15s} - {info['hostname']}")
+
+        except ScanCancelled:
+            pass
+        except Exception as e:
+            print(f"チャンク {chunk} のスキャンエラー: {e}")
 
-        # サブネット形式の場合
-        if '/' in subnet:
-            ip_part, prefix = subnet.split('/')
-            prefix = int(prefix)
+        return results
 
-            # /24以下（小さい範囲）の場合はそのまま返す
-            if prefix >= chunk_size:
-                return [subnet]
+    def _async_ping_scan(self, subnets: List[str], progress_callback=None,
+                         exclude: Optional[List[str]] = None, host_callback=None,
+                         probe_ports: Optional[List[int]] = None,
+                         probe_timeout: Optional[float] = None,
+                         cancel_token: Optional[CancelToken] = None) -> Dict[str, Dict]:
+        """
+        asyncio TCPコネクト方式でホスト検出を実行（nmap不要）
 
-            # /16など大きな範囲の場合は/24に分割
-            ip_octets = ip_part.split('.')
-            base_ip = '.'.join(ip_octets[:2])  # 最初の2オクテット（例: 172.17）
+        Args:
+            subnets: スキャン対象のリスト（例: ["192.168.0.0/24"]）。複数指定時は同時にスキャンする
+            progress_callback: 進捗コールバック関数 callback(probed_hosts, total_hosts, found_hosts)
+            exclude: 除外する範囲のリスト
+            host_callback: ホスト検出時のコールバック関数 callback(ip, host_info)
+            probe_ports: プローブ先ポートのリスト（デフォルト: DISCOVERY_PORTS）
+            probe_timeout: 1接続あたりのタイムアウト秒数（デフォルト: 1.0）
+            cancel_token: キャンセル通知
 
-            # /16の場合、256個の/24サブネットに分割
-            if prefix == 16:
-                for third_octet in range(256):
-                    chunks.append(f"{base_ip}.{third_octet}.0/24")
-            # /8の場合はさらに細かく分割（実際にはあまり使われない）
-            elif prefix == 8:
-                for second_octet in range(256):
-                    for third_octet in range(256):
-                        chunks.append(f"{ip_octets[0]}.{second_octet}.{third_octet}.0/24")
-            # その他の場合は適切に分割
-            else:
-                # 簡易実装：とりあえずそのまま返す
-                chunks.append(subnet)
+        Returns:
+            Dict: スキャン結果（キー: IPアドレス、値: ホスト情報）
+        """
+        results = {}
+        try:
+            start_time = time.time()
+            engine = AsyncHostDiscovery(ports=probe_ports, timeout=probe_timeout or 1.0)
 
-        return chunks if chunks else [subnet]
+            print(f"\n{'='*60}")
+            print(f"ホスト検出開始 (asyncio TCPコネクト): {', '.join(subnets)}")
+            print(f"{'='*60}")
+            print(f"プローブ先ポート: {','.join(map(str, engine.ports))} (同時接続 最大{engine.concurrency})")
+            print("見つかったホスト:")
+
+            results = engine.scan_many(subnets, progress_callback=progress_callback, exclude=exclude,
+                                       host_callback=host_callback, cancel_token=cancel_token)
+
+            elapsed_time = time.time() - start_time
+            print(f"\n{'='*60}")
+            print(f"スキャン完了: {len(results)}台のホストを検出")
+            print(f"所要時間: {elapsed_time:.1f}秒")
+            print(f"{'='*60}\n")
+
+        except Exception as e:
+            print(f"\nホスト検出エラー: {e}\n")
 
-    def _scan_single_chunk(self, chunk: str, original_subnet: str) -> Dict[str, Dict]:
+        return results
+
+    def _stream_ping_scan(self, subnets: List[str], progress_callback=None,
+                          exclude: Optional[List[str]] = None, host_callback=None,
+                          cancel_token: Optional[CancelToken] = None) -> Dict[str, Dict]:
         """
-        単一チャンクをスキャン（スレッドセーフ、並列実行用）
+        1つのnmapプロセスでPingスキャンを実行し、XML出力（-oX -）を逐次パース
+
+        <host> 要素が出力された時点でホストを結果に追加し、progress_callback に通知する。
+        進捗は nmap の --stats-every による <taskprogress> 要素から取得する。
 
         Args:
-            chunk: スキャン対象のチャンク（例: "192.168.0.0/24"）
-            original_subnet: 元のサブネット（結果に記録用）
+            subnets: スキャン対象のリスト（例: ["172.17.0.0/16", "192.168.0.1-50"]）
+            progress_callback: 進捗コールバック関数 callback(current, total, found_hosts)
+                               （current/total は 0〜1000 の千分率）
+            exclude: 除外する範囲のリスト
+            host_callback: ホスト検出時のコールバック関数 callback(ip, host_info)
+            cancel_token: キャンセル通知（キャンセル時はnmapを終了し、それまでの結果を返す）
 
         Returns:
-            Dict: スキャン結果
+            Dict: スキャン結果（キー: IPアドレス、値: ホスト情報）
         """
         results = {}
+        progress_total = 1000
+        progress_current = 0
+        compiled = CompiledTargets(subnets, exclude)
+        targets = compiled.nmap_targets()
+        if not targets or _cancelled(cancel_token):
+            return results
 
         try:
-            # スレッドごとに独立したnmapインスタンスを作成
-            nm = nmap.PortScanner()
-            # 高速化オプション:
-            # -sn: PINGスキャン（ポートスキャンなし）
-            # -T4: 高速タイミング（aggressive）
-            # --min-rate 300: 1秒あたり最低300パケット送信
-            # --host-timeout 10s: ホストごとのタイムアウト10秒
-            # --max-retries 1: 再試行回数を1回に制限
-            nm.scan(hosts=chunk, arguments='-sn -T4 --min-rate 300 --host-timeout 10s --max-retries 1')
-
-            for host in nm.all_hosts():
-                if nm[host].state() == 'up':
-                    hostname = nm[host].hostname() if nm[host].hostname() else 'Unknown'
-                    vendor = ''
-                    if 'mac' in nm[host]['addresses']:
-                        mac = nm[host]['addresses']['mac']
-                        vendor = nm[host]['vendor'].get(mac, '') if 'vendor' in nm[host] else ''
-
-                    results[host] = {
-                        'hostname': hostname,
-                        'state': 'up',
-                        'vendor': vendor,
-                        'subnet': original_subnet
-                    }
+            start_time = time.time()
+
+            print(f"\n{'='*60}")
+            print(f"Pingスキャン開始 (ストリーミング): {', '.join(subnets)}")
+            print(f"{'='*60}")
+            print("見つかったホスト:")
+
+            def on_record(kind, record):
+                nonlocal progress_current
+                if kind == 'progress':
+                    progress_current = min(progress_total - 1, int(record * 10))
+                    if progress_callback:
+                        progress_callback(progress_current, progress_total, len(results))
+                    return
+                host_info = _ping_host_info(record, '')
+                if host_info is None:
+                    return
+                ip, info = host_info
+                info['subnet'] = compiled.label_for(ip) or subnets[0]
+                results[ip] = info
+                print(f"  ✓ {ip:15s} - {info['hostname']}")
+                if host_callback:
+                    host_callback(ip, info)
+                if progress_callback:
+                    progress_callback(progress_current, progress_total, len(results))
+
+            with self.nmap_budget.slot(_priority(cancel_token), cancel_token):
+                # ターゲットは標準入力（-iL -）で渡し、XMLは標準出力（-oX -）で受け取る
+                # キャンセル・エラー終了で出力が途中で終わった場合も、それまでに検出したホストは結果に残る
+                run = self.nmap_runner.run(
+                    PING_SCAN_ARGUMENTS.split() + ['--stats-every', '2s', '-iL', '-'],
+                    cancel_token,
+                    input='\n'.join(' '.join(targets).split()) + '\n',
+                    on_record=on_record
+                )
+            if run['returncode'] != 0 and not _cancelled(cancel_token):
+                print(f"nmapエラー出力: {run['stderr']}")
+
+            if progress_callback and not _cancelled(cancel_token):
+                progress_callback(progress_total, progress_total, len(results))
 
-                    # 見つかったホストをリアルタイムで表示
-                    print(f"  ✓ {host:15s} - {hostname}")
+            elapsed_time = time.time() - start_time
+            print(f"\n{'='*60}")
+            print(f"スキャン完了: {len(results)}台のホストを検出")
+            print(f"所要時間: {elapsed_time:.1f}秒")
+            print(f"{'='*60}\n")
 
+        except ScanCancelled:
+            pass
         except Exception as e:
-            print(f"チャンク {chunk} のスキャンエラー: {e}")
+            print(f"\nPingスキャンエラー: {e}\n")
 
         return results
 
-    def ping_scan(self, subnet: str, progress_callback=None, max_threads: int = 10) -> Dict[str, Dict]:
+    def ping_scan(self, subnet: str, progress_callback=None, max_threads: int = 10,
+                  engine: str = 'nmap', exclude: Optional[List[str]] = None,
+                  host_callback=None, probe_ports: Optional[List[int]] = None,
+                  probe_timeout: Optional[float] = None,
+                  cancel_token: Optional[CancelToken] = None) -> Dict[str, Dict]:
         """
         指定されたサブネットに対してPingスキャン（nmap -sn）を並列実行
 
@@ -289,82 +3121,226 @@ class NetworkScanner:
             subnet: スキャン対象のサブネット（例: "192.168.0.0/24"）
             progress_callback: 進捗コールバック関数 callback(current, total, found_hosts)
             max_threads: 最大スレッド数（デフォルト: 10）
+            engine: ホスト検出エンジン（SCAN_ENGINES のいずれか）
+            exclude: 除外する範囲のリスト
+            host_callback: ホスト検出時のコールバック関数 callback(ip, host_info)
+            probe_ports: asyncエンジンのプローブ先ポートのリスト（デフォルト: DISCOVERY_PORTS）
+            probe_timeout: asyncエンジンの1接続あたりのタイムアウト秒数
+            cancel_token: キャンセル通知（ping_scan_many を参照）
 
         Returns:
             Dict: スキャン結果（キー: IPアドレス、値: ホスト情報）
         """
-        results = {}
-        results_lock = threading.Lock()  # スレッドセーフな結果格納用
+        return self.ping_scan_many([subnet], progress_callback=progress_callback,
+                                   max_threads=max_threads, engine=engine, exclude=exclude,
+                                   host_callback=host_callback, probe_ports=probe_ports,
+                                   probe_timeout=probe_timeout, cancel_token=cancel_token)
 
-        if not self.nmap_available:
+    def neighbor_hosts(self, subnets: List[str], exclude: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        近隣テーブル（ARP）に載っているホストのうち、スキャン対象に含まれるものを取得
+
+        パケットを送信せずにカーネルが既に知っているホストを返すため、アクティブスキャンの
+        前に呼ぶことで、スキャン完了を待たずに大半のホストを表示できる。
+
+        Args:
+            subnets: スキャン対象のリスト
+            exclude: 除外する範囲のリスト
+
+        Returns:
+            Dict: キー: IPアドレス、値: ホスト情報（vendor はMACアドレスから判定）
+        """
+        try:
+            compiled = CompiledTargets(subnets, exclude)
+        except ValueError:
+            return {}
+
+        hosts = {}
+        for ip, mac in read_neighbor_table().items():
+            label = compiled.label_for(ip)
+            if label is None:
+                continue
+            hosts[ip] = {
+                'hostname': 'Unknown',
+                'state': 'up',
+                'vendor': lookup_mac_vendor(mac),
+                'subnet': label
+            }
+        return hosts
+
+    def ping_scan_many(self, subnets: List[str], progress_callback=None, max_threads: int = 10,
+                       engine: str = 'nmap', exclude: Optional[List[str]] = None,
+                       host_callback=None, use_neighbors: bool = True,
+                       probe_ports: Optional[List[int]] = None,
+                       probe_timeout: Optional[float] = None,
+                       cancel_token: Optional[CancelToken] = None) -> Dict[str, Dict]:
+        """
+        複数のサブネットを1つの作業キューにまとめてPingスキャンを並列実行
+
+        スキャン前に近隣テーブル（ARP）に載っているホストを host_callback に通知し、
+        その後のアクティブスキャンで確認・追加する。スキャンで応答しなかった近隣テーブルの
+        ホストは state 'stale' として host_callback に再通知する。
+
+        Args:
+            subnets: スキャン対象のリスト（例: ["192.168.0.0/24", "172.17.0.0/16"]）
+            progress_callback: 進捗コールバック関数 callback(current, total, found_hosts)
+            max_threads: 最大スレッド数（デフォルト: 10）
+            engine: ホスト検出エンジン（SCAN_ENGINES のいずれか）
+            exclude: 除外する範囲のリスト
+            host_callback: ホスト検出時のコールバック関数 callback(ip, host_info)
+                           （結果全体を待たずに、検出したホストを逐次保存する場合に使用）
+            use_neighbors: 近隣テーブルのホストを先に通知する場合True
+            probe_ports: asyncエンジンのプローブ先ポートのリスト（デフォルト: DISCOVERY_PORTS）
+            probe_timeout: asyncエンジンの1接続あたりのタイムアウト秒数
+            cancel_token: キャンセル通知。キャンセル時は実行中のnmapを終了し、それまでに検出したホストを返す
+                          （応答を確認できなかった近隣テーブルのホストは 'stale' にしない）
+
+        Returns:
+            Dict: スキャン結果（キー: IPアドレス、値: ホスト情報）
+        """
+        if _cancelled(cancel_token):
+            # 開始前にキャンセルされたスキャンは近隣テーブルのホストも通知しない
+            return {}
+
+        seeded = {}
+        if use_neighbors:
+            seeded = self.neighbor_hosts(subnets, exclude)
+            if seeded:
+                print(f"近隣テーブルから {len(seeded)}台のホストを検出")
+                for ip, info in seeded.items():
+                    print(f"  ✓ {ip:15s} - {info['vendor'] or 'ARP'}")
+                    if host_callback:
+                        host_callback(ip, info)
+
+        if engine == 'async':
+            results = self._async_ping_scan(subnets, progress_callback=progress_callback, exclude=exclude,
+                                            host_callback=host_callback, probe_ports=probe_ports,
+                                            probe_timeout=probe_timeout, cancel_token=cancel_token)
+        elif not self.nmap_available:
             print(f"エラー: nmapが利用できません - {self.nmap_error}")
-            return results
+            results = {}
+        elif engine == 'nmap-stream':
+            results = self._stream_ping_scan(subnets, progress_callback=progress_callback, exclude=exclude,
+                                             host_callback=host_callback, cancel_token=cancel_token)
+        else:
+            results = self._chunked_ping_scan(subnets, progress_callback=progress_callback,
+                                              max_threads=max_threads, exclude=exclude,
+                                              host_callback=host_callback, cancel_token=cancel_token)
+
+        # 近隣テーブルのホストは応答がなければ 'stale' として結果に残し（生存数には含めない）、
+        # ベンダーが空なら近隣テーブルの値で補う
+        for ip, info in seeded.items():
+            if ip not in results:
+                if _cancelled(cancel_token):
+                    # 途中で止めたスキャンでは応答の有無が分からないため、近隣テーブルの情報のまま残す
+                    results[ip] = info
+                    continue
+                results[ip] = dict(info, state='stale')
+                if host_callback:
+                    host_callback(ip, results[ip])
+            elif not results[ip].get('vendor'):
+                results[ip]['vendor'] = info['vendor']
+        return results
+
+    def _chunked_ping_scan(self, subnets: List[str], progress_callback=None, max_threads: int = 10,
+                           exclude: Optional[List[str]] = None, host_callback=None,
+                           cancel_token: Optional[CancelToken] = None) -> Dict[str, Dict]:
+        """
+        チャンクごとに nmap -sn をスレッドプールで並列実行（'nmap' エンジン）
+
+        全サブネットを CompiledTargets で重複排除・除外適用してから、チャンクを
+        ラウンドロビンで1つのスレッドプールに投入する。小さな範囲が大きな範囲の完了を
+        待つことはなく、進捗も全体で1つの割合になる。
+
+        Args:
+            subnets: スキャン対象のリスト（例: ["192.168.0.0/24", "172.17.0.0/16"]）
+            progress_callback: 進捗コールバック関数 callback(current, total, found_hosts)
+            max_threads: 最大スレッド数（デフォルト: 10）
+            exclude: 除外する範囲のリスト
+            host_callback: ホスト検出時のコールバック関数 callback(ip, host_info)
+            cancel_token: キャンセル通知（キャンセル時は新しいチャンクを投入せず、実行中のnmapを終了する）
+
+        Returns:
+            Dict: スキャン結果（キー: IPアドレス、値: ホスト情報）
+        """
+        results = {}
+        results_lock = threading.Lock()  # スレッドセーフな結果格納用
 
         try:
-            import time
             start_time = time.time()
 
             print(f"\n{'='*60}")
-            print(f"Pingスキャン開始: {subnet}")
+            print(f"Pingスキャン開始: {', '.join(subnets)}")
             print(f"{'='*60}")
 
-            # サブネットを小さなチャンクに分割
-            chunks = self._split_subnet_into_chunks(subnet)
-            total_chunks = len(chunks)
-
-            # サブネットから想定ホスト数を計算
-            if '/' in subnet:
-                prefix = int(subnet.split('/')[1])
-                total_hosts = 2 ** (32 - prefix) - 2
-            else:
-                if '-' in subnet:
-                    parts = subnet.split('-')
-                    if len(parts) == 2 and '.' in parts[0]:
-                        start_ip = parts[0].split('.')[-1]
-                        end_ip = parts[1]
-                        total_hosts = int(end_ip) - int(start_ip) + 1
-                    else:
-                        total_hosts = 254
-                else:
-                    total_hosts = 1
-
+            # 重複排除・除外適用後の区間を小さなチャンクに分割し、(チャンク, サブネット) を交互に取り出す
+            compiled = CompiledTargets(subnets, exclude)
+            chunks = compiled.iter_chunks(max_threads)
+            total_chunks = compiled.count_chunks(max_threads)
+            total_hosts = compiled.num_addresses
+
+            if compiled.excluded:
+                print(f"除外: {compiled.num_excluded}アドレス")
+            if total_chunks == 0:
+                print("スキャン対象のアドレスがありません")
+                return results
             if total_chunks > 1:
                 print(f"高速スキャンモード: {total_chunks}個のチャンクを{max_threads}スレッドで並列実行")
             print(f"スキャン中... (最大{total_hosts}台のホストをチェック)")
             print("見つかったホスト:")
 
             # チャンクを並列スキャン
+            # 実行中のチャンク数を max_in_flight に制限し、完了するごとに次のチャンクを投入する
             completed_chunks = 0
+            max_in_flight = max_threads * 2
             with ThreadPoolExecutor(max_workers=max_threads) as executor:
-                # 全チャンクのスキャンを並列実行
-                future_to_chunk = {
-                    executor.submit(self._scan_single_chunk, chunk, subnet): chunk
-                    for chunk in chunks
-                }
+                future_to_chunk = {}
+
+                def submit_next_chunk() -> bool:
+                    if _cancelled(cancel_token):
+                        return False
+                    item = next(chunks, None)
+                    if item is None:
+                        return False
+                    chunk, subnet = item
+                    future_to_chunk[executor.submit(self._scan_single_chunk, chunk, subnet, cancel_token)] = chunk
+                    return True
+
+                for _ in range(max_in_flight):
+                    if not submit_next_chunk():
+                        break
 
                 # 完了したチャンクから結果を収集
-                for future in as_completed(future_to_chunk):
-                    chunk = future_to_chunk[future]
-                    try:
-                        chunk_results = future.result()
+                while future_to_chunk:
+                    done, _ = wait(future_to_chunk, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        chunk = future_to_chunk.pop(future)
+                        try:
+                            chunk_results = future.result()
 
-                        # スレッドセーフに結果をマージ
-                        with results_lock:
-                            results.update(chunk_results)
+                            # スレッドセーフに結果をマージ
+                            with results_lock:
+                                results.update(chunk_results)
 
-                        completed_chunks += 1
+                            if host_callback:
+                                for ip, info in chunk_results.items():
+                                    host_callback(ip, info)
 
-                        # 進捗表示
-                        if total_chunks > 1:
-                            progress_pct = int((completed_chunks / total_chunks) * 100)
-                            print(f"[進捗] {completed_chunks}/{total_chunks} チャンク完了 ({progress_pct}%) - 検出: {len(results)}台")
+                            completed_chunks += 1
 
-                        # 進捗コールバック
-                        if progress_callback:
-                            progress_callback(completed_chunks, total_chunks, len(results))
+                            # 進捗表示
+                            if total_chunks > 1:
+                                progress_pct = int((completed_chunks / total_chunks) * 100)
+                                print(f"[進捗] {completed_chunks}/{total_chunks} チャンク完了 ({progress_pct}%) - 検出: {len(results)}台")
 
-                    except Exception as e:
-                        print(f"チャンク {chunk} の処理エラー: {e}")
+                            # 進捗コールバック
+                            if progress_callback:
+                                progress_callback(completed_chunks, total_chunks, len(results))
+
+                        except Exception as e:
+                            print(f"チャンク {chunk} の処理エラー: {e}")
+
+                        submit_next_chunk()
 
             elapsed_time = time.time() - start_time
             print(f"\n{'='*60}")
@@ -379,7 +3355,10 @@ class NetworkScanner:
 
         return results
 
-    def scan_ip_range(self, target_range: str, progress_callback=None) -> Dict[str, Dict]:
+    def scan_ip_range(self, target_range: str, progress_callback=None, engine: str = 'nmap',
+                      exclude=None, host_callback=None, probe_ports: Optional[List[int]] = None,
+                      probe_timeout: Optional[float] = None,
+                      cancel_token: Optional[CancelToken] = None) -> Dict[str, Dict]:
         """
         指定されたIP範囲をスキャン（複数範囲対応）
 
@@ -389,51 +3368,29 @@ class NetworkScanner:
                 - IP範囲形式: "192.168.0.1-50"
                 - 複数範囲（カンマ区切り）: "192.168.0.0/24,172.17.0.0/16"
             progress_callback: 進捗コールバック関数 callback(current, total, found_hosts)
+            engine: ホスト検出エンジン（SCAN_ENGINES のいずれか）
+            exclude: 除外する範囲（カンマ区切り文字列またはリスト、例: "192.168.0.10,192.168.0.200-210"）
+            host_callback: ホスト検出時のコールバック関数 callback(ip, host_info)
+            probe_ports: asyncエンジンのプローブ先ポートのリスト（デフォルト: DISCOVERY_PORTS）
+            probe_timeout: asyncエンジンの1接続あたりのタイムアウト秒数
+            cancel_token: キャンセル通知（ping_scan_many を参照）
 
         Returns:
             Dict: スキャン結果
         """
-        if not self.nmap_available:
+        if engine != 'async' and not self.nmap_available:
             print(f"エラー: nmapが利用できません - {self.nmap_error}")
             return {}
 
-        # カンマ区切りで複数範囲が指定されている場合
-        if ',' in target_range:
-            ranges = [r.strip() for r in target_range.split(',')]
-            print(f"\n複数範囲スキャンモード: {len(ranges)}個の範囲を検出")
-            all_results = {}
+        ranges = _split_target_spec(target_range)
 
-            for idx, single_range in enumerate(ranges):
-                print(f"\n[{idx+1}/{len(ranges)}] {single_range} をスキャン中...")
+        # カンマ区切りで複数範囲が指定されている場合は、全範囲を1つの作業キューで同時にスキャン
+        if len(ranges) > 1:
+            print(f"\n複数範囲スキャンモード: {len(ranges)}個の範囲を同時にスキャン")
 
-                # 複数範囲の場合、各範囲の進捗を反映
-                def range_progress_callback(completed_chunks, total_chunks, found_hosts):
-                    if progress_callback:
-                        # 範囲全体の進捗を計算
-                        overall_completed = idx * 100 + int((completed_chunks / total_chunks) * 100)
-                        overall_total = len(ranges) * 100
-                        progress_callback(overall_completed, overall_total, len(all_results) + found_hosts)
-
-                results = self.scan_ip_range(single_range, progress_callback=range_progress_callback)  # 再帰呼び出し
-                all_results.update(results)
-
-            return all_results
-
-        # IP範囲形式を変換（192.168.0.1-50 → 192.168.0.1-192.168.0.50）
-        if '-' in target_range and '/' not in target_range and ',' not in target_range:
-            parts = target_range.split('-')
-            if len(parts) == 2:
-                base_ip = parts[0].strip()
-                end_num = parts[1].strip()
-                # IPアドレスのベース部分を取得（例: 192.168.0）
-                ip_parts = base_ip.split('.')
-                if len(ip_parts) == 4:
-                    base = '.'.join(ip_parts[:3])
-                    start_num = ip_parts[3]
-                    # nmap形式に変換
-                    target_range = f"{base}.{start_num}-{end_num}"
-
-        return self.ping_scan(target_range, progress_callback=progress_callback)
+        return self.ping_scan_many(ranges, progress_callback=progress_callback, engine=engine, exclude=exclude,
+                                   host_callback=host_callback, probe_ports=probe_ports,
+                                   probe_timeout=probe_timeout, cancel_token=cancel_token)
 
     def scan_all_subnets(self) -> Dict[str, Dict]:
         """
@@ -452,95 +3409,53 @@ class NetworkScanner:
         self.scan_results = all_results
         return all_results
 
-    def _run_nmap_with_sudo(self, host: str, arguments: str) -> Dict:
+    def _run_nmap_with_sudo(self, host: str, arguments: str,
+                            cancel_token: Optional[CancelToken] = None) -> List[Dict]:
         """
-        sudoを使用してnmapコマンドを実行
+        常駐ヘルパーを使用してroot権限でnmapを実行
+
+        ヘルパーから届いたXML出力は、届いた順に iter_nmap_xml で読み進める。ヘルパーを起動できない
+        場合はスキャンごとに sudo nmap を実行する。引数はどちらの場合も check_nmap_args で検査する。
 
         Args:
             host: スキャン対象のIPアドレス
             arguments: nmapの引数
+            cancel_token: キャンセル通知（キャンセル時はヘルパー・sudo が nmap を終了する）
 
         Returns:
-            Dict: スキャン結果（XMLパース後）
-        """
-        import subprocess
-        import tempfile
-        import xml.etree.ElementTree as ET
-
-        # 一時ファイルにXML出力を保存
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as tmp:
-            output_file = tmp.name
-
-        try:
-            # sudoでnmapを実行（パスワードを標準入力から渡す）
-            cmd = ['sudo', '-S', 'nmap', '-oX', output_file] + arguments.split() + [host]
-
-            process = subprocess.Popen(
-                cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-
-            # sudoパスワードを渡す
-            stdout, stderr = process.communicate(input=f"{self.sudo_password}\n", timeout=300)
-
-            if process.returncode != 0:
-                if 'incorrect password' in stderr.lower() or 'sorry' in stderr.lower():
-                    raise Exception("sudoパスワードが正しくありません")
-                print(f"nmap標準出力: {stdout}")
-                print(f"nmapエラー出力: {stderr}")
-
-            # XML結果を読み込んでパース
-            tree = ET.parse(output_file)
-            root = tree.getroot()
-
-            # 結果を辞書形式に変換
-            scan_result = {
-                'host': host,
-                'ports': [],
-                'os': ''
-            }
-
-            # ホスト情報を取得
-            for host_elem in root.findall('host'):
-                # ポート情報を取得
-                for port_elem in host_elem.findall('.//port'):
-                    port_id = port_elem.get('portid')
-                    protocol = port_elem.get('protocol')
-                    state_elem = port_elem.find('state')
-                    service_elem = port_elem.find('service')
-
-                    if state_elem is not None:
-                        state = state_elem.get('state')
-                        service_name = service_elem.get('name', '') if service_elem is not None else ''
-                        product = service_elem.get('product', '') if service_elem is not None else ''
-                        version = service_elem.get('version', '') if service_elem is not None else ''
-
-                        scan_result['ports'].append({
-                            'port': int(port_id),
-                            'protocol': protocol,
-                            'state': state,
-                            'service': service_name,
-                            'product': product,
-                            'version': version
-                        })
-
-                # OS情報を取得
-                osmatch = host_elem.find('.//osmatch')
-                if osmatch is not None:
-                    scan_result['os'] = osmatch.get('name', '')
-
-            return scan_result
-
-        finally:
-            # 一時ファイルを削除
-            import os
-            if os.path.exists(output_file):
-                os.remove(output_file)
+            List[Dict]: iter_nmap_xml のホスト情報のリスト
 
-    def port_scan(self, host: str, arguments: str = '-sS -sV', priority_only: bool = False, is_range_scan: bool = False, verbose: bool = True) -> Dict:
+        Raises:
+            ScanCancelled: 実行前・実行中にキャンセルされた場合
+            SudoAuthenticationError: sudoパスワードが正しくない場合
+            ValueError: root権限では使用できない引数が含まれている場合
+        """
+        args = shlex.split(arguments) + [host]
+        error = check_nmap_args(args)
+        if error is not None:
+            raise ValueError(error)
+        helper = self._get_nmap_helper()
+        with self.nmap_budget.slot(_priority(cancel_token), cancel_token):
+            if cancel_token is not None:
+                cancel_token.check()
+            if helper is not None:
+                run = self.nmap_runner.run(args, cancel_token, helper=helper)
+            else:
+                run = self.nmap_runner.run(args, cancel_token, sudo_password=self.sudo_password)
+        if cancel_token is not None:
+            cancel_token.check()
+
+        if helper is None and run['returncode'] != 0 and _is_sudo_auth_failure(run['stderr']):
+            raise SudoAuthenticationError(SUDO_AUTH_ERROR_MESSAGE)
+        if run['returncode'] != 0:
+            print(f"nmapエラー出力: {run['stderr']}")
+        if run['parse_error'] is not None:
+            raise Exception(f"nmapの実行に失敗しました: {run['stderr'].strip() or run['parse_error']}")
+        return run['hosts']
+
+    def port_scan(self, host: str, arguments: str = '-sS -sV', priority_only: bool = False, is_range_scan: bool = False,
+                  verbose: bool = True, priority_ports: Optional[List[int]] = None,
+                  cancel_token: Optional[CancelToken] = None) -> Dict:
         """
         指定されたホストに対して詳細ポートスキャンを実行
 
@@ -550,6 +3465,8 @@ class NetworkScanner:
             priority_only: Trueの場合、優先ポートのみスキャン
             is_range_scan: 範囲スキャンの場合True
             verbose: 詳細なログ出力（デフォルト: True）
+            priority_ports: 優先ポートスキャンの対象（省略時 DEFAULT_PRIORITY_PORTS、select_priority_ports を参照）
+            cancel_token: キャンセル通知（キャンセル時は実行中のnmapを終了し、'cancelled' を True にして返す）
 
         Returns:
             Dict: ポートスキャン結果
@@ -567,8 +3484,8 @@ class NetworkScanner:
             print(f"エラー: {result['error']}")
             return result
 
-        # 優先ポートの定義
-        priority_ports = [80, 8080, 5000, 5001, 5050, 3000, 3001]
+        # 優先ポート（スキャン履歴から選んだもの、なければ既定値）
+        priority_ports = priority_ports or DEFAULT_PRIORITY_PORTS
 
         try:
             import time
@@ -605,69 +3522,48 @@ class NetworkScanner:
                 print(f"[nmap実行] sudo nmap {scan_args} {host}")
                 print("sudo権限でnmapを実行中...")
                 # sudoでnmapを実行
-                sudo_result = self._run_nmap_with_sudo(host, scan_args)
-                result['ports'] = sudo_result['ports']
-                result['os'] = sudo_result['os']
-
-                # 結果を表示（verboseモードのみ）
-                if verbose and result['ports']:
-                    print("\n検出されたポート:")
-                    for port_info in result['ports']:
-                        service = port_info.get('service', 'unknown')
-                        version = port_info.get('version', '')
-                        product = port_info.get('product', '')
-                        version_str = f"{product} {version}".strip() if product or version else ""
-                        print(f"  ✓ {port_info['port']}/{port_info['protocol']:3s} - {service:15s} {version_str}")
-
-                if verbose and result['os']:
-                    print(f"\nOS検出: {result['os']}")
-
+                hosts_found = self._run_nmap_with_sudo(host, scan_args, cancel_token)
             else:
                 print(f"[nmap実行] nmap {scan_args} {host}")
                 print("スキャン中... (ポートとサービスを検出しています)")
                 # -sS はroot権限が必要なため、権限がない場合は -sT を使用
                 try:
-                    self.nm.scan(hosts=host, arguments=scan_args)
+                    with self.nmap_budget.slot(_priority(cancel_token), cancel_token):
+                        hosts_found = self._run_nmap_scan(host, scan_args, cancel_token)
+                except ScanCancelled:
+                    raise
                 except Exception as e:
                     # SYNスキャンが失敗した場合はTCPコネクトスキャンにフォールバック
                     if '-sS' in scan_args and not self.sudo_password:
                         print(f"⚠ SYNスキャンにはroot権限が必要です。TCPコネクトスキャンに切り替えます")
                         print(f"  ヒント: sudo設定からパスワードを設定すると-sSスキャンが使用できます")
                         scan_args = scan_args.replace('-sS', '-sT')
-                        self.nm.scan(hosts=host, arguments=scan_args)
+                        with self.nmap_budget.slot(_priority(cancel_token), cancel_token):
+                            hosts_found = self._run_nmap_scan(host, scan_args, cancel_token)
                     else:
                         raise
 
-                if host in self.nm.all_hosts():
-                    if verbose:
-                        print("\n検出されたポート:")
-                    # ポート情報を取得
-                    for proto in self.nm[host].all_protocols():
-                        ports = self.nm[host][proto].keys()
-                        for port in ports:
-                            port_info = self.nm[host][proto][port]
-                            result['ports'].append({
-                                'port': port,
-                                'protocol': proto,
-                                'state': port_info['state'],
-                                'service': port_info.get('name', ''),
-                                'version': port_info.get('version', ''),
-                                'product': port_info.get('product', '')
-                            })
-
-                            # 見つかったポートを表示（verboseモードのみ）
-                            if verbose:
-                                service = port_info.get('name', 'unknown')
-                                version = port_info.get('version', '')
-                                product = port_info.get('product', '')
-                                version_str = f"{product} {version}".strip() if product or version else ""
-                                print(f"  ✓ {port}/{proto:3s} - {service:15s} {version_str}")
-
-                    # OS情報（あれば）
-                    if 'osmatch' in self.nm[host]:
-                        if len(self.nm[host]['osmatch']) > 0:
-                            result['os'] = self.nm[host]['osmatch'][0]['name']
-                            print(f"\nOS検出: {result['os']}")
+            for record in hosts_found:
+                result['ports'].extend(record['ports'])
+                if record['os'] and not result['os']:
+                    result['os'] = record['os']
+
+            # 結果を表示（verboseモードのみ）
+            if verbose and result['ports']:
+                print("\n検出されたポート:")
+                for port_info in result['ports']:
+                    service = port_info.get('service', 'unknown')
+                    version = port_info.get('version', '')
+                    product = port_info.get('product', '')
+                    version_str = f"{product} {version}".strip() if product or version else ""
+                    print(f"  ✓ {port_info['port']}/{port_info['protocol']:3s} - {service:15s} {version_str}")
+
+            if verbose and result['os']:
+                print(f"\nOS検出: {result['os']}")
+
+            # HTTP系のポートの詳細情報を先に取得しておく（HTTP詳細の表示がキャッシュから返る）
+            if self.auto_http_prefetch and result['ports']:
+                self.prefetch_http_info(host, result['ports'])
 
             elapsed_time = time.time() - start_time
             if verbose:
@@ -677,12 +3573,84 @@ class NetworkScanner:
                 print(f"所要時間: {elapsed_time:.1f}秒")
                 print(f"{'='*60}\n")
 
+        except ScanCancelled as e:
+            print(f"\nポートスキャンをキャンセルしました ({host})\n")
+            result['error'] = str(e)
+            result['cancelled'] = True
         except Exception as e:
             print(f"\nポートスキャンエラー ({host}): {e}\n")
             result['error'] = str(e)
 
         return result
 
+    def detect_services(self, host: str, ports: List[int], engine: str = 'banner',
+                        arguments: str = SERVICE_SCAN_ARGUMENTS,
+                        cancel_token: Optional[CancelToken] = None) -> Dict:
+        """
+        指定ポートのサービス情報を取得（キャッシュを利用）
+
+        各ポートのバナー（またはプローブ・TLS証明書・HEAD リクエストへの応答）を取得し、
+        banner エンジンではシグネチャと照合してサービス情報を埋める。判別できなかったポートは
+        前回とフィンガープリントが同じならキャッシュの情報を使い、残りだけ nmap -sV を実行する。
+
+        Args:
+            host: スキャン対象のIPアドレス
+            ports: ポート番号のリスト
+            engine: サービス情報取得のエンジン（SERVICE_ENGINES のいずれか）
+            arguments: サービス情報取得の nmap 引数（-p は自動で付与）
+            cancel_token: キャンセル通知（キャンセル済みなら何もせず、'cancelled' を True にして返す）
+
+        Returns:
+            Dict: port_scan と同じ形式の結果
+                  （'matched' にシグネチャで判別したポート数、'cached' にキャッシュを使ったポート数）
+        """
+        if engine not in SERVICE_ENGINES:
+            raise ValueError(f"不明なサービス情報取得エンジンです: {engine}")
+        if _cancelled(cancel_token):
+            return {'host': host, 'ports': [], 'os': '', 'matched': 0, 'cached': 0, 'cancelled': True}
+
+        responses = grab_service_responses(host, ports)
+        result = {'host': host, 'ports': [], 'os': '', 'matched': 0, 'cached': 0}
+        fingerprints = {}
+        misses = []
+        for port in sorted(ports):
+            response = responses.get(port)
+            if engine == 'banner' and response and response[0] != 'tls':
+                matched = match_service_banner(response[1])
+                if matched is not None:
+                    result['ports'].append(dict(port=port, protocol='tcp', state='open', **matched))
+                    result['matched'] += 1
+                    continue
+
+            fingerprints[port] = _response_digest(*response) if response else None
+            port_info = self.service_cache.get(host, port, 'tcp', fingerprints[port])
+            if port_info is not None:
+                result['ports'].append(port_info)
+                result['cached'] += 1
+            else:
+                misses.append(port)
+
+        if misses:
+            scan_args = f"-p {','.join(map(str, misses))} {arguments}"
+            scanned = self.port_scan(host, scan_args, priority_only=False, is_range_scan=True, verbose=False,
+                                     cancel_token=cancel_token)
+            if scanned.get('cancelled'):
+                result['cancelled'] = True
+            if 'error' in scanned:
+                result['error'] = scanned['error']
+            result['os'] = scanned.get('os', '')
+            for port_info in scanned.get('ports', []):
+                result['ports'].append(port_info)
+                # サービス名が判明した結果だけをキャッシュする
+                if port_info.get('service') and port_info.get('state') == 'open':
+                    self.service_cache.put(host, port_info['port'], port_info['protocol'],
+                                           fingerprints.get(port_info['port']), port_info)
+
+        # サービス名で判明したHTTP系のポートも先読みする（port_scan で先読み済みのポートは除かれる）
+        if self.auto_http_prefetch and not result.get('cancelled'):
+            self.prefetch_http_info(host, result['ports'])
+        return result
+
     def get_scan_results(self) -> Dict[str, Dict]:
         """
         最後のスキャン結果を取得
@@ -692,22 +3660,33 @@ class NetworkScanner:
         """
         return self.scan_results
 
-    def get_http_info(self, host: str, port: int = 80, use_https: bool = False) -> Dict:
+    def get_http_info(self, host: str, port: int = 80, use_https: bool = False, refresh: bool = False) -> Dict:
         """
-        HTTPサービスの詳細情報を取得
+        HTTPサービスの詳細情報を取得（キャッシュ付き）
+
+        有効期間内のキャッシュがあればそれを返す。期限切れ・refresh の場合は、前回の応答の
+        ETag・Last-Modified を付けた条件付きリクエストを送り、304 Not Modified なら
+        本文を受け取らずにキャッシュの内容を返す。取得できなかった結果はキャッシュしない。
 
         Args:
             host: 対象ホストのIPアドレス
             port: ポート番号（デフォルト: 80）
             use_https: HTTPSを使用する場合True
+            refresh: 有効期間内のキャッシュがあっても再検証する場合True
 
         Returns:
-            Dict: HTTP詳細情報
+            Dict: HTTP詳細情報（'cache' は 'hit'・'revalidated'・'miss' のいずれか）
         """
+        protocol = 'https' if use_https else 'http'
+        cached = self.http_info_cache.lookup(host, port, protocol)
+        if cached is not None and cached['fresh'] and not refresh:
+            self.http_info_cache.record('hit')
+            return dict(cached['info'], cache='hit')
+
         result = {
             'host': host,
             'port': port,
-            'protocol': 'https' if use_https else 'http',
+            'protocol': protocol,
             'accessible': False,
             'title': '',
             'server': '',
@@ -715,21 +3694,39 @@ class NetworkScanner:
             'security_headers': {},
             'status_code': 0,
             'redirect_url': '',
-            'error': ''
+            'error': '',
+            'timed_out': False,
+            'cache': 'miss'
         }
 
-        protocol = 'https' if use_https else 'http'
         url = f"{protocol}://{host}:{port}"
+        # 前回の応答の ETag・Last-Modified があれば条件付きリクエストで再検証する
+        headers = {}
+        if cached is not None:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        etag = None
+        last_modified = None
 
         try:
-            # タイムアウト3秒でHTTPリクエスト、リダイレクト追従
-            response = requests.get(
+            # タイムアウト3秒でHTTPリクエスト、リダイレクト追従（共有セッションで接続を再利用）
+            response = self.http_session.get(
                 url,
-                timeout=3,
-                allow_redirects=True,
-                verify=False  # 自己署名証明書も許可
+                headers=headers,
+                timeout=HTTP_INFO_TIMEOUT,
+                allow_redirects=True
             )
 
+            if response.status_code == 304 and cached is not None:
+                # 変更なし（タイトル・ヘッダーは前回のものを使う）
+                self.http_info_cache.touch(host, port, protocol)
+                self.http_info_cache.record('revalidated')
+                return dict(cached['info'], cache='revalidated')
+
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
             result['accessible'] = True
             result['status_code'] = response.status_code
 
@@ -787,15 +3784,96 @@ class NetworkScanner:
                 result['error'] = f'SSL/TLS error: {str(e)[:100]}'
             else:
                 result['error'] = str(e)[:100]
+        except requests.exceptions.Timeout:
+            # 接続のタイムアウト（ConnectTimeout）も含む
+            result['error'] = f'Request timeout ({HTTP_INFO_TIMEOUT}s)'
+            result['timed_out'] = True
         except requests.exceptions.ConnectionError:
             result['error'] = 'Connection refused or timeout'
-        except requests.exceptions.Timeout:
-            result['error'] = 'Request timeout (3s)'
         except Exception as e:
             result['error'] = str(e)[:100]
 
+        # 取得できなかった結果はキャッシュせず、次の要求で取得し直す（一時的な失敗を返し続けない）
+        if result['accessible']:
+            self.http_info_cache.put(host, port, protocol, result, etag, last_modified)
+        else:
+            self.http_info_cache.discard(host, port, protocol)
+        self.http_info_cache.record('miss')
         return result
 
+    def get_http_fingerprint(self, host: str, port: int, refresh: bool = False) -> Dict:
+        """
+        HTTP詳細情報を取得（スキームごとのキャッシュは get_http_info を参照）
+
+        HTTPS_PORTS はHTTPSを先に試し、応答がなければHTTPで取得し直す（タイムアウトした場合は
+        HTTPでも応答しないため取得し直さない）。先読み（prefetch_http_info）中のポートはその結果を待つ。
+
+        Args:
+            host: 対象ホストのIPアドレス
+            port: ポート番号
+            refresh: キャッシュが有効期間内でも再検証する場合True
+
+        Returns:
+            Dict: get_http_info と同じ形式のHTTP詳細情報
+        """
+        key = (host, port)
+        with self._http_pending_lock:
+            future = self._http_pending.get(key)
+            if future is None:
+                future = Future()
+                self._http_pending[key] = future
+                owner = True
+            else:
+                owner = False
+        if owner:
+            # このスレッドで取得する（スレッドプールが先読みで埋まっていても待たされない）
+            self._fetch_http_fingerprint(host, port, future, refresh)
+        return dict(future.result())
+
+    def prefetch_http_info(self, host: str, ports: List[Dict]) -> int:
+        """
+        HTTP系のポートのHTTP詳細情報をスレッドプールで先に取得してキャッシュする（終了を待たない）
+
+        キャッシュ済み・取得中のポートは除く。同時実行数は HTTP_INFO_WORKERS で制限される。
+
+        Args:
+            host: 対象ホストのIPアドレス
+            ports: ポート情報のリスト（port_scan の 'ports' と同じ形式）
+
+        Returns:
+            int: 取得を開始したポート数
+        """
+        started = 0
+        for port in sorted({port_info['port'] for port_info in ports if is_http_port(port_info)}):
+            key = (host, port)
+            scheme = 'https' if port in HTTPS_PORTS else 'http'
+            with self._http_pending_lock:
+                if key in self._http_pending or self.http_info_cache.is_fresh(host, port, scheme):
+                    continue
+                future = Future()
+                self._http_pending[key] = future
+            self._http_executor.submit(self._fetch_http_fingerprint, host, port, future)
+            started += 1
+        if started:
+            print(f"[HTTP情報] {host} の{started}ポートを先読み中")
+        return started
+
+    def _fetch_http_fingerprint(self, host: str, port: int, future: Future, refresh: bool = False):
+        """HTTP詳細情報を取得し、future に結果を設定"""
+        try:
+            use_https = port in HTTPS_PORTS
+            info = self.get_http_info(host, port, use_https, refresh)
+            # HTTPSで失敗した場合、HTTPを試す
+            if not info['accessible'] and use_https and not info.get('timed_out'):
+                info = self.get_http_info(host, port, use_https=False, refresh=refresh)
+            future.set_result(info)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._http_pending_lock:
+                if self._http_pending.get((host, port)) is future:
+                    del self._http_pending[(host, port)]
+
     def generate_network_topology(self, scan_results: Dict, port_results: Dict) -> Dict:
         """
         ネットワークトポロジーのグラフデータを生成
@@ -809,7 +3887,10 @@ class NetworkScanner:
         """
         G = nx.Graph()
 
-        # ゲートウェイ（ルーター）を推定 - 通常は .1 か .254
+        # ゲートウェイ（ルーター）を推定 - ルーティングテーブルのゲートウェイ、または .1 か .254
+        interface_info = self._get_interface_info()
+        known_gateways = set(interface_info['gateways'])
+        local_addresses = interface_info['local_addresses']
         gateway_candidates = []
         subnets_map = {}
 
@@ -822,7 +3903,7 @@ class NetworkScanner:
 
             # ゲートウェイ候補を特定
             ip_parts = ip.split('.')
-            if ip_parts[-1] in ['1', '254']:
+            if ip in known_gateways or ip_parts[-1] in ['1', '254']:
                 gateway_candidates.append(ip)
 
         # ノードを追加
@@ -851,6 +3932,7 @@ class NetworkScanner:
                       vendor=vendor,
                       subnet=subnet,
                       type=node_type,
+                      is_local=ip in local_addresses,
                       ports=len(open_ports),
                       port_list=open_ports[:10])  # 最大10ポートまで表示
 
@@ -892,6 +3974,7 @@ class NetworkScanner:
                 'vendor': attrs.get('vendor', ''),
                 'subnet': attrs.get('subnet', ''),
                 'type': attrs.get('type', 'host'),
+                'is_local': attrs.get('is_local', False),
                 'ports': attrs.get('ports', 0),
                 'port_list': attrs.get('port_list', [])
             })
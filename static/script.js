@@ -1,6 +1,11 @@
 // グローバル変数
-let scanInterval = null;
+let eventSource = null;
+let wasScanning = false;
 let hostsData = {};
+// 結果待ちのポートスキャン（キー: "ホスト|スキャンモード"、値: {host, scanMode, timer}）
+const pendingPortScans = {};
+// この時間イベントが届かないポートスキャンは失敗とみなす（ミリ秒）
+const PORT_SCAN_IDLE_TIMEOUT = 5 * 60 * 1000;
 
 // ローカルホストかどうかを判定
 function isLocalHost(host) {
@@ -35,6 +40,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // イベントリスナーの設定
     document.getElementById('rescanBtn').addEventListener('click', startScan);
+    document.getElementById('stopScanBtn').addEventListener('click', stopScan);
 
     // サンプルクリックで入力フィールドに設定
     document.querySelectorAll('.example-item').forEach(item => {
@@ -53,21 +59,68 @@ document.addEventListener('DOMContentLoaded', function() {
     // 初回データ取得
     loadResults();
     checkScanStatus();
+
+    // サーバーからのイベント受信を開始
+    connectEvents();
 });
 
+// サーバーからのイベント（/api/events）を受信
+function connectEvents() {
+    eventSource = new EventSource('/api/events');
+
+    // スキャンステータス（開始・チャンク完了・終了時、接続直後）
+    eventSource.addEventListener('scan_status', function(e) {
+        applyScanStatus(JSON.parse(e.data));
+    });
+
+    // ホスト検出（スキャン完了を待たずにカードを追加）
+    eventSource.addEventListener('host_found', function(e) {
+        const data = JSON.parse(e.data);
+        addHost(data.ip, data.info);
+    });
+
+    // ポートスキャンの進捗・結果
+    eventSource.addEventListener('port_scan', function(e) {
+        handlePortScanUpdate(JSON.parse(e.data));
+    });
+
+    // 全ポートスキャンの第1段階で検出したポート（サービス情報の取得前に表示）
+    eventSource.addEventListener('port_found', function(e) {
+        handlePortFound(JSON.parse(e.data));
+    });
+
+    // 再接続時は切断中に完了したポートスキャンの結果を取得し直す
+    eventSource.addEventListener('open', function() {
+        const hosts = new Set(Object.values(pendingPortScans).map(pending => pending.host));
+        for (const host of hosts) {
+            refreshPortScanResult(host);
+        }
+    });
+
+    // 切断時はEventSourceが自動的に再接続する
+    eventSource.addEventListener('error', function() {
+        console.warn('イベントストリームが切断されました。再接続します...');
+    });
+}
+
 // スキャンを開始
 async function startScan() {
     const btn = document.getElementById('rescanBtn');
     const targetRangeInput = document.getElementById('targetRange');
     const targetRange = targetRangeInput.value.trim();
+    const engine = document.getElementById('scanEngine').value;
 
     btn.disabled = true;
 
     try {
-        const requestBody = {};
+        const excludeRange = document.getElementById('excludeRange').value.trim();
+        const requestBody = { engine: engine };
         if (targetRange) {
             requestBody.target_range = targetRange;
         }
+        if (excludeRange) {
+            requestBody.exclude = excludeRange;
+        }
 
         const response = await fetch('/api/scan', {
             method: 'POST',
@@ -80,34 +133,48 @@ async function startScan() {
         const data = await response.json();
 
         if (data.status === 'success') {
+            // 実行中のスキャンがあっても別のジョブとして並行して（または実行待ちとして）登録される
             const message = targetRange
-                ? `スキャンを開始しました: ${targetRange}`
-                : 'スキャンを開始しました（自動検出）';
+                ? `${data.message}: ${targetRange}`
+                : `${data.message}（自動検出）`;
             showNotification(message, 'success');
             monitorScanProgress();
         } else {
             showNotification(data.message, 'error');
-            btn.disabled = false;
         }
     } catch (error) {
         console.error('スキャン開始エラー:', error);
         showNotification('スキャン開始に失敗しました', 'error');
+    } finally {
+        btn.disabled = false;
+    }
+}
+
+// 実行中のスキャンを中止（検出済みのホストは残る）
+async function stopScan() {
+    const btn = document.getElementById('stopScanBtn');
+    btn.disabled = true;
+
+    try {
+        const response = await fetch('/api/scan', { method: 'DELETE' });
+        const data = await response.json();
+        showNotification(data.message, data.status === 'success' ? 'success' : 'error');
+    } catch (error) {
+        console.error('スキャン中止エラー:', error);
+        showNotification('スキャンの中止に失敗しました', 'error');
+    } finally {
         btn.disabled = false;
     }
 }
 
-// スキャン進捗を監視
+// スキャン進捗を監視（進捗は scan_status イベントで更新される）
 function monitorScanProgress() {
     const scanStatus = document.getElementById('scanStatus');
     scanStatus.classList.remove('hidden');
+    wasScanning = true;
 
-    // 既存のインターバルをクリア
-    if (scanInterval) {
-        clearInterval(scanInterval);
-    }
-
-    // 定期的にステータスをチェック
-    scanInterval = setInterval(checkScanStatus, 1000);
+    // 開始直後に終わった場合に備えて現在の状態を1回取得
+    checkScanStatus();
 }
 
 // スキャンステータスをチェック
@@ -115,47 +182,55 @@ async function checkScanStatus() {
     try {
         const response = await fetch('/api/scan-status');
         const status = await response.json();
+        applyScanStatus(status);
+    } catch (error) {
+        console.error('ステータス取得エラー:', error);
+    }
+}
 
-        const scanStatus = document.getElementById('scanStatus');
-        const progressBar = document.getElementById('progressBar');
-        const progressText = document.getElementById('progressText');
-        const rescanBtn = document.getElementById('rescanBtn');
+// スキャンステータスを画面に反映
+function applyScanStatus(status) {
+    const scanStatus = document.getElementById('scanStatus');
+    const progressBar = document.getElementById('progressBar');
+    const progressText = document.getElementById('progressText');
+    const rescanBtn = document.getElementById('rescanBtn');
+    const stopScanBtn = document.getElementById('stopScanBtn');
+
+    // nmapが利用できない場合は警告を表示
+    if (status.nmap_available === false) {
+        showNmapWarning(status.nmap_error);
+        rescanBtn.disabled = true;
+        return;
+    }
 
-        // nmapが利用できない場合は警告を表示
-        if (status.nmap_available === false) {
-            showNmapWarning(status.nmap_error);
-            rescanBtn.disabled = true;
-            return;
+    if (status.is_scanning) {
+        scanStatus.classList.remove('hidden');
+        progressBar.style.width = status.scan_progress + '%';
+
+        // 見つかったホスト数と、並行して実行中・実行待ちの他のスキャン数を表示
+        const hostsInfo = status.found_hosts > 0 ? ` - ${status.found_hosts}台検出` : '';
+        const othersInfo = status.active_scans > 1 ? ` [他${status.active_scans - 1}件のスキャン]` : '';
+        progressText.textContent = `スキャン中... ${status.scan_progress}%${hostsInfo} (${status.current_subnet})${othersInfo}`;
+        rescanBtn.disabled = false;
+        stopScanBtn.classList.remove('hidden');
+        wasScanning = true;
+    } else {
+        scanStatus.classList.add('hidden');
+        progressBar.style.width = '0%';
+        rescanBtn.disabled = false;
+        stopScanBtn.classList.add('hidden');
+
+        // スキャン完了時に結果を読み込み（今回見つからなかったホストを外すため）
+        if (wasScanning) {
+            wasScanning = false;
+            loadResults();
         }
 
-        if (status.is_scanning) {
-            scanStatus.classList.remove('hidden');
-            progressBar.style.width = status.scan_progress + '%';
-
-            // 見つかったホスト数を表示
-            const hostsInfo = status.found_hosts > 0 ? ` - ${status.found_hosts}台検出` : '';
-            progressText.textContent = `スキャン中... ${status.scan_progress}%${hostsInfo} (${status.current_subnet})`;
-            rescanBtn.disabled = true;
-        } else {
-            scanStatus.classList.add('hidden');
-            progressBar.style.width = '0%';
-            rescanBtn.disabled = false;
-
-            // スキャン完了時に結果を読み込み
-            if (scanInterval) {
-                clearInterval(scanInterval);
-                scanInterval = null;
-                loadResults();
-            }
-
-            // 最終スキャン時刻を更新
-            if (status.last_scan_time) {
-                document.getElementById('lastScanTime').textContent =
-                    '最終スキャン: ' + status.last_scan_time;
-            }
+        // 最終スキャン時刻を更新
+        if (status.last_scan_time) {
+            document.getElementById('lastScanTime').textContent =
+                '最終スキャン: ' + status.last_scan_time;
         }
-    } catch (error) {
-        console.error('ステータス取得エラー:', error);
     }
 }
 
@@ -200,13 +275,45 @@ async function loadResults() {
         displayHosts(hostsData);
 
         // ホスト数を更新
-        document.getElementById('hostCount').textContent =
-            '検出ホスト数: ' + data.total;
+        updateHostCount();
     } catch (error) {
         console.error('結果取得エラー:', error);
     }
 }
 
+// ホスト数を更新（近隣テーブルにあるだけで応答しなかったホストは別に数える）
+function updateHostCount() {
+    const hosts = Object.values(hostsData);
+    const staleCount = hosts.filter(info => info.state === 'stale').length;
+    document.getElementById('hostCount').textContent =
+        '検出ホスト数: ' + (hosts.length - staleCount) + (staleCount > 0 ? ` (応答なし ${staleCount}台)` : '');
+}
+
+// 検出したホストを1台追加（表示済みの場合は状態が変わったときだけカードを作り直す）
+function addHost(ip, info) {
+    if (hostsData[ip]) {
+        if (hostsData[ip].state !== info.state) {
+            const card = document.getElementById(`host-${ip.replace(/\./g, '-')}`);
+            hostsData[ip] = info;
+            if (card) {
+                card.replaceWith(createHostCard(ip, info));
+            }
+            updateHostCount();
+        }
+        return;
+    }
+
+    const container = document.getElementById('hostsContainer');
+    // 「ホストが見つかりませんでした」の表示を消す
+    if (Object.keys(hostsData).length === 0) {
+        container.innerHTML = '';
+    }
+
+    hostsData[ip] = info;
+    container.appendChild(createHostCard(ip, info));
+    updateHostCount();
+}
+
 // ホスト一覧を表示（カード形式）
 function displayHosts(hosts) {
     const container = document.getElementById('hostsContainer');
@@ -228,12 +335,13 @@ function createHostCard(ip, info) {
     const card = document.createElement('div');
     card.className = 'host-card';
     card.id = `host-${ip.replace(/\./g, '-')}`;
+    const isStale = info.state === 'stale';
 
     card.innerHTML = `
         <div class="card-header" onclick="toggleCard('${ip}')">
             <div class="card-title">
                 <h3>${ip}</h3>
-                <span class="status-badge up">Online</span>
+                <span class="status-badge ${isStale ? 'stale' : 'up'}">${isStale ? 'No response' : 'Online'}</span>
             </div>
             <span class="card-toggle" id="toggle-${ip.replace(/\./g, '-')}">▼</span>
         </div>
@@ -248,7 +356,7 @@ function createHostCard(ip, info) {
                 </div>
                 <div class="info-grid">
                     <span class="info-label">状態:</span>
-                    <span class="info-value">✓ PING応答あり</span>
+                    <span class="info-value">${isStale ? '近隣テーブルのみ（スキャンに応答なし）' : '✓ PING応答あり'}</span>
                     <span class="info-label">サブネット:</span>
                     <span class="info-value">${info.subnet || '-'}</span>
                 </div>
@@ -351,6 +459,10 @@ async function executePortScan() {
 
     // スキャンモードを取得
     const scanMode = document.querySelector('input[name="scanMode"]:checked').value;
+    // 全ポートスキャン第1段階のエンジンとワーカー数を取得
+    const portEngine = document.getElementById('portEngine').value;
+    const portWorkers = parseInt(document.getElementById('portWorkers').value, 10) || 6;
+    const serviceEngine = document.getElementById('serviceEngine').value;
 
     // ホストを一時変数に保存（モーダルを閉じる前に）
     const targetHost = currentScanHost;
@@ -369,7 +481,10 @@ async function executePortScan() {
             },
             body: JSON.stringify({
                 arguments: scanCommand,
-                scan_mode: scanMode  // priority or full
+                scan_mode: scanMode,  // priority or full
+                port_engine: portEngine,  // nmap or async
+                port_workers: portWorkers,
+                service_engine: serviceEngine  // banner or nmap
             })
         });
 
@@ -383,8 +498,8 @@ async function executePortScan() {
             } else if (scanMode === 'full') {
                 updateTabProgress(targetHost, 'full', 'started');
             }
-            // ポーリングを開始して結果を取得（スキャンモードを渡す）
-            pollPortScanResults(targetHost, scanMode);
+            // port_scan イベントで結果を受け取る（スキャンモードを渡す）
+            watchPortScan(targetHost, scanMode);
         } else {
             showNotification('ポートスキャンに失敗しました: ' + data.message, 'error');
             if (scanMode === 'priority') {
@@ -454,7 +569,7 @@ function createPortScanTabs(host, scanMode) {
         : '<div style="color: #999;">このスキャンは実行されていません。<br>再度ポートスキャンを実行してモード選択してください。</div>';
 
     const fullInitialMessage = (scanMode === 'full')
-        ? '<div><input type="checkbox" disabled> 並列スキャン待機中（6スレッド）...</div>'
+        ? '<div><input type="checkbox" disabled> 並列スキャン待機中...</div>'
         : '<div style="color: #999;">このスキャンは実行されていません。<br>再度ポートスキャンを実行してモード選択してください。</div>';
 
     portsDiv.innerHTML = `
@@ -501,8 +616,12 @@ function createPortScanTabs(host, scanMode) {
                                      style="width: 0%; background: linear-gradient(90deg, #667eea, #764ba2); height: 100%; transition: width 0.3s;"></div>
                             </div>
                             <div id="full-scan-progress-text-${hostKey}" style="margin-top: 8px; color: #718096; font-size: 0.85rem;">
-                                🚀 高速並列スキャン実行中（6スレッド）...
+                                🚀 高速並列スキャン実行中...
                             </div>
+                            <div id="full-found-ports-${hostKey}" style="display: none; margin-top: 8px; color: #4a5568; font-size: 0.85rem;"></div>
+                            <button class="btn btn-danger btn-small" style="margin-top: 8px;" onclick="cancelPortScan('${host}')">
+                                ⏹ 中止
+                            </button>
                         </div>
                     </div>
                     <div id="full-results-${hostKey}" style="margin-top: 15px;"></div>
@@ -603,28 +722,50 @@ function updateTabProgress(host, tabName, stage, progressData = null) {
         `;
 
         // エラー時にもプログレスバーを非表示にする
+        const progressBarContainer = document.getElementById(`${tabName}-scan-progress-bar-container-${hostKey}`);
+        if (progressBarContainer) {
+            progressBarContainer.style.display = 'none';
+        }
+    } else if (stage === 'cancelled') {
+        html = `
+            <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> スキャン開始</div>
+            <div style="margin-bottom: 5px; color: #718096;"><input type="checkbox" disabled> ⏹ スキャンを中止しました（検出済みのポートのみ表示）</div>
+        `;
+
         const progressBarContainer = document.getElementById(`${tabName}-scan-progress-bar-container-${hostKey}`);
         if (progressBarContainer) {
             progressBarContainer.style.display = 'none';
         }
     } else if (stage === 'scanning') {
-        // 全ポートスキャン実行中（進捗％付き）- 6スレッド、2段階スキャン
+        // 全ポートスキャン実行中（進捗％付き）- ワーカー並列、2段階スキャン
         // progressDataから実際のスキャン数に基づく進捗を取得
         let estimatedProgress = 0;
         let scanPhase = '';
         let detailsText = '';
+        const workers = (progressData && progressData.progress && progressData.progress.workers) || 6;
+        const workersText = workers > 1 ? `${workers}ワーカー並列` : 'asyncio';
 
+        // 第2段階は第1段階で見つかったポートから順に並行して進む
+        let stage1Done = false;
+        let serviceText = '';
         if (progressData && progressData.progress) {
             const progress = progressData.progress;
             estimatedProgress = progress.overall_progress || 0;
+            stage1Done = progress.scanned_ports >= progress.total_ports;
+            if (progress.found_ports > 0) {
+                serviceText = `${progress.service_scanned}/${progress.found_ports}ポート`;
+            }
 
-            // 進捗率に基づいてフェーズを判定
-            if (estimatedProgress < 50) {
+            // 第1段階が終わっているかでフェーズを判定
+            if (!stage1Done) {
                 scanPhase = 'ポートスキャン';
                 detailsText = `${progress.scanned_ports.toLocaleString()}/${progress.total_ports.toLocaleString()}ポート`;
+                if (serviceText) {
+                    detailsText += ` | サービス情報 ${serviceText}`;
+                }
             } else {
                 scanPhase = 'サービス情報取得';
-                detailsText = `${progress.service_scanned}/${progress.found_ports}ポート`;
+                detailsText = serviceText || '0/0ポート';
             }
         } else {
             // フォールバック: progressDataがない場合は初期状態
@@ -634,27 +775,27 @@ function updateTabProgress(host, tabName, stage, progressData = null) {
         }
 
         // 進捗表示を2段階に分離（ローカル/リモートで表示を変更）
-        if (estimatedProgress < 50) {
+        if (!stage1Done) {
             html = `
                 <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> スキャン開始</div>
                 <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> コマンド実行完了</div>
-                <div style="margin-bottom: 5px;"><input type="checkbox" disabled> 🚀 ポートスキャン実行中 (6スレッド並列)... ${estimatedProgress}%<br><span style="font-size: 0.85em; color: #718096;">${detailsText}</span></div>
-                <div style="margin-bottom: 5px;"><input type="checkbox" disabled> ${isLocal ? 'サービス情報取得待機中 (6スレッド並列)...' : 'リモートスキャンの為、サービス情報取得できません'}</div>
+                <div style="margin-bottom: 5px;"><input type="checkbox" disabled> 🚀 ポートスキャン実行中 (${workersText})... ${estimatedProgress}%<br><span style="font-size: 0.85em; color: #718096;">${detailsText}</span></div>
+                <div style="margin-bottom: 5px;"><input type="checkbox" disabled> ${isLocal ? (serviceText ? `🔍 サービス情報取得中（ポート検出と並行）... ${serviceText}` : 'サービス情報取得待機中...') : 'リモートスキャンの為、サービス情報取得できません'}</div>
             `;
         } else {
             if (isLocal) {
                 html = `
                     <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> スキャン開始</div>
                     <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> コマンド実行完了</div>
-                    <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> ✅ ポートスキャン完了 (6スレッド並列)</div>
-                    <div style="margin-bottom: 5px;"><input type="checkbox" disabled> 🔍 サービス情報取得中 (6スレッド並列)... ${estimatedProgress}%<br><span style="font-size: 0.85em; color: #718096;">${detailsText}</span></div>
+                    <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> ✅ ポートスキャン完了 (${workersText})</div>
+                    <div style="margin-bottom: 5px;"><input type="checkbox" disabled> 🔍 サービス情報取得中... ${estimatedProgress}%<br><span style="font-size: 0.85em; color: #718096;">${detailsText}</span></div>
                 `;
             } else {
                 // リモートスキャンの場合
                 html = `
                     <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> スキャン開始</div>
                     <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> コマンド実行完了</div>
-                    <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> ✅ ポートスキャン完了 (6スレッド並列)</div>
+                    <div style="margin-bottom: 5px;"><input type="checkbox" checked disabled> ✅ ポートスキャン完了 (${workersText})</div>
                     <div style="margin-bottom: 5px; color: #718096;"><input type="checkbox" disabled> リモートスキャンの為、サービス情報取得できません</div>
                 `;
             }
@@ -670,7 +811,7 @@ function updateTabProgress(host, tabName, stage, progressData = null) {
                 progressBar.style.width = `${estimatedProgress}%`;
             }
             if (progressText) {
-                progressText.textContent = `🚀 高速並列スキャン実行中（6スレッド）| ${scanPhase}: ${estimatedProgress}% | ${detailsText}`;
+                progressText.textContent = `🚀 高速並列スキャン実行中（${workersText}）| ${scanPhase}: ${estimatedProgress}% | ${detailsText}`;
             }
         }
     }
@@ -678,94 +819,156 @@ function updateTabProgress(host, tabName, stage, progressData = null) {
     progressDiv.innerHTML = html;
 }
 
-// ポートスキャン結果をポーリング（並列スキャン対応・タブUI版）
-async function pollPortScanResults(host, scanMode) {
-    const maxAttempts = 300; // 最大5分間ポーリング
-    let attempts = 0;
-    let priorityDisplayed = false;
-    let fullDisplayed = false;
-    let fullScanStartTime = null;
-
-    // スキャンモードに応じて待機するステージを決定
-    const waitForPriority = (scanMode === 'priority');
-    const waitForFull = (scanMode === 'full');
-
-    const pollInterval = setInterval(async () => {
-        attempts++;
-
-        // 進捗ステージを更新（時間経過に基づく、スキャンモードに応じて）
-        if (attempts === 2) {
-            if (waitForPriority) {
-                updateTabProgress(host, 'priority', 'detecting');
-            }
-            if (waitForFull) {
-                updateTabProgress(host, 'full', 'detecting');
-            }
-        } else if (attempts === 5) {
-            if (waitForPriority) {
+// 待機中のポートスキャンのキー
+function portScanKey(host, scanMode) {
+    return `${host}|${scanMode}`;
+}
+
+// ポートスキャン結果の待機を開始（並列スキャン対応・タブUI版）
+function watchPortScan(host, scanMode) {
+    const key = portScanKey(host, scanMode);
+    finishPortScan(host, scanMode);
+    const pending = {host: host, scanMode: scanMode, timer: null, foundPorts: []};
+    pendingPortScans[key] = pending;
+    resetPortScanTimer(host, scanMode);
+
+    // 進捗ステージを更新（時間経過に基づく、スキャンモードに応じて）
+    setTimeout(() => {
+        if (pendingPortScans[key] === pending) {
+            updateTabProgress(host, scanMode, 'detecting');
+        }
+    }, 2000);
+    if (scanMode === 'priority') {
+        setTimeout(() => {
+            if (pendingPortScans[key] === pending) {
                 updateTabProgress(host, 'priority', 'analyzing');
             }
+        }, 5000);
+    }
+}
+
+// 待機中のポートスキャンのタイムアウトをやり直す（イベントを受信するたびに呼ぶ）
+function resetPortScanTimer(host, scanMode) {
+    const pending = pendingPortScans[portScanKey(host, scanMode)];
+    if (!pending) return;
+    clearTimeout(pending.timer);
+    pending.timer = setTimeout(() => {
+        if (pendingPortScans[portScanKey(host, scanMode)] === pending) {
+            finishPortScan(host, scanMode);
+            updateTabProgress(host, scanMode, 'error');
+            showNotification(`${host} のポートスキャンが応答しません（5分間更新なし）`, 'error');
         }
+    }, PORT_SCAN_IDLE_TIMEOUT);
+}
 
-        try {
-            const response = await fetch(`/api/port-scan/${host}`);
-            const data = await response.json();
-
-            if (data.status === 'success' && data.data) {
-                const currentStage = data.data.scan_stage;
-                const currentPorts = data.data.ports || [];
-
-                // 優先ポートスキャン結果が来た場合（優先ポートを待機している場合のみ処理）
-                if (currentStage === 'priority' && !priorityDisplayed && waitForPriority) {
-                    priorityDisplayed = true;
-                    fullScanStartTime = attempts;
-                    updateTabProgress(host, 'priority', 'complete');
-                    displayPortResults(host, data.data, 'priority');
-
-                    // 優先ポートのみの場合はここで完了
-                    if (scanMode === 'priority') {
-                        clearInterval(pollInterval);
-                    }
-                }
+// ポートスキャンの待機を終了
+function finishPortScan(host, scanMode) {
+    const key = portScanKey(host, scanMode);
+    const pending = pendingPortScans[key];
+    if (pending) {
+        clearTimeout(pending.timer);
+        delete pendingPortScans[key];
+    }
+}
 
-                // 全ポートスキャン実行中の進捗％を更新（全ポートを待機している場合のみ処理）
-                if (currentStage === 'full_scanning' && !fullDisplayed && waitForFull) {
-                    if (!fullScanStartTime) fullScanStartTime = attempts;
-                    // 実際の進捗データを渡す
-                    updateTabProgress(host, 'full', 'scanning', data.data);
-                }
+// 実行中のポートスキャンを中止（結果は scan_stage='cancelled' のイベントで届く）
+async function cancelPortScan(host) {
+    try {
+        const response = await fetch(`/api/port-scan/${host}`, { method: 'DELETE' });
+        const data = await response.json();
+        if (data.status !== 'success') {
+            showNotification(data.message, 'error');
+        }
+    } catch (error) {
+        console.error('ポートスキャン中止エラー:', error);
+        showNotification('ポートスキャンの中止に失敗しました', 'error');
+    }
+}
 
-                // 全ポートスキャン結果が来た場合（全ポートを待機している場合のみ処理）
-                if (currentStage === 'full' && !fullDisplayed && waitForFull) {
-                    fullDisplayed = true;
-                    updateTabProgress(host, 'full', 'complete');
-                    displayPortResults(host, data.data, 'full');
-                    clearInterval(pollInterval);
-                }
-            } else if (attempts >= maxAttempts) {
-                // タイムアウト（実行中のスキャンのみエラー表示）
-                if (waitForPriority) {
-                    updateTabProgress(host, 'priority', 'error');
-                }
-                if (waitForFull) {
-                    updateTabProgress(host, 'full', 'error');
-                }
-                clearInterval(pollInterval);
-            }
-        } catch (error) {
-            console.error('結果取得エラー:', error);
-            if (attempts >= maxAttempts) {
-                // タイムアウト（実行中のスキャンのみエラー表示）
-                if (waitForPriority) {
-                    updateTabProgress(host, 'priority', 'error');
-                }
-                if (waitForFull) {
-                    updateTabProgress(host, 'full', 'error');
-                }
-                clearInterval(pollInterval);
-            }
+// ポートスキャン結果を1回取得して反映（イベントストリーム再接続時）
+async function refreshPortScanResult(host) {
+    try {
+        const response = await fetch(`/api/port-scan/${host}`);
+        const data = await response.json();
+        if (data.status === 'success' && data.data) {
+            handlePortScanUpdate(data.data);
         }
-    }, 1000); // 1秒ごとにチェック
+    } catch (error) {
+        console.error('結果取得エラー:', error);
+    }
+}
+
+// port_scan イベントを反映
+function handlePortScanUpdate(data) {
+    const host = data.host;
+    const waitingPriority = portScanKey(host, 'priority') in pendingPortScans;
+    const waitingFull = portScanKey(host, 'full') in pendingPortScans;
+    const currentStage = data.scan_stage;
+
+    // 優先ポートスキャン結果が来た場合（優先ポートを待機している場合のみ処理）
+    if (currentStage === 'priority' && waitingPriority) {
+        finishPortScan(host, 'priority');
+        updateTabProgress(host, 'priority', 'complete');
+        displayPortResults(host, data, 'priority');
+    }
+
+    // 全ポートスキャン実行中の進捗％を更新（全ポートを待機している場合のみ処理）
+    if (currentStage === 'full_scanning' && waitingFull) {
+        resetPortScanTimer(host, 'full');
+        updateTabProgress(host, 'full', 'scanning', data);
+        showFoundPorts(host);
+    }
+
+    // 全ポートスキャン結果が来た場合（全ポートを待機している場合のみ処理）
+    if (currentStage === 'full' && waitingFull) {
+        finishPortScan(host, 'full');
+        updateTabProgress(host, 'full', 'complete');
+        displayPortResults(host, data, 'full');
+    }
+
+    // 中止された場合はそこまでに検出したポートを表示
+    if (currentStage === 'cancelled') {
+        const scanMode = data.progress ? 'full' : 'priority';
+        if (portScanKey(host, scanMode) in pendingPortScans) {
+            finishPortScan(host, scanMode);
+            updateTabProgress(host, scanMode, 'cancelled');
+            displayPortResults(host, data, scanMode);
+        }
+    }
+
+    // スキャン失敗（進捗情報を持つのは全ポートスキャンのみ）
+    if (currentStage === 'error') {
+        const scanMode = data.progress ? 'full' : 'priority';
+        if (portScanKey(host, scanMode) in pendingPortScans) {
+            finishPortScan(host, scanMode);
+            updateTabProgress(host, scanMode, 'error');
+        }
+    }
+}
+
+// port_found イベントを反映（全ポートスキャン中に検出済みのポートを表示）
+function handlePortFound(data) {
+    const pending = pendingPortScans[portScanKey(data.host, 'full')];
+    if (!pending) return;
+
+    resetPortScanTimer(data.host, 'full');
+    for (const port of data.ports) {
+        if (!pending.foundPorts.includes(port.port)) {
+            pending.foundPorts.push(port.port);
+        }
+    }
+    pending.foundPorts.sort((a, b) => a - b);
+    showFoundPorts(data.host);
+}
+
+// 全ポートタブに検出済みのポート番号を表示
+function showFoundPorts(host) {
+    const pending = pendingPortScans[portScanKey(host, 'full')];
+    const foundDiv = document.getElementById(`full-found-ports-${host.replace(/\./g, '-')}`);
+    if (!pending || !foundDiv || pending.foundPorts.length === 0) return;
+
+    foundDiv.style.display = 'block';
+    foundDiv.textContent = `検出済み ${pending.foundPorts.length}ポート: ${pending.foundPorts.join(', ')}`;
 }
 
 // ポート結果を表示（タブUI版・優先ポートと全ポートを各タブ内に表示）
@@ -824,9 +1027,10 @@ async function displayPortResults(host, data, stage = 'full') {
         const portKey = `${port.port}/${port.protocol}`;
         const process = processInfo[portKey];
 
-        // HTTP系のポートかどうかを判定
+        // HTTP系のポートかどうかを判定（scanner.is_http_port と同じ条件。詳細情報はスキャン時に先読みされる）
         const isHttpPort = port.state === 'open' &&
-                          [80, 443, 8080, 8443, 3000, 3001, 5000, 5001, 5050, 8000, 8888].includes(port.port);
+                          ([80, 443, 8080, 8443, 3000, 3001, 5000, 5001, 5050, 8000, 8888].includes(port.port) ||
+                           (port.service || '').includes('http'));
 
         html += `
             <div class="port-item ${stateClass}" data-port="${port.port}" data-host="${host}" style="background: white; padding: 12px; border-radius: 8px; margin-bottom: 10px; border-left: 3px solid ${port.state === 'open' ? '#48bb78' : '#cbd5e0'};">
@@ -1252,7 +1456,7 @@ function drawNetworkTopology(nodes, edges) {
 }
 
 // HTTP詳細情報を取得して表示
-async function fetchHttpInfo(host, port) {
+async function fetchHttpInfo(host, port, refresh = false) {
     const modal = document.getElementById('httpInfoModal');
     const modalTitle = document.getElementById('httpInfoModalTitle');
     const modalBody = document.getElementById('httpInfoModalBody');
@@ -1263,7 +1467,8 @@ async function fetchHttpInfo(host, port) {
     modalBody.innerHTML = '<p style="text-align: center; padding: 40px; color: #718096;">読込中...</p>';
 
     try {
-        const response = await fetch(`/api/http-info/${host}/${port}`);
+        // refresh: キャッシュが有効期間内でも再検証する（変更がなければ304で前回の内容が返る）
+        const response = await fetch(`/api/http-info/${host}/${port}${refresh ? '?refresh=1' : ''}`);
         const data = await response.json();
 
         if (data.status === 'error') {
@@ -1344,6 +1549,14 @@ function displayHttpInfo(host, port, data) {
         `;
     }
 
+    const cacheLabels = {hit: 'キャッシュ', revalidated: 'キャッシュ（再検証済み）', miss: '取得'};
+    htmlContent += `
+        <div style="display: flex; justify-content: flex-end; align-items: center; gap: 10px; padding: 0 20px 20px; font-size: 0.85rem; color: #718096;">
+            <span>${cacheLabels[data.cache] || ''}</span>
+            <button class="btn-http-info" onclick="fetchHttpInfo('${host}', ${port}, true)">🔄 再取得</button>
+        </div>
+    `;
+
     modalBody.innerHTML = htmlContent;
 }
 
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+スキャン結果を永続化するSQLiteストレージモジュール
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    ip TEXT PRIMARY KEY,
+    hostname TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL DEFAULT '',
+    vendor TEXT NOT NULL DEFAULT '',
+    subnet TEXT NOT NULL DEFAULT '',
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_hosts_subnet ON hosts(subnet);
+
+CREATE TABLE IF NOT EXISTS port_scans (
+    ip TEXT PRIMARY KEY,
+    os TEXT NOT NULL DEFAULT '',
+    scan_time TEXT NOT NULL DEFAULT '',
+    scan_stage TEXT NOT NULL DEFAULT '',
+    error TEXT,
+    progress TEXT,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ports (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    protocol TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT '',
+    service TEXT NOT NULL DEFAULT '',
+    product TEXT NOT NULL DEFAULT '',
+    version TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (ip, protocol, port)
+);
+CREATE INDEX IF NOT EXISTS idx_ports_ip ON ports(ip);
+CREATE INDEX IF NOT EXISTS idx_ports_port ON ports(port);
+CREATE INDEX IF NOT EXISTS idx_ports_service ON ports(service);
+
+CREATE TABLE IF NOT EXISTS port_history (
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    protocol TEXT NOT NULL,
+    open_count INTEGER NOT NULL DEFAULT 0,
+    last_open REAL NOT NULL,
+    PRIMARY KEY (ip, protocol, port)
+);
+CREATE INDEX IF NOT EXISTS idx_port_history_port ON port_history(port);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class ResultStore:
+    """
+    ホスト検出結果・ポートスキャン結果を保存するSQLiteストア
+
+    WALモードで開き、スレッドごとに接続を持つため、スキャンスレッドからの書き込みと
+    Flaskのリクエストからの読み込みを同時に行える。アプリを再起動しても結果は残る。
+    """
+
+    def __init__(self, path: str):
+        """
+        ストアの初期化（テーブルとインデックスがなければ作成）
+
+        Args:
+            path: SQLiteファイルのパス（":memory:" は不可。スレッド間で共有できないため）
+        """
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        # 履歴テーブルがなかった頃の結果も履歴に含める
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO port_history (ip, port, protocol, open_count, last_open)
+            SELECT ip, port, protocol, 1, ? FROM ports WHERE state = 'open'
+            """,
+            (time.time(),)
+        )
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """現在のスレッド用の接続を取得（なければ作成）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # ===== ホスト検出結果 =====
+
+    def upsert_host(self, ip: str, info: Dict):
+        """
+        ホスト情報を追加または更新
+
+        Args:
+            ip: IPアドレス
+            info: ホスト情報（hostname, state, vendor, subnet）
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO hosts (ip, hostname, state, vendor, subnet, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ip) DO UPDATE SET
+                    hostname = excluded.hostname,
+                    state = excluded.state,
+                    vendor = CASE WHEN excluded.vendor != '' THEN excluded.vendor ELSE hosts.vendor END,
+                    subnet = excluded.subnet,
+                    last_seen = excluded.last_seen
+                """,
+                (ip, info.get('hostname') or '', info.get('state') or '', info.get('vendor') or '',
+                 info.get('subnet') or '', time.time())
+            )
+
+    def get_hosts(self, subnet: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        ホスト一覧を取得
+
+        Args:
+            subnet: 指定した場合、そのサブネットのホストのみ取得
+
+        Returns:
+            Dict: キー: IPアドレス、値: ホスト情報
+        """
+        conn = self._connect()
+        if subnet:
+            rows = conn.execute('SELECT * FROM hosts WHERE subnet = ?', (subnet,))
+        else:
+            rows = conn.execute('SELECT * FROM hosts')
+        return {
+            row['ip']: {
+                'hostname': row['hostname'],
+                'state': row['state'],
+                'vendor': row['vendor'],
+                'subnet': row['subnet']
+            }
+            for row in rows
+        }
+
+    def has_host(self, ip: str) -> bool:
+        """ホストが登録されているか確認"""
+        row = self._connect().execute('SELECT 1 FROM hosts WHERE ip = ?', (ip,)).fetchone()
+        return row is not None
+
+    def prune_hosts(self, seen_before: float, within: Optional[Callable[[str], bool]] = None) -> int:
+        """
+        指定時刻より前から検出されていないホストを削除（再スキャンで見つからなかったホスト）
+
+        ホストのポートスキャン結果も同じトランザクションで削除する。開いていたポートの履歴
+        （port_history）はポートの並び順に使うため残す。
+
+        Args:
+            seen_before: この時刻（time.time()）より前に最後に検出されたホストを削除
+            within: IPアドレスを受け取り、削除の対象とする場合にTrueを返す関数（スキャン範囲内の
+                    ホストだけを削除し、並行して実行中の他のスキャンの結果を消さないために使う）
+
+        Returns:
+            int: 削除したホスト数
+        """
+        conn = self._connect()
+        with conn:
+            if within is None:
+                conn.execute(
+                    'DELETE FROM port_scans WHERE ip IN (SELECT ip FROM hosts WHERE last_seen < ?)', (seen_before,)
+                )
+                conn.execute(
+                    'DELETE FROM ports WHERE ip IN (SELECT ip FROM hosts WHERE last_seen < ?)', (seen_before,)
+                )
+                cursor = conn.execute('DELETE FROM hosts WHERE last_seen < ?', (seen_before,))
+                return cursor.rowcount
+
+            stale = [
+                (row['ip'],) for row in conn.execute('SELECT ip FROM hosts WHERE last_seen < ?', (seen_before,))
+                if within(row['ip'])
+            ]
+            conn.executemany('DELETE FROM port_scans WHERE ip = ?', stale)
+            conn.executemany('DELETE FROM ports WHERE ip = ?', stale)
+            conn.executemany('DELETE FROM hosts WHERE ip = ?', stale)
+        return len(stale)
+
+    def delete_host(self, ip: str) -> bool:
+        """
+        ホストとそのポートスキャン結果を削除
+
+        Returns:
+            bool: ホストが存在して削除した場合True
+        """
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute('DELETE FROM hosts WHERE ip = ?', (ip,))
+            conn.execute('DELETE FROM port_scans WHERE ip = ?', (ip,))
+            conn.execute('DELETE FROM ports WHERE ip = ?', (ip,))
+            conn.execute('DELETE FROM port_history WHERE ip = ?', (ip,))
+        return cursor.rowcount > 0
+
+    # ===== ポートスキャン結果 =====
+
+    def save_port_scan(self, ip: str, result: Dict):
+        """
+        ポートスキャン結果（進捗を含む）を保存
+
+        完了した結果（scan_stage が 'priority' または 'full'）の開いているポートは履歴にも数える。
+
+        Args:
+            ip: IPアドレス
+            result: ポートスキャン結果（ports, os, scan_time, scan_stage, progress, error）
+        """
+        progress = result.get('progress')
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO port_scans (ip, os, scan_time, scan_stage, error, progress, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (ip, result.get('os') or '', result.get('scan_time') or '', result.get('scan_stage') or '',
+                 result.get('error'), json.dumps(progress) if progress is not None else None, time.time())
+            )
+            conn.execute('DELETE FROM ports WHERE ip = ?', (ip,))
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO ports (ip, port, protocol, state, service, product, version)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (ip, int(port['port']), port.get('protocol') or 'tcp', port.get('state') or '',
+                     port.get('service') or '', port.get('product') or '', port.get('version') or '')
+                    for port in result.get('ports', [])
+                ]
+            )
+            if result.get('scan_stage') in ('priority', 'full'):
+                now = time.time()
+                conn.executemany(
+                    """
+                    INSERT INTO port_history (ip, port, protocol, open_count, last_open) VALUES (?, ?, ?, 1, ?)
+                    ON CONFLICT (ip, protocol, port) DO UPDATE SET
+                        open_count = open_count + 1, last_open = excluded.last_open
+                    """,
+                    [
+                        (ip, int(port['port']), port.get('protocol') or 'tcp', now)
+                        for port in result.get('ports', []) if port.get('state') == 'open'
+                    ]
+                )
+
+    def mark_interrupted_scans(self, message: str) -> int:
+        """
+        実行中のまま残っている全ポートスキャンをエラーにする（前回のプロセスが途中で終了した場合）
+
+        Args:
+            message: エラーメッセージ
+
+        Returns:
+            int: エラーにしたスキャン数
+        """
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                """
+                UPDATE port_scans SET scan_stage = 'error', error = ?, updated_at = ?
+                WHERE scan_stage = 'full_scanning'
+                """,
+                (message, time.time())
+            )
+        return cursor.rowcount
+
+    def get_port_scan(self, ip: str) -> Optional[Dict]:
+        """
+        ポートスキャン結果を取得
+
+        Returns:
+            Dict: ポートスキャン結果（未実行の場合None）
+        """
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM port_scans WHERE ip = ?', (ip,)).fetchone()
+        if row is None:
+            return None
+        ports = conn.execute('SELECT * FROM ports WHERE ip = ? ORDER BY port', (ip,)).fetchall()
+        return self._port_scan_from_rows(row, ports)
+
+    def get_port_scans(self) -> Dict[str, Dict]:
+        """
+        全ホストのポートスキャン結果を取得
+
+        Returns:
+            Dict: キー: IPアドレス、値: ポートスキャン結果
+        """
+        conn = self._connect()
+        ports_by_ip = {}
+        for port in conn.execute('SELECT * FROM ports ORDER BY ip, port'):
+            ports_by_ip.setdefault(port['ip'], []).append(port)
+        return {
+            row['ip']: self._port_scan_from_rows(row, ports_by_ip.get(row['ip'], []))
+            for row in conn.execute('SELECT * FROM port_scans')
+        }
+
+    def find_ports(self, port: Optional[int] = None, service: Optional[str] = None,
+                   subnet: Optional[str] = None) -> List[Dict]:
+        """
+        条件に一致するポートを全ホストから検索
+
+        Args:
+            port: ポート番号
+            service: サービス名（例: "http"）
+            subnet: ホストのサブネット
+
+        Returns:
+            List[Dict]: 一致したポート情報（ip, hostname を含む）
+        """
+        query = """
+            SELECT ports.*, hosts.hostname FROM ports
+            LEFT JOIN hosts ON hosts.ip = ports.ip
+            WHERE 1 = 1
+        """
+        params = []
+        if port is not None:
+            query += ' AND ports.port = ?'
+            params.append(port)
+        if service:
+            query += ' AND ports.service = ?'
+            params.append(service)
+        if subnet:
+            query += ' AND hosts.subnet = ?'
+            params.append(subnet)
+        query += ' ORDER BY ports.ip, ports.port'
+
+        return [
+            {
+                'ip': row['ip'],
+                'hostname': row['hostname'] or '',
+                'port': row['port'],
+                'protocol': row['protocol'],
+                'state': row['state'],
+                'service': row['service'],
+                'product': row['product'],
+                'version': row['version']
+            }
+            for row in self._connect().execute(query, params)
+        ]
+
+    def get_port_history(self, ip: str) -> List[int]:
+        """
+        ホストで過去に開いていたTCPポートを取得
+
+        Returns:
+            List[int]: 開いていた回数の多い順（同数なら最近開いていた順）のポート番号
+        """
+        return [
+            row['port']
+            for row in self._connect().execute(
+                """
+                SELECT port FROM port_history WHERE ip = ? AND protocol = 'tcp'
+                ORDER BY open_count DESC, last_open DESC, port
+                """,
+                (ip,)
+            )
+        ]
+
+    def rank_open_ports(self, limit: Optional[int] = None) -> List[int]:
+        """
+        スキャン履歴全体で開いていることの多いTCPポートを取得
+
+        Args:
+            limit: 最大件数（省略時は全て）
+
+        Returns:
+            List[int]: 開いていたホスト数の多い順（同数なら開いていた回数の多い順）のポート番号
+        """
+        return [
+            row['port']
+            for row in self._connect().execute(
+                """
+                SELECT port FROM port_history WHERE protocol = 'tcp'
+                GROUP BY port ORDER BY COUNT(*) DESC, SUM(open_count) DESC, port
+                LIMIT ?
+                """,
+                (limit if limit is not None else -1,)
+            )
+        ]
+
+    @staticmethod
+    def _port_scan_from_rows(row: sqlite3.Row, ports: List[sqlite3.Row]) -> Dict:
+        """DBの行からポートスキャン結果の辞書を組み立てる"""
+        result = {
+            'host': row['ip'],
+            'ports': [
+                {
+                    'port': port['port'],
+                    'protocol': port['protocol'],
+                    'state': port['state'],
+                    'service': port['service'],
+                    'product': port['product'],
+                    'version': port['version']
+                }
+                for port in ports
+            ],
+            'os': row['os'],
+            'scan_time': row['scan_time'],
+            'scan_stage': row['scan_stage']
+        }
+        if row['progress'] is not None:
+            result['progress'] = json.loads(row['progress'])
+        if row['error'] is not None:
+            result['error'] = row['error']
+        return result
+
+    # ===== メタ情報 =====
+
+    def set_meta(self, key: str, value: str):
+        """メタ情報（最終スキャン時刻など）を保存"""
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """メタ情報を取得"""
+        row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row is not None else default
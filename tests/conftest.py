@@ -0,0 +1,26 @@
+"""
+テスト共通のフィクスチャ
+"""
+
+import os
+import stat
+
+import pytest
+
+
+@pytest.fixture
+def fake_command(tmp_path, monkeypatch):
+    """
+    偽のコマンド（シェルスクリプト）を一時ディレクトリに作り、PATH の先頭に置く関数を返す
+
+    例: fake_command('nmap', FAKE_NMAP) は tmp_path/nmap を作ってそのパスを返す
+    """
+    monkeypatch.setenv('PATH', f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+    def install(name, script):
+        path = tmp_path / name
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+        return path
+
+    return install
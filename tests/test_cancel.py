@@ -0,0 +1,57 @@
+"""
+スキャンのキャンセル（scanner.CancelToken）のテスト
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scanner import AsyncPortScanner, CancelToken, ScanCancelled  # noqa: E402
+
+
+def test_cancel_terminates_registered_process():
+    token = CancelToken()
+    process = subprocess.Popen(['sleep', '30'])
+    with token.register(process):
+        started = time.monotonic()
+        token.cancel()
+        process.wait(timeout=5)
+    assert time.monotonic() - started < 1.0
+    assert token.is_cancelled()
+
+
+def test_register_after_cancel_terminates_immediately():
+    token = CancelToken()
+    token.cancel()
+    process = subprocess.Popen(['sleep', '30'])
+    with token.register(process):
+        assert process.wait(timeout=1.0) is not None
+
+
+def test_check_raises_after_cancel():
+    token = CancelToken()
+    token.check()
+    token.cancel()
+    with pytest.raises(ScanCancelled):
+        token.check()
+
+
+def test_async_port_scan_stops_when_cancelled():
+    token = CancelToken()
+    progress = []
+
+    def on_progress(scanned, total, found):
+        progress.append(scanned)
+        if scanned >= 200:
+            token.cancel()
+
+    started = time.monotonic()
+    AsyncPortScanner().scan('127.0.0.1', ports=range(1, 65536),
+                            progress_callback=on_progress, cancel_token=token)
+    assert time.monotonic() - started < 5.0
+    assert progress[-1] < 65535
@@ -0,0 +1,93 @@
+"""
+Server-Sent Events の配信（events.EventBroker）のテスト
+"""
+
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import events  # noqa: E402
+from events import EventBroker, format_sse  # noqa: E402
+
+
+def drain(subscriber):
+    messages = []
+    while not subscriber.empty():
+        messages.append(subscriber.get_nowait())
+    return messages
+
+
+def test_format_sse():
+    message = format_sse('host_found', {'ip': '10.0.0.1', 'hostname': 'ルーター'})
+    event_line, data_line, *_ = message.split('\n')
+    assert event_line == 'event: host_found'
+    assert json.loads(data_line[len('data: '):]) == {'ip': '10.0.0.1', 'hostname': 'ルーター'}
+    assert message.endswith('\n\n')
+
+
+def test_overflow_drops_oldest_events():
+    broker = EventBroker(queue_size=3)
+    subscriber = broker.subscribe()
+    for index in range(5):
+        broker.publish('progress', {'index': index})
+
+    messages = drain(subscriber)
+    assert messages == [format_sse('progress', {'index': index}) for index in (2, 3, 4)]
+
+
+def test_slow_subscriber_does_not_block_others():
+    broker = EventBroker(queue_size=2)
+    slow = broker.subscribe()
+    fast = broker.subscribe()
+    received = []
+
+    def publish_all():
+        for index in range(100):
+            broker.publish('progress', {'index': index})
+            received.extend(drain(fast))
+
+    # 読み出さない購読者がいても publish は待たされない
+    thread = threading.Thread(target=publish_all)
+    thread.start()
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+    assert len(received) == 100
+    assert slow.qsize() == 2
+
+
+def test_unsubscribed_queue_receives_nothing():
+    broker = EventBroker()
+    subscriber = broker.subscribe()
+    broker.unsubscribe(subscriber)
+    broker.unsubscribe(subscriber)  # 二重の解除は無視される
+    broker.publish('scan_complete', {})
+    assert subscriber.empty()
+
+
+def test_stream_sends_initial_state_and_unsubscribes_on_close():
+    broker = EventBroker()
+    stream = broker.stream(initial={'status': {'is_scanning': False}})
+    assert next(stream) == format_sse('status', {'is_scanning': False})
+
+    broker.publish('host_found', {'ip': '10.0.0.1'})
+    assert next(stream) == format_sse('host_found', {'ip': '10.0.0.1'})
+    assert len(broker._subscribers) == 1
+
+    # 接続が切れた（ジェネレータが閉じられた）購読者は配信対象から外れる
+    stream.close()
+    assert len(broker._subscribers) == 0
+
+
+def test_stream_sends_keepalive_when_idle(monkeypatch):
+    monkeypatch.setattr(events, 'KEEPALIVE_INTERVAL', 0.01)
+    broker = EventBroker()
+    stream = broker.stream()
+    try:
+        assert next(stream) == ': keepalive\n\n'
+        broker.publish('progress', {'progress': 50})
+        assert next(stream) == format_sse('progress', {'progress': 50})
+    finally:
+        stream.close()
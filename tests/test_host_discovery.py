@@ -0,0 +1,81 @@
+"""
+ホスト検出（scanner.AsyncHostDiscovery・NetworkScanner.ping_scan_many）のテスト
+"""
+
+import errno
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scanner  # noqa: E402
+from scanner import AsyncHostDiscovery  # noqa: E402
+
+
+def test_loopback_hosts_are_found():
+    # ループバック宛の接続は RST が返るため生存とみなされる
+    results = AsyncHostDiscovery(ports=[1], resolve_hostnames=False).scan('127.0.0.1-3')
+    assert sorted(results) == ['127.0.0.1', '127.0.0.2', '127.0.0.3']
+
+
+def test_socket_exhaustion_does_not_abort_discovery(monkeypatch):
+    real_socket = socket.socket
+    calls = []
+
+    def exhausted_socket(*args, **kwargs):
+        if len(args) > 2 or kwargs:
+            # イベントループ内部（socketpair等）の既存fdのラップはそのまま通す
+            return real_socket(*args, **kwargs)
+        calls.append(1)
+        # 最初の数回はファイルディスクリプタの枯渇、その後は回復する
+        if len(calls) <= 2:
+            raise OSError(errno.EMFILE, 'Too many open files')
+        return real_socket(*args, **kwargs)
+
+    monkeypatch.setattr(scanner.socket, 'socket', exhausted_socket)
+    results = AsyncHostDiscovery(ports=[1], resolve_hostnames=False).scan('127.0.0.1')
+    assert list(results) == ['127.0.0.1']
+
+
+def test_persistent_socket_errors_mark_host_down(monkeypatch):
+    real_socket = socket.socket
+
+    def broken_socket(*args, **kwargs):
+        if len(args) > 2 or kwargs:
+            return real_socket(*args, **kwargs)
+        raise OSError(errno.ENFILE, 'Too many open files in system')
+
+    monkeypatch.setattr(scanner.socket, 'socket', broken_socket)
+    assert AsyncHostDiscovery(ports=[1], resolve_hostnames=False).scan('127.0.0.1') == {}
+
+
+def test_hostname_targets_are_resolved(capsys):
+    results = AsyncHostDiscovery(ports=[1], resolve_hostnames=False).scan_many(
+        ['localhost', 'no-such-host.invalid'])
+    assert results['127.0.0.1']['subnet'] == 'localhost'
+    assert 'no-such-host.invalid' in capsys.readouterr().out
+
+
+def test_cancelled_scan_does_not_seed_neighbors(monkeypatch):
+    monkeypatch.setattr(scanner, 'read_neighbor_table', lambda: {'127.0.0.1': '00:11:22:33:44:55'})
+    net_scanner = scanner.NetworkScanner()
+    token = scanner.CancelToken()
+    token.cancel()
+    found = []
+
+    results = net_scanner.ping_scan_many(['127.0.0.0/30'], engine='async', probe_ports=[1],
+                                         host_callback=lambda *args: found.append(args), cancel_token=token)
+    assert results == {}
+    assert found == []
+
+
+def test_neighbors_are_seeded_before_scan(monkeypatch):
+    monkeypatch.setattr(scanner, 'read_neighbor_table', lambda: {'127.0.0.1': '00:11:22:33:44:55'})
+    net_scanner = scanner.NetworkScanner()
+    found = []
+
+    results = net_scanner.ping_scan_many(['127.0.0.0/30'], engine='async', probe_ports=[1],
+                                         host_callback=lambda *args: found.append(args))
+    assert found[0][0] == '127.0.0.1'
+    assert set(results) == {'127.0.0.1', '127.0.0.2'}
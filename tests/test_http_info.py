@@ -0,0 +1,218 @@
+"""
+HTTP詳細情報の取得（scanner.NetworkScanner.get_http_fingerprint・prefetch_http_info）のテスト
+
+ループバックで待ち受けるHTTPサーバーに対して取得する。
+"""
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scanner import HttpInfoCache, NetworkScanner, is_http_port  # noqa: E402
+
+
+class Handler(BaseHTTPRequestHandler):
+    # keep-alive で接続を再利用できるようにする
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.client_address)
+        if self.server.failures > 0:
+            # 応答を返さずに接続を切る（一時的な障害）
+            self.server.failures -= 1
+            self.close_connection = True
+            return
+        etag = f'"v{self.server.version}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = f'<html><head><title>Test Page {self.server.version}</title></head></html>'.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('X-Frame-Options', 'DENY')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    servers = []
+
+    def start():
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.requests = []
+        server.version = 1
+        server.not_modified = 0
+        server.failures = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_is_http_port():
+    assert is_http_port({'port': 8080, 'state': 'open', 'service': ''})
+    assert is_http_port({'port': 9999, 'state': 'open', 'service': 'ssl/http'})
+    assert not is_http_port({'port': 22, 'state': 'open', 'service': 'ssh'})
+    assert not is_http_port({'port': 80, 'state': 'filtered', 'service': 'http'})
+
+
+def test_fingerprint_is_cached(http_server):
+    server = http_server()
+    port = server.server_address[1]
+    scanner = NetworkScanner()
+
+    info = scanner.get_http_fingerprint('127.0.0.1', port)
+    assert info['accessible'] and info['title'] == 'Test Page 1'
+    assert info['security_headers']['X-Frame-Options']['present']
+    assert info['cache'] == 'miss'
+    assert scanner.get_http_fingerprint('127.0.0.1', port) == dict(info, cache='hit')
+    assert len(server.requests) == 1
+
+
+def test_session_reuses_connections(http_server):
+    server = http_server()
+    port = server.server_address[1]
+    scanner = NetworkScanner()
+    for _ in range(3):
+        scanner.get_http_fingerprint('127.0.0.1', port, refresh=True)
+    # 3回のリクエストが同じ接続（同じ送信元ポート）で送られる
+    assert len(server.requests) == 3
+    assert len(set(server.requests)) == 1
+
+
+def test_prefetch_fetches_http_ports_concurrently(http_server):
+    servers = [http_server() for _ in range(4)]
+    ports = [{'port': server.server_address[1], 'protocol': 'tcp', 'state': 'open', 'service': 'http'}
+             for server in servers]
+    ports.append({'port': 22, 'protocol': 'tcp', 'state': 'open', 'service': 'ssh'})
+    scanner = NetworkScanner()
+
+    assert scanner.prefetch_http_info('127.0.0.1', ports) == 4
+    # 取得中・キャッシュ済みのポートは重複して取得しない
+    assert scanner.prefetch_http_info('127.0.0.1', ports) == 0
+    assert wait_until(lambda: scanner.http_info_cache.stats()['entries'] == 4)
+
+    infos = [scanner.get_http_fingerprint('127.0.0.1', port['port']) for port in ports[:4]]
+    assert all(info['title'] == 'Test Page 1' for info in infos)
+    assert [len(server.requests) for server in servers] == [1, 1, 1, 1]
+
+
+def test_detect_services_prefetches_http_ports(http_server):
+    server = http_server()
+    port = server.server_address[1]
+    scanner = NetworkScanner()
+    result = scanner.detect_services('127.0.0.1', [port])
+    assert result['ports'][0]['service'] == 'http'
+    assert wait_until(lambda: scanner.http_info_cache.is_fresh('127.0.0.1', port, 'http'))
+
+
+def test_refresh_revalidates_with_etag(http_server):
+    server = http_server()
+    port = server.server_address[1]
+    scanner = NetworkScanner()
+    first = scanner.get_http_info('127.0.0.1', port)
+
+    refreshed = scanner.get_http_info('127.0.0.1', port, refresh=True)
+    assert refreshed['cache'] == 'revalidated'
+    assert refreshed['title'] == first['title']
+    assert server.not_modified == 1
+
+    # 内容が変わった場合は取得し直す
+    server.version = 2
+    changed = scanner.get_http_info('127.0.0.1', port, refresh=True)
+    assert changed['cache'] == 'miss' and changed['title'] == 'Test Page 2'
+    assert scanner.http_info_cache.stats()['revalidated'] == 1
+
+
+def test_expired_entries_are_revalidated(http_server):
+    server = http_server()
+    port = server.server_address[1]
+    scanner = NetworkScanner()
+    scanner.http_info_cache.ttl = 0
+    scanner.get_http_info('127.0.0.1', port)
+    time.sleep(0.01)
+    assert scanner.get_http_info('127.0.0.1', port)['cache'] == 'revalidated'
+    assert len(server.requests) == 2 and server.not_modified == 1
+
+
+def test_cache_is_keyed_by_scheme_and_bounded():
+    cache = HttpInfoCache(max_entries=2)
+    cache.put('10.0.0.1', 443, 'https', {'title': 'tls'})
+    cache.put('10.0.0.1', 443, 'http', {'title': 'plain'})
+    assert cache.lookup('10.0.0.1', 443, 'https')['info'] == {'title': 'tls'}
+    # 最も長く使われていない http のエントリが削除される
+    cache.put('10.0.0.2', 80, 'http', {'title': 'other'})
+    assert cache.lookup('10.0.0.1', 443, 'http') is None
+    assert cache.lookup('10.0.0.1', 443, 'https') is not None
+
+
+def test_failures_are_not_cached(http_server):
+    server = http_server()
+    server.failures = 1
+    port = server.server_address[1]
+    scanner = NetworkScanner()
+
+    failed = scanner.get_http_info('127.0.0.1', port)
+    assert not failed['accessible'] and failed['error']
+    assert not scanner.http_info_cache.is_fresh('127.0.0.1', port, 'http')
+
+    # 次の要求では取得し直し、失敗した結果を返さない
+    info = scanner.get_http_info('127.0.0.1', port)
+    assert info['accessible'] and info['title'] == 'Test Page 1'
+    assert info['cache'] == 'miss'
+    assert scanner.get_http_info('127.0.0.1', port)['cache'] == 'hit'
+    assert len(server.requests) == 2
+
+
+def test_failed_refresh_drops_cached_info(http_server):
+    server = http_server()
+    port = server.server_address[1]
+    scanner = NetworkScanner()
+    scanner.get_http_info('127.0.0.1', port)
+
+    server.failures = 1
+    assert not scanner.get_http_info('127.0.0.1', port, refresh=True)['accessible']
+    assert scanner.http_info_cache.lookup('127.0.0.1', port, 'http') is None
+    assert scanner.get_http_info('127.0.0.1', port)['title'] == 'Test Page 1'
+
+
+def test_closed_port_is_fetched_again(http_server):
+    server = http_server()
+    port = server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    scanner = NetworkScanner()
+    ports = [{'port': port, 'protocol': 'tcp', 'state': 'open', 'service': 'http'}]
+
+    assert scanner.prefetch_http_info('127.0.0.1', ports) == 1
+    assert wait_until(lambda: not scanner._http_pending)
+    assert scanner.http_info_cache.stats()['entries'] == 0
+    assert scanner.prefetch_http_info('127.0.0.1', ports) == 1
@@ -0,0 +1,140 @@
+"""
+インターフェース情報の読み取り（scanner.read_interface_networks / NetworkScanner.detect_subnets）のテスト
+"""
+
+import ipaddress
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scanner  # noqa: E402
+from scanner import NetworkScanner, read_interface_networks  # noqa: E402
+
+# eth0: 192.168.1.0/24（デフォルトルート 192.168.1.1）、docker0: 172.17.0.0/16、wg0: 10.0.0.0/8
+PROC_ROUTE = (
+    "Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT\n"
+    "eth0\t00000000\t0101A8C0\t0003\t0\t0\t100\t00000000\t0\t0\t0\n"
+    "eth0\t0001A8C0\t00000000\t0001\t0\t0\t100\t00FFFFFF\t0\t0\t0\n"
+    "docker0\t000011AC\t00000000\t0001\t0\t0\t0\t0000FFFF\t0\t0\t0\n"
+    "wg0\t0000000A\t00000000\t0001\t0\t0\t0\t000000FF\t0\t0\t0\n"
+    # RTF_UP が立っていない経路は無視される
+    "eth1\t000010AC\t00000000\t0000\t0\t0\t0\t0000FFFF\t0\t0\t0\n"
+)
+
+PROC_FIB_TRIE = """Main:
+  +-- 0.0.0.0/0 3 0 5
+     |-- 0.0.0.0
+        /0 universe UNICAST
+     +-- 10.0.0.0/8 2 0 2
+        |-- 10.3.7.9
+           /32 host LOCAL
+     +-- 127.0.0.0/8 2 0 2
+        |-- 127.0.0.1
+           /32 host LOCAL
+     +-- 172.17.0.0/16 2 0 2
+        |-- 172.17.0.1
+           /32 host LOCAL
+        |-- 172.17.255.255
+           /32 link BROADCAST
+     +-- 192.168.1.0/24 2 0 2
+        |-- 192.168.1.20
+           /32 host LOCAL
+Local:
+  +-- 0.0.0.0/0 3 0 5
+     +-- 192.168.1.0/24 2 0 2
+        |-- 192.168.1.20
+           /32 host LOCAL
+     |-- 203.0.113.7
+        /32 host LOCAL
+"""
+
+IFCONFIG_MACOS = """lo0: flags=8049<UP,LOOPBACK,RUNNING,MULTICAST> mtu 16384
+\tinet 127.0.0.1 netmask 0xff000000
+\tinet6 ::1 prefixlen 128
+en0: flags=8863<UP,BROADCAST,SMART,RUNNING,SIMPLEX,MULTICAST> mtu 1500
+\tether a4:83:e7:00:00:01
+\tinet6 fe80::1%en0 prefixlen 64 secured scopeid 0x4
+\tinet 192.168.10.23 netmask 0xfffffe00 broadcast 192.168.11.255
+bridge100: flags=8863<UP,BROADCAST,SMART,RUNNING,SIMPLEX,MULTICAST> mtu 1500
+\tinet 10.211.55.2 netmask 255.255.255.0 broadcast 10.211.55.255
+"""
+
+
+@pytest.fixture
+def proc_files(tmp_path, monkeypatch):
+    route = tmp_path / 'route'
+    route.write_text(PROC_ROUTE)
+    fib_trie = tmp_path / 'fib_trie'
+    fib_trie.write_text(PROC_FIB_TRIE)
+    monkeypatch.setattr(scanner, 'PROC_NET_ROUTE', str(route))
+    monkeypatch.setattr(scanner, 'PROC_NET_FIB_TRIE', str(fib_trie))
+
+
+@pytest.fixture
+def ifconfig(tmp_path, monkeypatch):
+    # /proc がない環境（macOS等）として ifconfig の出力を使わせる
+    monkeypatch.setattr(scanner, 'PROC_NET_ROUTE', str(tmp_path / 'missing'))
+
+    real_run = subprocess.run
+
+    def fake_run(args, **kwargs):
+        if args != ['ifconfig']:
+            return real_run(args, **kwargs)
+        return subprocess.CompletedProcess(args, 0, stdout=IFCONFIG_MACOS, stderr='')
+
+    monkeypatch.setattr(scanner.subprocess, 'run', fake_run)
+
+
+def interfaces_of(info):
+    return [(name, str(interface)) for name, interface in info['interfaces']]
+
+
+def test_proc_interfaces_use_real_prefix_lengths(proc_files):
+    info = read_interface_networks()
+    assert interfaces_of(info) == [
+        ('wg0', '10.3.7.9/8'),
+        ('lo', '127.0.0.1/8'),
+        ('docker0', '172.17.0.1/16'),
+        ('eth0', '192.168.1.20/24'),
+        # オンリンクの経路がないアドレスは /32
+        ('', '203.0.113.7/32'),
+    ]
+    assert info['gateways'] == ['192.168.1.1']
+    assert info['default_address'] == '192.168.1.20'
+
+
+def test_ifconfig_interfaces_parse_hex_and_dotted_netmasks(ifconfig):
+    info = read_interface_networks()
+    assert interfaces_of(info) == [
+        ('lo0', '127.0.0.1/8'),
+        ('en0', '192.168.10.23/23'),
+        ('bridge100', '10.211.55.2/24'),
+    ]
+    assert info['gateways'] == []
+    # デフォルトルートが分からない場合は最初のループバック以外のアドレス
+    assert info['default_address'] == '192.168.10.23'
+
+
+def test_detect_subnets_from_proc(proc_files):
+    subnets = NetworkScanner().detect_subnets()
+    # デフォルトルートのサブネットが先頭、/16 より広いネットワークは自分を含む /16 に絞る
+    assert subnets == ['192.168.1.0/24', '10.3.0.0/16', '172.17.0.0/16']
+    assert all(ipaddress.IPv4Network(subnet).prefixlen >= 16 for subnet in subnets)
+
+
+def test_detect_subnets_without_docker(proc_files):
+    assert NetworkScanner().detect_subnets(include_docker=False) == ['192.168.1.0/24']
+
+
+def test_detect_subnets_from_ifconfig(ifconfig):
+    assert NetworkScanner().detect_subnets() == ['192.168.10.0/23', '10.211.55.0/24']
+
+
+def test_detect_subnets_falls_back_when_nothing_found(monkeypatch):
+    monkeypatch.setattr(scanner, 'read_interface_networks',
+                        lambda: {'interfaces': [], 'gateways': [], 'default_address': None})
+    assert NetworkScanner().detect_subnets() == ['192.168.0.0/24']
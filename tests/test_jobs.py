@@ -0,0 +1,220 @@
+"""
+スキャンジョブ（jobs.JobManager）とnmapの実行枠（scanner.NmapProcessBudget）の優先度のテスト
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from jobs import JobManager  # noqa: E402
+from scanner import (CancelToken, NmapProcessBudget, PRIORITY_BULK, PRIORITY_INTERACTIVE,  # noqa: E402
+                     PRIORITY_NORMAL, ScanCancelled)
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def blocking_job(release, started=None):
+    def run(job):
+        if started is not None:
+            started.append(job.id)
+        release.wait(timeout=5)
+        return job.id
+    return run
+
+
+def test_jobs_run_concurrently_and_return_results():
+    manager = JobManager(max_running=2)
+    release = threading.Event()
+    first = manager.submit('scan', blocking_job(release))
+    second = manager.submit('scan', blocking_job(release))
+    assert first.state == 'running' and second.state == 'running'
+    assert first.id != second.id
+
+    release.set()
+    assert wait_until(lambda: not first.is_active() and not second.is_active())
+    assert first.state == 'done' and first.result == first.id
+    assert manager.stats() == {'limit': 2, 'running': 0, 'queued': 0}
+
+
+def test_queued_jobs_start_in_priority_order():
+    manager = JobManager(max_running=1)
+    release = threading.Event()
+    started = []
+    manager.submit('scan', blocking_job(release, started))
+    bulk = manager.submit('port_sweep', blocking_job(release, started), priority=PRIORITY_BULK)
+    normal = manager.submit('scan', blocking_job(release, started), priority=PRIORITY_NORMAL)
+    interactive = manager.submit('port_scan', blocking_job(release, started), priority=PRIORITY_INTERACTIVE)
+    assert bulk.state == normal.state == interactive.state == 'queued'
+
+    release.set()
+    assert wait_until(lambda: len(started) == 4)
+    assert started[1:] == [interactive.id, normal.id, bulk.id]
+
+
+def test_bulk_jobs_leave_a_slot_for_interactive_work():
+    manager = JobManager(max_running=3)
+    release = threading.Event()
+    sweeps = [manager.submit('port_sweep', blocking_job(release), priority=PRIORITY_BULK) for _ in range(3)]
+    assert [job.state for job in sweeps] == ['running', 'running', 'queued']
+
+    interactive = manager.submit('port_scan', blocking_job(release), priority=PRIORITY_INTERACTIVE)
+    assert interactive.state == 'running'
+    release.set()
+    assert wait_until(lambda: all(not job.is_active() for job in sweeps + [interactive]))
+
+
+def test_cancel_queued_job_runs_it_with_cancelled_token():
+    manager = JobManager(max_running=1)
+    release = threading.Event()
+    manager.submit('scan', blocking_job(release))
+    seen = []
+    queued = manager.submit('scan', lambda job: seen.append(job.cancel_token.is_cancelled()))
+
+    assert manager.cancel(queued.id)
+    assert wait_until(lambda: not queued.is_active())
+    assert queued.state == 'cancelled'
+    assert seen == [True]
+    assert not manager.cancel(queued.id)
+    release.set()
+
+
+def test_failed_job_records_error():
+    def fail(job):
+        raise RuntimeError('boom')
+
+    manager = JobManager()
+    job = manager.submit('scan', fail)
+    assert wait_until(lambda: not job.is_active())
+    assert job.state == 'error' and job.error == 'boom'
+
+
+def test_finished_jobs_are_discarded_beyond_history_limit():
+    manager = JobManager(history_limit=2)
+    jobs = [manager.submit('scan', lambda job: None) for _ in range(4)]
+    assert wait_until(lambda: all(not job.is_active() for job in jobs))
+    manager.submit('scan', lambda job: None)
+    assert len(manager.list_jobs()) <= 3
+    assert manager.get(jobs[0].id) is None
+
+
+def test_nmap_budget_hands_slots_to_higher_priority_first():
+    budget = NmapProcessBudget(limit=1)
+    budget.acquire()
+    order = []
+
+    def waiter(name, priority):
+        budget.acquire(priority)
+        order.append(name)
+        budget.release()
+
+    threads = [threading.Thread(target=waiter, args=('bulk', PRIORITY_BULK))]
+    threads[0].start()
+    assert wait_until(lambda: budget.stats()['queued'] == 1)
+    threads.append(threading.Thread(target=waiter, args=('interactive', PRIORITY_INTERACTIVE)))
+    threads[1].start()
+    assert wait_until(lambda: budget.stats()['queued'] == 2)
+
+    budget.release()
+    for thread in threads:
+        thread.join(timeout=2)
+    assert order == ['interactive', 'bulk']
+
+
+def test_nmap_budget_keeps_arrival_order_within_priority():
+    budget = NmapProcessBudget(limit=1)
+    budget.acquire()
+    order = []
+
+    def waiter(name):
+        budget.acquire(PRIORITY_NORMAL)
+        order.append(name)
+        budget.release()
+
+    threads = []
+    for index, name in enumerate(['first', 'second', 'third']):
+        threads.append(threading.Thread(target=waiter, args=(name,)))
+        threads[-1].start()
+        assert wait_until(lambda: budget.stats()['queued'] == index + 1)
+
+    budget.release()
+    for thread in threads:
+        thread.join(timeout=2)
+    assert order == ['first', 'second', 'third']
+
+
+def test_nmap_budget_set_limit_grows_and_shrinks():
+    budget = NmapProcessBudget(limit=1)
+    budget.acquire()
+    acquired = []
+
+    def waiter(name):
+        budget.acquire()
+        acquired.append(name)
+
+    threads = [threading.Thread(target=waiter, args=(name,)) for name in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    assert wait_until(lambda: budget.stats()['queued'] == 2)
+
+    # 上限を増やすと待機中のプロセスが空き枠分だけ起動する
+    budget.set_limit(3)
+    for thread in threads:
+        thread.join(timeout=2)
+    assert sorted(acquired) == ['a', 'b']
+    assert budget.stats() == {'limit': 3, 'running': 3, 'queued': 0}
+
+    # 上限を減らしても実行中のものは止めず、実行数が上限を下回るまで新しい枠を渡さない
+    budget.set_limit(1)
+    late = threading.Thread(target=waiter, args=('c',))
+    late.start()
+    assert wait_until(lambda: budget.stats()['queued'] == 1)
+    budget.release()
+    budget.release()
+    time.sleep(0.05)
+    assert 'c' not in acquired
+    budget.release()
+    late.join(timeout=2)
+    assert acquired[-1] == 'c'
+    assert budget.stats() == {'limit': 1, 'running': 1, 'queued': 0}
+
+
+def test_nmap_budget_cancelled_waiter_leaves_queue():
+    budget = NmapProcessBudget(limit=1)
+    budget.acquire()
+    token = CancelToken()
+    outcome = []
+
+    def waiter():
+        try:
+            budget.acquire(PRIORITY_INTERACTIVE, token)
+            outcome.append('acquired')
+        except ScanCancelled:
+            outcome.append('cancelled')
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert wait_until(lambda: budget.stats()['queued'] == 1)
+    token.cancel()
+    thread.join(timeout=2)
+    assert outcome == ['cancelled']
+    assert budget.stats() == {'limit': 1, 'running': 1, 'queued': 0}
+
+    # キャンセルされた待機者に枠が渡されることはない
+    budget.release()
+    assert budget.stats()['running'] == 0
+    with pytest.raises(ScanCancelled):
+        with budget.slot(PRIORITY_NORMAL, token):
+            pass
+    assert budget.stats()['running'] == 0
@@ -0,0 +1,186 @@
+"""
+root権限のnmapを実行する常駐ヘルパー（nmap_helper.py / scanner.PrivilegedNmapHelper）のテスト
+
+sudo の代わりにヘルパーを直接起動し（または偽の sudo を経由させ）、PATH に置いた偽の nmap を実行させる。
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scanner  # noqa: E402
+from nmap_helper import check_nmap_args  # noqa: E402
+from scanner import (CancelToken, NetworkScanner, NmapHelperError, PrivilegedNmapHelper, ScanCancelled,  # noqa: E402
+                     SudoAuthenticationError)
+
+FAKE_NMAP = """#!/bin/sh
+case "$*" in
+  -V) echo "Nmap version 7.94 ( https://nmap.org )"; exit 0 ;;
+  *slow*) exec sleep 30 ;;
+  *fail*) echo "invalid target" >&2; exit 1 ;;
+esac
+echo '<?xml version="1.0"?>'
+echo "<nmaprun args=\\"nmap $*\\"><host><address addr=\\"10.0.0.1\\" addrtype=\\"ipv4\\"/>"
+echo '<ports><port protocol="tcp" portid="22"><state state="open"/><service name="ssh"/></port></ports></host></nmaprun>'
+"""
+
+# パスワードを確認した後、Python（ヘルパー）の実行だけを拒否する sudo
+FAKE_SUDO = """#!/bin/sh
+read password
+if [ "$password" != "password" ]; then
+  echo "Sorry, try again." >&2
+  echo "sudo: 1 incorrect password attempt" >&2
+  exit 1
+fi
+case "$1" in
+  *python*) echo "Sorry, user alice is not allowed to execute '$*' as root on host." >&2; exit 1 ;;
+esac
+exec "$@"
+"""
+
+
+@pytest.fixture
+def helper(fake_command):
+    fake_command('nmap', FAKE_NMAP)
+    helper = PrivilegedNmapHelper('password', sudo_command=())
+    helper.start()
+    yield helper
+    helper.stop()
+
+
+def test_scan_streams_xml_back(helper):
+    scan = helper.scan(['-sS', '-p', '22', '10.0.0.1'])
+    assert scan.returncode == 0
+    assert 'args="nmap -oX - -sS -p 22 10.0.0.1"' in scan.xml
+    assert 'portid="22"' in scan.xml
+
+
+def test_concurrent_scans_share_one_helper(helper):
+    results = []
+    threads = [
+        threading.Thread(target=lambda i=i: results.append(helper.scan([f'10.0.0.{i}']).xml))
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert sorted(xml.split('-oX - ')[1].split('"')[0] for xml in results) == [f'10.0.0.{i}' for i in range(8)]
+
+
+def test_failed_scan_reports_stderr(helper):
+    scan = helper.scan(['fail'])
+    assert scan.returncode == 1
+    assert 'invalid target' in scan.stderr
+
+
+def test_cancel_terminates_helper_scan(helper):
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+    started = time.monotonic()
+    helper.scan(['slow'], cancel_token=token)
+    assert time.monotonic() - started < 1.5
+    with pytest.raises(ScanCancelled):
+        token.check()
+
+
+def test_stopped_helper_rejects_scans(helper):
+    helper.stop()
+    assert not helper.is_alive()
+    with pytest.raises(NmapHelperError):
+        helper.scan(['10.0.0.1'])
+
+
+def test_start_reports_failure():
+    helper = PrivilegedNmapHelper('password', sudo_command=('sh', '-c', 'echo "Sorry, try again." >&2', 'sudo'))
+    with pytest.raises(NmapHelperError, match='sudoパスワード'):
+        helper.start()
+
+
+def test_start_reports_sudo_denied():
+    helper = PrivilegedNmapHelper('password', sudo_command=(
+        'sh', '-c', 'read password; echo "Sorry, user alice is not allowed to execute python3 as root." >&2; exit 1',
+        'sudo'))
+    with pytest.raises(NmapHelperError, match='not allowed') as excinfo:
+        helper.start()
+    # パスワードの誤りとは区別する
+    assert not isinstance(excinfo.value, SudoAuthenticationError)
+    assert not helper.is_alive()
+
+
+def test_wrong_password_is_reported_cleanly():
+    helper = PrivilegedNmapHelper('wrong', sudo_command=(
+        'sh', '-c', 'read password; echo "Sorry, try again." >&2; echo "sudo: 1 incorrect password attempt" >&2; exit 1',
+        'sudo'))
+    with pytest.raises(SudoAuthenticationError, match='sudoパスワードが正しくありません'):
+        helper.start()
+    assert not helper.is_alive()
+
+
+@pytest.mark.parametrize('args, error', [
+    (['-sS', '-sV', '-O', '-p', '22,80', '-T4', '--open', '--host-timeout', '30s', '10.0.0.1'], None),
+    (['-sU', '-p1-1024', '--max-rate=100', '-PS22,443', '10.0.0.0/24'], None),
+    (['-oN', '/etc/cron.d/x', '10.0.0.1'], 'root権限では使用できない'),
+    (['-oX', '-', '10.0.0.1'], 'root権限では使用できない'),
+    (['--script', 'http-title', '10.0.0.1'], 'root権限では使用できない'),
+    (['--script=/tmp/evil.nse', '10.0.0.1'], 'root権限では使用できない'),
+    (['-sC', '10.0.0.1'], 'root権限では使用できない'),
+    (['-A', '10.0.0.1'], 'root権限では使用できない'),
+    (['--datadir', '/tmp', '10.0.0.1'], 'root権限では使用できない'),
+    (['-iL', '/etc/shadow'], 'root権限では使用できない'),
+    (['--unknown-option', '10.0.0.1'], '許可されていない'),
+    (['10.0.0.1', '-p'], '値がありません'),
+    ('-sS 10.0.0.1', '文字列のリスト'),
+])
+def test_check_nmap_args(args, error):
+    result = check_nmap_args(args)
+    if error is None:
+        assert result is None
+    else:
+        assert error in result
+
+
+def test_helper_rejects_disallowed_options(helper):
+    scan = helper.scan(['--script', 'http-title', '-oN', '/tmp/out', '10.0.0.1'])
+    assert scan.returncode == -1
+    assert 'root権限では使用できない' in scan.stderr
+    assert scan.xml == ''
+
+
+@pytest.fixture
+def fake_sudo(fake_command, monkeypatch):
+    fake_command('nmap', FAKE_NMAP)
+    monkeypatch.setattr(scanner, 'SUDO_COMMAND', (str(fake_command('sudo', FAKE_SUDO)),))
+
+
+def test_falls_back_to_sudo_nmap_when_helper_is_denied(fake_sudo):
+    net_scanner = NetworkScanner()
+    net_scanner.set_sudo_password('password')
+    assert net_scanner.nmap_helper is None
+    assert 'not allowed' in net_scanner.nmap_helper_error
+
+    result = net_scanner.port_scan('10.0.0.1', '-sS -p 22', verbose=False)
+    assert 'error' not in result
+    assert [port['port'] for port in result['ports']] == [22]
+    assert net_scanner.nmap_runner.stats()['recent'][0]['via'] == 'sudo'
+
+
+def test_fallback_rejects_disallowed_options(fake_sudo):
+    net_scanner = NetworkScanner()
+    net_scanner.set_sudo_password('password')
+    result = net_scanner.port_scan('10.0.0.1', '-sS -oN /tmp/out', verbose=False)
+    assert 'root権限では使用できない' in result['error']
+    assert net_scanner.nmap_runner.stats()['recent'] == []
+
+
+def test_wrong_password_is_not_stored(fake_sudo):
+    net_scanner = NetworkScanner()
+    with pytest.raises(SudoAuthenticationError):
+        net_scanner.set_sudo_password('wrong')
+    assert net_scanner.sudo_password is None
+    assert net_scanner.nmap_helper is None
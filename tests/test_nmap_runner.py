@@ -0,0 +1,104 @@
+"""
+nmapの実行層（scanner.NmapRunner）のテスト
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scanner import CancelToken, NetworkScanner, NmapRunner, ScanCancelled  # noqa: E402
+
+# 呼び出しを nmap.log に記録し、-iL - の場合は標準入力のターゲットをホストとして返す
+FAKE_NMAP = """#!/bin/sh
+echo "$*" >> "$(dirname "$0")/nmap.log"
+case "$*" in
+  -V) echo "Nmap version 7.94SVN ( https://nmap.org )"; exit 0 ;;
+esac
+echo '<?xml version="1.0"?><nmaprun>'
+if [ "${*##*-iL -}" != "$*" ]; then
+  while read target; do
+    echo "<host><status state=\\"up\\"/><address addr=\\"$target\\" addrtype=\\"ipv4\\"/></host>"
+  done
+else
+  for target in "$@"; do last="$target"; done
+  echo "<host><status state=\\"up\\"/><address addr=\\"$last\\" addrtype=\\"ipv4\\"/></host>"
+fi
+echo '</nmaprun>'
+"""
+
+
+@pytest.fixture
+def nmap_dir(fake_command):
+    return fake_command('nmap', FAKE_NMAP).parent
+
+
+def nmap_calls(nmap_dir):
+    return (nmap_dir / 'nmap.log').read_text().splitlines()
+
+
+def test_version_is_resolved_once(nmap_dir):
+    scanner = NetworkScanner()
+    assert scanner.nmap_runner.version == '7.94SVN'
+    for i in range(4):
+        scanner._scan_single_chunk(f'10.0.0.{i}', '10.0.0.0/24')
+    calls = nmap_calls(nmap_dir)
+    assert calls.count('-V') == 1
+    assert len(calls) == 5
+
+
+def test_parallel_runs_from_threads(nmap_dir):
+    runner = NmapRunner()
+    results = {}
+
+    def scan(i):
+        results[i] = [host['ip'] for host in runner.run(['-sT', f'10.0.1.{i}'])['hosts']]
+
+    threads = [threading.Thread(target=scan, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert results == {i: [f'10.0.1.{i}'] for i in range(16)}
+    assert runner.stats()['calls'] == 16
+
+
+def test_input_and_record_callback(nmap_dir):
+    records = []
+    run = NmapRunner().run(['-sn', '-iL', '-'], input='10.0.2.1\n10.0.2.2\n',
+                           on_record=lambda kind, record: records.append(record['ip']))
+    assert records == ['10.0.2.1', '10.0.2.2']
+    # コールバックに渡したホストはリストに溜めない
+    assert run['hosts'] == []
+
+
+def test_timings_are_recorded(nmap_dir):
+    runner = NmapRunner()
+    run = runner.run(['-sT', '10.0.3.1'])
+    assert set(run['timings']) == {'spawn', 'run', 'parse'}
+    assert all(value >= 0 for value in run['timings'].values())
+
+    stats = runner.stats()
+    assert stats['version'] == '7.94SVN' and stats['path'] == str(nmap_dir / 'nmap')
+    assert stats['recent'][0]['arguments'] == '-sT 10.0.3.1'
+    assert stats['recent'][0]['via'] == 'process'
+
+
+def test_missing_binary(tmp_path):
+    runner = NmapRunner(str(tmp_path / 'missing-nmap'))
+    assert not runner.available
+    assert 'missing-nmap' in runner.error
+    with pytest.raises(Exception, match='missing-nmap'):
+        runner.run(['-sn', '10.0.0.1'])
+
+
+def test_cancelled_token_does_not_spawn(nmap_dir):
+    runner = NmapRunner()
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(ScanCancelled):
+        runner.run(['-sT', '10.0.4.1'], token)
+    assert nmap_calls(nmap_dir) == ['-V']
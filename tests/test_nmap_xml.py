@@ -0,0 +1,122 @@
+"""
+nmapのXML出力の逐次パーサー（scanner.iter_nmap_xml）と、それを使うnmap実行経路のテスト
+"""
+
+import os
+import sys
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scanner import NetworkScanner, PrivilegedNmapHelper, _collect_nmap_hosts, iter_nmap_xml  # noqa: E402
+
+XML_HEADER = '<?xml version="1.0"?>\n<!DOCTYPE nmaprun>\n<nmaprun scanner="nmap" args="nmap">\n'
+XML_FOOTER = '<runstats><finished time="2"/></runstats>\n</nmaprun>\n'
+
+SAMPLE_XML = XML_HEADER + (
+    '<taskprogress task="SYN Stealth Scan" percent="42.50"/>\n'
+    '<host><status state="up"/><address addr="10.0.0.1" addrtype="ipv4"/>'
+    '<address addr="AA:BB:CC:DD:EE:FF" addrtype="mac" vendor="Acme"/>'
+    '<hostnames><hostname name="router.lan" type="PTR"/></hostnames>'
+    '<ports><extraports state="closed" count="998"/>'
+    '<port protocol="tcp" portid="22"><state state="open"/><service name="ssh" product="OpenSSH" version="9.6"/></port>'
+    '<port protocol="tcp" portid="80"><state state="filtered"/></port></ports>'
+    '<os><osmatch name="Linux 5.X" accuracy="98"/></os></host>\n'
+    '<host><status state="down"/><address addr="10.0.0.2" addrtype="ipv4"/></host>\n'
+) + XML_FOOTER
+
+FAKE_NMAP = """#!/bin/sh
+case "$*" in
+  -V) echo "Nmap version 7.94 ( https://nmap.org )"; exit 0 ;;
+  *-sS*) echo "You requested a scan type which requires root privileges." >&2; echo "QUITTING!" >&2; exit 1 ;;
+esac
+cat <<'X'
+""" + SAMPLE_XML + "X\n"
+
+
+def split_every(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def synthetic_hosts(count):
+    yield XML_HEADER
+    for i in range(count):
+        yield (f'<host><status state="up"/><address addr="10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" addrtype="ipv4"/>'
+               '<ports><port protocol="tcp" portid="443"><state state="open"/><service name="https"/></port></ports>'
+               '</host>\n')
+    yield XML_FOOTER
+
+
+@pytest.fixture
+def fake_nmap(fake_command):
+    fake_command('nmap', FAKE_NMAP)
+
+
+@pytest.mark.parametrize('size', [1, 7, 4096])
+def test_records_do_not_depend_on_chunk_boundaries(size):
+    records = list(iter_nmap_xml(split_every(SAMPLE_XML, size)))
+    assert [kind for kind, _ in records] == ['progress', 'host', 'host']
+    assert records[0][1] == 42.5
+
+    host = records[1][1]
+    assert host['ip'] == '10.0.0.1' and host['state'] == 'up'
+    assert host['hostname'] == 'router.lan'
+    assert host['mac'] == 'AA:BB:CC:DD:EE:FF' and host['vendor'] == 'Acme'
+    assert host['os'] == 'Linux 5.X'
+    assert host['ports'] == [
+        {'port': 22, 'protocol': 'tcp', 'state': 'open', 'service': 'ssh', 'product': 'OpenSSH', 'version': '9.6'},
+        {'port': 80, 'protocol': 'tcp', 'state': 'filtered', 'service': '', 'product': '', 'version': ''}
+    ]
+    assert records[2][1]['state'] == 'down' and records[2][1]['hostname'] == 'Unknown'
+
+
+def test_accepts_bytes():
+    records = list(iter_nmap_xml(split_every(SAMPLE_XML.encode(), 100)))
+    assert records[1][1]['ip'] == '10.0.0.1'
+
+
+def test_truncated_output_keeps_finished_hosts():
+    truncated = SAMPLE_XML[:SAMPLE_XML.index('<host><status state="down"/>') + 10]
+    hosts, error = _collect_nmap_hosts(split_every(truncated, 50))
+    assert [host['ip'] for host in hosts] == ['10.0.0.1']
+    assert isinstance(error, ET.ParseError)
+
+
+def test_memory_stays_constant_with_many_hosts():
+    tracemalloc.start()
+    try:
+        count = sum(1 for kind, _ in iter_nmap_xml(synthetic_hosts(20000)) if kind == 'host')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert count == 20000
+    # 出力全体（約3MB）のツリーを保持すると数十MBになる
+    assert peak < 2 * 1024 * 1024
+
+
+def test_run_nmap_scan_streams_hosts(fake_nmap):
+    hosts = NetworkScanner()._run_nmap_scan('10.0.0.0/30', '-sT -p 22,80')
+    assert [host['ip'] for host in hosts] == ['10.0.0.1', '10.0.0.2']
+
+
+def test_port_scan_falls_back_when_root_required(fake_nmap):
+    result = NetworkScanner().port_scan('10.0.0.1', '-sS -p 22,80', verbose=False)
+    assert 'error' not in result
+    assert [port['port'] for port in result['ports']] == [22, 80]
+    assert result['os'] == 'Linux 5.X'
+
+
+def test_helper_scan_is_parsed_while_streaming(fake_nmap):
+    scanner = NetworkScanner()
+    scanner.sudo_password = 'password'
+    scanner.nmap_helper = PrivilegedNmapHelper('password', sudo_command=())
+    scanner.nmap_helper.start()
+    try:
+        result = scanner.port_scan('10.0.0.1', '-sT -O -p 22,80', verbose=False)
+    finally:
+        scanner.nmap_helper.stop()
+    assert [port['port'] for port in result['ports']] == [22, 80]
+    assert result['os'] == 'Linux 5.X'
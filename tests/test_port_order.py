@@ -0,0 +1,64 @@
+"""
+スキャン履歴によるポートの並び順（scanner.select_priority_ports / plan_port_units、
+storage.ResultStore のポート履歴）のテスト
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scanner import (  # noqa: E402
+    DEFAULT_PRIORITY_PORTS, count_unit_ports, format_port_spec, order_ports, plan_port_units, select_priority_ports
+)
+from storage import ResultStore  # noqa: E402
+
+
+def test_priority_ports_without_history_are_defaults():
+    assert select_priority_ports([], []) == DEFAULT_PRIORITY_PORTS
+
+
+def test_priority_ports_prefer_host_then_history():
+    ports = select_priority_ports([22, 8123], [443, 22, 80], limit=5)
+    assert ports == [22, 8123, 443, 80, 8080]
+
+
+def test_host_ports_are_kept_beyond_limit():
+    assert select_priority_ports([1, 2, 3], [4], limit=2) == [1, 2, 3]
+
+
+def test_order_ports_puts_history_first():
+    ports = order_ports([8080, 22, 99999], 1, 100)
+    assert ports[:1] == [22]
+    assert sorted(ports) == list(range(1, 101))
+
+
+def test_plan_port_units_covers_range_once():
+    units = plan_port_units([8080, 22, 22], unit_size=1024)
+    assert units[0] == [(8080, 8080), (22, 22)]
+    assert sum(count_unit_ports(unit) for unit in units) == 65535
+    assert units[1] == [(1, 21), (23, 1024)]
+    assert format_port_spec(units[1]) == '1-21,23-1024'
+
+
+def test_plan_port_units_without_history_matches_split():
+    assert plan_port_units([], unit_size=4096)[0] == [(1, 4096)]
+
+
+def test_port_history_ranking(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.db'))
+    store.save_port_scan('10.0.0.1', {'ports': [{'port': 22, 'state': 'open'}, {'port': 80, 'state': 'open'}],
+                                      'scan_stage': 'full'})
+    store.save_port_scan('10.0.0.2', {'ports': [{'port': 80, 'state': 'open'}, {'port': 81, 'state': 'closed'}],
+                                      'scan_stage': 'priority'})
+    store.save_port_scan('10.0.0.2', {'ports': [{'port': 443, 'state': 'open'}], 'scan_stage': 'full'})
+    # 実行中の結果（ポートが空）は履歴を消さない
+    store.save_port_scan('10.0.0.1', {'ports': [], 'scan_stage': 'full_scanning'})
+
+    assert store.get_port_history('10.0.0.1') == [22, 80]
+    assert store.rank_open_ports() == [80, 22, 443]
+    assert store.rank_open_ports(limit=1) == [80]
+
+    store.upsert_host('10.0.0.2', {'hostname': '', 'state': 'up', 'vendor': '', 'subnet': ''})
+    store.delete_host('10.0.0.2')
+    assert store.rank_open_ports() == [22, 80]
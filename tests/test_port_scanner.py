@@ -0,0 +1,119 @@
+"""
+asyncio TCPコネクト方式のポートスキャン（scanner.AsyncPortScanner）のテスト
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scanner import (  # noqa: E402
+    AsyncPortScanner, ServiceDetectionQueue, _ConnectCongestionControl, split_port_range
+)
+
+
+def test_finds_loopback_listeners():
+    listeners = []
+    for _ in range(3):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        listeners.append(listener)
+    try:
+        expected = sorted(listener.getsockname()[1] for listener in listeners)
+        closed = max(expected) + 1 if max(expected) < 65535 else min(expected) - 1
+        found = []
+        result = AsyncPortScanner().scan('127.0.0.1', ports=expected + [closed], port_callback=found.append)
+    finally:
+        for listener in listeners:
+            listener.close()
+
+    assert [port['port'] for port in result['ports']] == expected
+    assert sorted(port['port'] for port in found) == expected
+    assert all(port['state'] == 'open' and port['protocol'] == 'tcp' for port in result['ports'])
+
+
+def test_progress_reaches_total():
+    progress = []
+    AsyncPortScanner().scan('127.0.0.1', ports=range(1, 501),
+                            progress_callback=lambda scanned, total, found: progress.append((scanned, total)))
+    assert progress[-1] == (500, 500)
+
+
+def test_congestion_control_grows_without_loss():
+    control = _ConnectCongestionControl(1.0, 0.25, concurrency=32, min_concurrency=16, max_concurrency=1024)
+    for _ in range(32):
+        control.record('closed', 0.001)
+    assert control.concurrency > 32
+
+
+def test_congestion_control_backs_off_on_resource_errors():
+    control = _ConnectCongestionControl(1.0, 0.25, concurrency=64, min_concurrency=16, max_concurrency=1024)
+    control.record('resource')
+    for _ in range(63):
+        control.record('closed', 0.001)
+    assert control.concurrency == 32
+
+
+def test_congestion_control_keeps_concurrency_for_filtered_host():
+    # 全く応答しないホストではタイムアウトが増えても同時接続数は減らさない
+    control = _ConnectCongestionControl(1.0, 0.25, concurrency=64, min_concurrency=16, max_concurrency=1024)
+    for _ in range(64):
+        control.record('timeout')
+    assert control.concurrency == 64
+    assert control.timeout == 1.0
+
+
+def test_timeout_follows_rtt():
+    control = _ConnectCongestionControl(1.0, 0.05, concurrency=64, min_concurrency=16, max_concurrency=1024)
+    for _ in range(10):
+        control.record('closed', 0.02)
+    assert 0.05 <= control.timeout < 0.2
+
+
+def test_split_port_range_covers_every_port_once():
+    units = split_port_range(1, 65535, 1024)
+    assert units[0] == (1, 1024)
+    assert units[-1] == (64513, 65535)
+    assert sum(end - start + 1 for start, end in units) == 65535
+    assert all(units[i][1] + 1 == units[i + 1][0] for i in range(len(units) - 1))
+
+
+def test_service_queue_batches_by_count():
+    batches = []
+    service_queue = ServiceDetectionQueue(batches.append, batch_size=3, batch_window=5.0, workers=1)
+    for port in range(1, 7):
+        service_queue.put(port)
+    service_queue.close()
+    assert batches == [[1, 2, 3], [4, 5, 6]]
+
+
+def test_service_queue_flushes_after_window():
+    batches = []
+    service_queue = ServiceDetectionQueue(lambda batch: batches.append((time.monotonic(), batch)),
+                                          batch_size=100, batch_window=0.05, workers=1)
+    service_queue.put(22)
+    time.sleep(0.3)
+    # 締め切り前に時間でまとめられている
+    assert [batch for _, batch in batches] == [[22]]
+    service_queue.put(80)
+    service_queue.close()
+    assert [batch for _, batch in batches] == [[22], [80]]
+
+
+def test_service_queue_close_processes_everything():
+    seen = []
+    lock = threading.Lock()
+
+    def detect(batch):
+        with lock:
+            seen.extend(batch)
+
+    service_queue = ServiceDetectionQueue(detect, batch_size=4, batch_window=0.01, workers=3)
+    for port in range(100):
+        service_queue.put(port)
+    service_queue.close()
+    assert sorted(seen) == list(range(100))
@@ -0,0 +1,117 @@
+"""
+サービス情報取得（第2段階）のテスト
+キャッシュ（scanner.ServiceFingerprintCache）・フィンガープリント取得・バナー照合
+"""
+
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scanner import NetworkScanner, ServiceFingerprintCache, fingerprint_services, match_service_banner  # noqa: E402
+
+PORT_INFO = {'port': 22, 'protocol': 'tcp', 'state': 'open', 'service': 'ssh', 'product': 'OpenSSH', 'version': '9.6'}
+
+
+def test_hit_requires_matching_fingerprint():
+    cache = ServiceFingerprintCache()
+    cache.put('10.0.0.1', 22, 'tcp', 'banner:a', PORT_INFO)
+    assert cache.get('10.0.0.1', 22, 'tcp', 'banner:a') == PORT_INFO
+    assert cache.get('10.0.0.1', 22, 'tcp', 'banner:b') is None
+    # 不一致のエントリは削除される
+    assert cache.get('10.0.0.1', 22, 'tcp', 'banner:a') is None
+    assert cache.stats() == {'entries': 0, 'hits': 1, 'misses': 2}
+
+
+def test_entries_expire_after_ttl():
+    cache = ServiceFingerprintCache(ttl=-1)
+    cache.put('10.0.0.1', 22, 'tcp', 'banner:a', PORT_INFO)
+    assert cache.get('10.0.0.1', 22, 'tcp', 'banner:a') is None
+
+
+def test_without_fingerprint_nothing_is_cached():
+    cache = ServiceFingerprintCache()
+    cache.put('10.0.0.1', 22, 'tcp', None, PORT_INFO)
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ServiceFingerprintCache(max_entries=2)
+    cache.put('10.0.0.1', 1, 'tcp', 'x', PORT_INFO)
+    cache.put('10.0.0.1', 2, 'tcp', 'x', PORT_INFO)
+    cache.get('10.0.0.1', 1, 'tcp', 'x')
+    cache.put('10.0.0.1', 3, 'tcp', 'x', PORT_INFO)
+    assert cache.get('10.0.0.1', 2, 'tcp', 'x') is None
+    assert cache.get('10.0.0.1', 1, 'tcp', 'x') is not None
+
+
+def test_invalidate_host():
+    cache = ServiceFingerprintCache()
+    cache.put('10.0.0.1', 22, 'tcp', 'x', PORT_INFO)
+    cache.put('10.0.0.2', 22, 'tcp', 'x', PORT_INFO)
+    cache.invalidate('10.0.0.1')
+    assert cache.stats()['entries'] == 1
+
+
+def _serve_banner(banner):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            conn.sendall(banner)
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener
+
+
+def test_banner_fingerprint_ignores_time():
+    first = _serve_banner(b'220 mail ESMTP ready 10:15:02\r\n')
+    second = _serve_banner(b'220 mail ESMTP ready 10:16:45\r\n')
+    other = _serve_banner(b'SSH-2.0-OpenSSH_9.6\r\n')
+    try:
+        ports = [listener.getsockname()[1] for listener in (first, second, other)]
+        digests = fingerprint_services('127.0.0.1', ports)
+    finally:
+        for listener in (first, second, other):
+            listener.close()
+
+    assert digests[ports[0]].startswith('banner:')
+    assert digests[ports[0]] == digests[ports[1]]
+    assert digests[ports[0]] != digests[ports[2]]
+
+
+def test_match_service_banner():
+    assert match_service_banner(b'SSH-2.0-OpenSSH_9.6p1 Ubuntu-3ubuntu13\r\n') == \
+        {'service': 'ssh', 'product': 'OpenSSH', 'version': '9.6p1'}
+    assert match_service_banner(b'HTTP/1.1 200 OK\r\nDate: x\r\nServer: nginx/1.24.0\r\n\r\n') == \
+        {'service': 'http', 'product': 'nginx', 'version': '1.24.0'}
+    assert match_service_banner(b'J\x00\x00\x00\x0a5.5.5-10.11.6-MariaDB-0+deb12u1\x00') == \
+        {'service': 'mysql', 'product': 'MariaDB', 'version': '10.11.6'}
+    assert match_service_banner(b'+PONG\r\n')['service'] == 'redis'
+    assert match_service_banner(b'220 Welcome\r\n') is None
+    assert match_service_banner(b'') is None
+
+
+def test_detect_services_matches_banner_without_nmap():
+    listener = _serve_banner(b'SSH-2.0-OpenSSH_9.6\r\n')
+    scanner = NetworkScanner()
+    # nmap を呼ばずに済むことを確認する
+    scanner.port_scan = None
+    try:
+        port = listener.getsockname()[1]
+        result = scanner.detect_services('127.0.0.1', [port])
+    finally:
+        listener.close()
+
+    assert result['matched'] == 1
+    assert result['ports'] == [{'port': port, 'protocol': 'tcp', 'state': 'open',
+                                'service': 'ssh', 'product': 'OpenSSH', 'version': '9.6'}]
@@ -0,0 +1,286 @@
+"""
+スキャン対象の区間演算（scanner._merge_intervals / _subtract_intervals / CompiledTargets）と
+チャンク分割（_plan_chunk_size / _split_intervals_into_chunks / _count_interval_chunks）のテスト
+"""
+
+import ipaddress
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scanner  # noqa: E402
+from scanner import (CompiledTargets, NetworkScanner, _count_interval_chunks, _merge_intervals,  # noqa: E402
+                     _plan_chunk_size, _split_intervals_into_chunks, _split_target_spec, _subtract_intervals)
+
+
+def ip(value):
+    return int(ipaddress.IPv4Address(value))
+
+
+def chunk_values(chunk):
+    """nmapのターゲット指定（アドレス・CIDR列・オクテット範囲）に含まれるアドレスを整数で返す"""
+    values = []
+    for part in chunk.split():
+        if '/' in part:
+            network = ipaddress.IPv4Network(part)
+            values.extend(range(int(network.network_address), int(network.broadcast_address) + 1))
+        elif '-' in part:
+            base, last = part.rsplit('.', 1)
+            low, high = (int(octet) for octet in last.split('-'))
+            values.extend(ip(f"{base}.{octet}") for octet in range(low, high + 1))
+        else:
+            values.append(ip(part))
+    return values
+
+
+# ===== _merge_intervals =====
+
+def test_merge_overlapping_intervals():
+    assert _merge_intervals([(10, 20), (15, 30)]) == [(10, 30)]
+
+
+def test_merge_adjacent_intervals():
+    assert _merge_intervals([(10, 20), (21, 30)]) == [(10, 30)]
+
+
+def test_merge_keeps_gap_and_sorts():
+    assert _merge_intervals([(30, 40), (10, 20)]) == [(10, 20), (30, 40)]
+
+
+def test_merge_contained_interval():
+    assert _merge_intervals([(10, 40), (15, 20)]) == [(10, 40)]
+
+
+# ===== _subtract_intervals =====
+
+def test_subtract_covering_removal():
+    assert _subtract_intervals([(10, 20)], [(5, 25)]) == []
+
+
+def test_subtract_splits_interval():
+    assert _subtract_intervals([(10, 20)], [(13, 15)]) == [(10, 12), (16, 20)]
+
+
+def test_subtract_edges():
+    assert _subtract_intervals([(10, 20)], [(10, 10), (20, 20)]) == [(11, 19)]
+
+
+def test_subtract_removal_spanning_intervals():
+    assert _subtract_intervals([(10, 20), (30, 40)], [(15, 35)]) == [(10, 14), (36, 40)]
+
+
+def test_subtract_disjoint_removal():
+    assert _subtract_intervals([(10, 20)], [(0, 5), (25, 30)]) == [(10, 20)]
+
+
+# ===== CompiledTargets =====
+
+def test_cidr_drops_network_and_broadcast():
+    compiled = CompiledTargets(["192.168.0.0/24"])
+    hosts = [host for host, _ in compiled.iter_hosts()]
+    assert hosts[0] == "192.168.0.1"
+    assert hosts[-1] == "192.168.0.254"
+    assert compiled.num_addresses == 254
+
+
+def test_small_prefixes_keep_all_addresses():
+    assert CompiledTargets(["10.0.0.0/31"]).num_addresses == 2
+    assert CompiledTargets(["10.0.0.5/32"]).num_addresses == 1
+
+
+def test_overlapping_targets_scanned_once():
+    compiled = CompiledTargets(["10.0.0.0/24", "10.0.0.100-10.0.1.10"])
+    hosts = [host for host, _ in compiled.iter_hosts()]
+    assert len(hosts) == len(set(hosts))
+    assert compiled.label_for("10.0.0.100") == "10.0.0.0/24"
+    assert compiled.label_for("10.0.1.5") == "10.0.0.100-10.0.1.10"
+
+
+def test_exclusion_splits_target():
+    compiled = CompiledTargets(["10.0.0.0/24"], "10.0.0.10-20")
+    assert compiled.groups == [("10.0.0.0/24", [(ip("10.0.0.1"), ip("10.0.0.9")),
+                                                (ip("10.0.0.21"), ip("10.0.0.254"))])]
+    assert compiled.label_for("10.0.0.15") is None
+
+
+def test_exclusion_covering_target():
+    compiled = CompiledTargets(["10.0.1.0/24", "10.0.2.1"], "10.0.1.0/24")
+    assert [label for label, _ in compiled.groups] == ["10.0.2.1"]
+    assert compiled.num_addresses == 1
+
+
+def test_excluded_subnet_inside_wider_target_removes_whole_subnet():
+    # 除外側のCIDRはネットワーク・ブロードキャストアドレスも含めて除外する
+    compiled = CompiledTargets(["10.0.0.0/16"], "10.0.1.0/24")
+    assert compiled.label_for("10.0.1.0") is None
+    assert compiled.label_for("10.0.1.255") is None
+    assert compiled.label_for("10.0.2.0") == "10.0.0.0/16"
+
+
+@pytest.mark.parametrize("targets, exclude", [
+    (["192.168.0.0/24"], None),
+    (["10.0.0.0/16", "10.0.5.0/24"], "10.0.0.10,10.0.1.0/24"),
+    (["10.0.0.0/22", "10.0.3.100-10.0.4.20", "router.local"], "10.0.1.128/25"),
+    (["172.16.0.0/20"], ["172.16.3.0/24", "172.16.8.1-172.16.9.255"]),
+])
+@pytest.mark.parametrize("max_threads", [1, 4, 50])
+def test_count_chunks_matches_iter_chunks(targets, exclude, max_threads):
+    compiled = CompiledTargets(targets, exclude)
+    assert compiled.count_chunks(max_threads) == len(list(compiled.iter_chunks(max_threads)))
+
+
+# ===== チャンク分割 =====
+
+@pytest.mark.parametrize("total_addresses, workers, expected", [
+    (0, 0, 32),           # 空でも下限サイズ
+    (1, 1, 32),           # /32
+    (254, 10, 32),        # /24 は下限で頭打ち
+    (2000, 10, 64),       # 2000 / 40チャンク = 50 → 64
+    (4096, 4, 256),       # 4096 / 16チャンク = 256
+    (65534, 10, 256),     # /16 は上限で頭打ち
+    (65534, 64, 256),
+    (65534, 1000, 32),    # スレッドが多いほど小さく（下限まで）
+])
+def test_plan_chunk_size(total_addresses, workers, expected):
+    size = _plan_chunk_size(total_addresses, workers)
+    assert size == expected
+    assert size & (size - 1) == 0
+
+
+@pytest.mark.parametrize("intervals, chunk_size, expected", [
+    ([(ip("10.0.0.5"), ip("10.0.0.5"))], 32, ["10.0.0.5"]),
+    ([(ip("10.0.0.0"), ip("10.0.0.63"))], 32, ["10.0.0.0/27", "10.0.0.32/27"]),
+    ([(ip("10.0.0.1"), ip("10.0.0.254"))], 256, ["10.0.0.1-254"]),
+    ([(ip("10.0.0.1"), ip("10.0.0.70"))], 32, ["10.0.0.1-31", "10.0.0.32/27", "10.0.0.64-70"]),
+    # 除外で分かれた区間は、同じチャンク境界内でも別のチャンクになる
+    ([(ip("10.0.0.1"), ip("10.0.0.9")), (ip("10.0.0.21"), ip("10.0.0.40"))], 32,
+     ["10.0.0.1-9", "10.0.0.21-31", "10.0.0.32-40"]),
+    # /24 を跨ぐチャンクはCIDR列になる
+    ([(ip("10.0.0.200"), ip("10.0.1.10"))], 512, ["10.0.0.200/29 10.0.0.208/28 10.0.0.224/27 10.0.1.0/29 10.0.1.8/31 10.0.1.10/32"]),
+])
+def test_split_intervals_into_chunks(intervals, chunk_size, expected):
+    chunks = list(_split_intervals_into_chunks(intervals, chunk_size))
+    assert chunks == expected
+    assert _count_interval_chunks(intervals, chunk_size) == len(expected)
+
+
+@pytest.mark.parametrize("targets, exclude, max_threads, expected_chunks", [
+    (["10.0.0.5/32"], None, 10, 1),
+    (["192.168.0.0/24"], None, 10, 8),                      # 254アドレス / 32
+    (["10.0.0.0/16"], None, 10, 256),                       # 65534アドレス / 256
+    (["10.0.0.0/16"], None, 1000, 2048),                    # 65534アドレス / 32
+    (["10.0.0.0/24"], "10.0.0.16-10.0.0.47", 10, 8),        # 除外がチャンク境界を跨ぐ
+    (["10.0.0.0/16"], "10.0.1.0/24", 10, 255),               # チャンク全体が除外される
+    (["10.0.0.0/22", "10.0.1.0/24", "gateway.local"], "10.0.2.100", 4, 18),  # 64アドレス単位
+])
+def test_chunks_cover_targets_without_overlap(targets, exclude, max_threads, expected_chunks):
+    compiled = CompiledTargets(targets, exclude)
+    chunks = list(compiled.iter_chunks(max_threads))
+    assert len(chunks) == expected_chunks == compiled.count_chunks(max_threads)
+
+    chunk_size = _plan_chunk_size(compiled.num_addresses, max_threads)
+    covered = []
+    for chunk, label in chunks:
+        if chunk in compiled.unresolved:
+            continue
+        values = chunk_values(chunk)
+        # 1チャンクは連続したアドレスで、チャンク境界を跨がない
+        assert values == list(range(values[0], values[-1] + 1))
+        assert values[0] // chunk_size == values[-1] // chunk_size
+        assert all(compiled.label_for(str(ipaddress.IPv4Address(value))) == label for value in values)
+        covered.extend(values)
+
+    expected = [ip(host) for host, _ in compiled.iter_hosts()]
+    assert len(covered) == len(set(covered))
+    assert sorted(covered) == sorted(expected)
+
+
+def test_iter_chunks_is_lazy():
+    # 10.0.0.0/8 でもチャンクは必要な分だけ生成される
+    chunks = CompiledTargets(["10.0.0.0/8"]).iter_chunks(10)
+    assert next(chunks) == ("10.0.0.1-255", "10.0.0.0/8")
+    assert next(chunks) == ("10.0.1.0/24", "10.0.0.0/8")
+
+
+def test_chunked_sweep_bounds_in_flight_chunks(monkeypatch):
+    monkeypatch.setattr(scanner, '_plan_chunk_size', lambda total, workers: 32)
+    net_scanner = NetworkScanner()
+    net_scanner.nmap_available = True
+    max_threads = 3
+    lock = threading.Lock()
+    state = {'active': 0, 'peak': 0, 'scanned': []}
+    consumed = []
+    real_iter_chunks = CompiledTargets.iter_chunks
+
+    def recording_iter_chunks(self, threads):
+        for item in real_iter_chunks(self, threads):
+            consumed.append(item)
+            yield item
+
+    def fake_scan(chunk, subnet, cancel_token=None):
+        with lock:
+            # 投入済みで未完了のチャンク数は max_threads * 2 を超えない
+            assert len(consumed) - len(state['scanned']) <= max_threads * 2
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.01)
+        with lock:
+            state['active'] -= 1
+            state['scanned'].append(chunk)
+        first = chunk.split()[0].split('/')[0].split('-')[0]
+        return {first: {'hostname': 'Unknown', 'state': 'up', 'vendor': '', 'subnet': subnet}}
+
+    monkeypatch.setattr(CompiledTargets, 'iter_chunks', recording_iter_chunks)
+    monkeypatch.setattr(net_scanner, '_scan_single_chunk', fake_scan)
+    results = net_scanner.ping_scan_many(["10.0.0.0/22"], max_threads=max_threads, use_neighbors=False)
+
+    assert len(state['scanned']) == len(consumed) == 32
+    assert len(results) == 32
+    assert state['peak'] <= max_threads
+
+
+def test_stream_sweep_passes_all_targets_to_one_nmap(monkeypatch):
+    net_scanner = NetworkScanner()
+    net_scanner.nmap_available = True
+    calls = []
+
+    def fake_run(arguments, cancel_token=None, input=None, on_record=None, helper=None):
+        calls.append(input)
+        on_record('progress', 50.0)
+        on_record('host', {'ip': '10.0.1.7', 'state': 'up', 'hostname': 'Unknown', 'mac': '', 'vendor': '',
+                           'ports': [], 'os': ''})
+        return {'hosts': [], 'returncode': 0, 'stderr': '', 'parse_error': None, 'timings': {}}
+
+    progress = []
+    monkeypatch.setattr(net_scanner.nmap_runner, 'run', fake_run)
+    results = net_scanner.ping_scan_many(["10.0.0.0/16", "192.168.1.5/32"], engine='nmap-stream',
+                                         exclude="10.0.128.0/17", use_neighbors=False,
+                                         progress_callback=lambda *args: progress.append(args))
+
+    # 全対象を1回のnmap実行で、除外を適用したうえで重複なく渡す
+    assert len(calls) == 1
+    passed = [value for line in calls[0].split() for value in chunk_values(line)]
+    assert passed == list(range(ip("10.0.0.1"), ip("10.0.127.255") + 1)) + [ip("192.168.1.5")]
+    assert results['10.0.1.7']['subnet'] == "10.0.0.0/16"
+    assert progress[0] == (500, 1000, 0)
+    assert progress[-1] == (1000, 1000, 1)
+
+
+# ===== 入力の型チェック =====
+
+@pytest.mark.parametrize("spec", [5, ["10.0.0.1", 5], {"10.0.0.1": True}, [None]])
+def test_non_string_spec_is_rejected(spec):
+    with pytest.raises(ValueError):
+        _split_target_spec(spec)
+    with pytest.raises(ValueError):
+        CompiledTargets([], spec)
+
+
+def test_split_target_spec():
+    assert _split_target_spec("10.0.0.1, 10.0.0.2\n10.0.0.3,,") == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert _split_target_spec(None) == []